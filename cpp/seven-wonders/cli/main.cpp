@@ -12,6 +12,8 @@
 #include <iostream>
 #include <vector>
 
+#include <sys/stat.h>
+
 #include "sw/edifice.hpp"
 #include "sw/engine.hpp"
 #include "sw/heuristic.hpp"
@@ -137,6 +139,61 @@ static int cmdBench(int games) {
   return 0;
 }
 
+// Net inference throughput: leaf evals/sec over positions from random games,
+// then PUCT search iterations/sec from a few of them (what a fixed iteration or
+// time budget buys). Compare a float32 blueprint with its SWN2 int8 export.
+static int cmdNetBench(const Net& net, int evals, int iters) {
+  using clock = std::chrono::steady_clock;
+  Rng rng(0x5eed01u);
+  std::vector<float> feats;
+  std::vector<GameState> roots;
+  for (uint32_t g = 0; feats.size() < size_t(1024) * FEAT_DIM; g++) {
+    GameState st = createInitialState(g * 2654435761u + 1u, SideMode::Random, g & 1);
+    while (!isGameOver(st)) {
+      if (st.phase == Phase::Selecting) {
+        size_t at = feats.size();
+        feats.resize(at + FEAT_DIM);
+        encodeFeatures(st, int(rng.below(N)), &feats[at]);
+        if (roots.size() < 16 && st.turn % 4 == 1) roots.push_back(st);
+        for (int i = 0; i < N; i++)
+          if (!st.hasSelection[i]) applySelection(st, i, randomLegal(st, i, rng));
+        if (st.phase == Phase::Revealing) applyReveal(st);
+      } else if (st.phase == Phase::Revealing) {
+        applyReveal(st);
+      } else {
+        int ap = activePlayer(st);
+        applyPendingAction(st, ap, randomLegal(st, ap, rng));
+      }
+    }
+  }
+  int npos = int(feats.size() / FEAT_DIM);
+  float pol[POLICY_DIM], val[VALUE_DIM];
+  volatile float sink = 0;
+  auto t0 = clock::now();
+  for (int i = 0; i < evals; i++) {
+    net.eval(&feats[size_t(i % npos) * FEAT_DIM], pol, val);
+    sink = val[0];
+  }
+  double sec = std::chrono::duration<double>(clock::now() - t0).count();
+  std::string arch;
+  for (const Layer& l : net.hidden) arch += (arch.empty() ? "" : "x") + std::to_string(l.rows);
+  std::printf("netbench: %s %s weights, %d evals over %d positions in %.3f s\n",
+              net.quantized ? "int8" : "float32", arch.c_str(), evals, npos, sec);
+  std::printf("  %.0f leaf evals/sec  (%.2f us each)\n", evals / sec, 1e6 * sec / evals);
+  MctsConfig cfg;
+  cfg.iterations = iters;
+  t0 = clock::now();
+  for (size_t r = 0; r < roots.size(); r++) {
+    cfg.seed = 0x77u + uint32_t(r);
+    mctsSearch(roots[r], cfg, &net);
+  }
+  sec = std::chrono::duration<double>(clock::now() - t0).count();
+  std::printf("  %.0f PUCT iterations/sec  (%zu searches x %d iters)\n",
+              roots.size() * iters / sec, roots.size(), iters);
+  (void)sink;
+  return 0;
+}
+
 // Per-seat rank reward in [0,1] (matches the search's reward signal).
 static void rankRewards(const GameState& st, double out[N]) {
   GameResult r = scoreFinal(st);
@@ -279,8 +336,217 @@ static int cmdEvalPop(int games, int iters, const Net* net, int dets, int seat0S
   return 0;
 }
 
+// An agent for `sw7 match`: "random", "heN" (heuristic archetype N), "-"
+// (search without a net) or a weights file (PUCT with that net).
+struct MatchAgent {
+  enum Kind { Random, Heuristic, Search } kind = Search;
+  int style = 0;
+  Net net;
+  const Net* netP = nullptr;
+};
+
+static bool parseAgent(const char* spec, MatchAgent& a) {
+  if (std::strcmp(spec, "random") == 0) {
+    a.kind = MatchAgent::Random;
+  } else if (std::strncmp(spec, "he", 2) == 0) {
+    a.kind = MatchAgent::Heuristic;
+    a.style = atoi(spec + 2) % NUM_STYLES;
+  } else if (std::strcmp(spec, "-") != 0) {
+    if (!a.net.load(spec)) return false;
+    a.netP = &a.net;
+  }
+  return true;
+}
+
+// Head-to-head between agents A and B. They share the 5 seats, A taking 2 seats
+// in even games and 3 in odd ones, the pattern rotating with the game. Game g
+// is dealt from seed `seed + g`, and every random choice in it derives from
+// that seed alone, so a game's result depends only on (A, B, iters, its seed)
+// and callers can cache games one by one. One line per game:
+//   game <seed> <seat pattern, e.g. ABBAB> <total seat0> .. <total seat4>
+static int cmdMatch(const char* specA, const char* specB, int games, int iters, uint32_t seed) {
+  MatchAgent agents[2];
+  const char* specs[2] = {specA, specB};
+  for (int k = 0; k < 2; k++)
+    if (!parseAgent(specs[k], agents[k])) {
+      std::fprintf(stderr, "failed to load weights: %s\n", specs[k]);
+      return 1;
+    }
+  MctsConfig cfg;
+  cfg.iterations = iters;
+  for (int g = 0; g < games; g++) {
+    uint32_t gs = seed + uint32_t(g);
+    int who[N];
+    int nA = 2 + int(gs & 1u);
+    for (int i = 0; i < N; i++) who[i] = (i + int(gs % N)) % N < nA ? 0 : 1;
+    Rng rng(gs * 2654435761u + 0x5EEDu);
+    auto choose = [&](const GameState& st, int seat) {
+      const MatchAgent& a = agents[who[seat]];
+      if (a.kind == MatchAgent::Random) {
+        MoveBuffer b;
+        legalActions(st, seat, b);
+        return b.moves[rng.below(b.count)];
+      }
+      if (a.kind == MatchAgent::Heuristic) return heuristicMove(st, seat, Style(a.style), rng);
+      cfg.seed = 0x1234u + gs * 131u + st.turn * 17u + st.age + uint32_t(seat) * 7919u;
+      return mctsChooseMove(st, seat, cfg, a.netP);
+    };
+    GameState st = createInitialState(gs * 2654435761u + 1u, SideMode::Random, false);
+    while (!isGameOver(st)) {
+      if (st.phase == Phase::Selecting) {
+        for (int i = 0; i < N; i++)
+          if (!st.hasSelection[i]) applySelection(st, i, choose(st, i));
+        if (st.phase == Phase::Revealing) applyReveal(st);
+      } else if (st.phase == Phase::Revealing) {
+        applyReveal(st);
+      } else {
+        int ap = activePlayer(st);
+        applyPendingAction(st, ap, choose(st, ap));
+      }
+    }
+    GameResult r = scoreFinal(st);
+    std::printf("game %u ", gs);
+    for (int i = 0; i < N; i++) std::printf("%c", who[i] == 0 ? 'A' : 'B');
+    for (int i = 0; i < N; i++) std::printf(" %d", r.totals[i]);
+    std::printf("\n");
+    std::fflush(stdout);
+  }
+  return 0;
+}
+
+// Distinct policy buckets of a seat's legal moves (the set PUCT normalizes its
+// priors over), appended to `out`.
+static void legalBuckets(const GameState& st, int seat, const std::vector<Move>& mv,
+                        std::vector<uint16_t>& out) {
+  bool seen[POLICY_DIM] = {};
+  for (const Move& m : mv) {
+    int b = policyIndex(st, seat, m);
+    if (!seen[b]) {
+      seen[b] = true;
+      out.push_back(uint16_t(b));
+    }
+  }
+}
+
+// Sample file ("SWSP"): header {magic, n, FEAT_DIM, POLICY_DIM, VALUE_DIM}, then
+// F, P, V as float32 blocks. A legal-move trailer follows ("SWLM", int64 nnz,
+// uint16 bucket count per sample, uint16 buckets); readers that stop after V
+// simply ignore it.
+static int writeSamples(const char* out, int nSamples, const std::vector<float>& F,
+                        const std::vector<float>& P, const std::vector<float>& V,
+                        const std::vector<uint16_t>& legalCount,
+                        const std::vector<uint16_t>& legal) {
+  std::FILE* f = std::fopen(out, "wb");
+  if (!f) {
+    std::fprintf(stderr, "cannot open %s\n", out);
+    return 1;
+  }
+  uint32_t magic = 0x53575350u;  // "SWSP"
+  int32_t hdr[4] = {nSamples, FEAT_DIM, POLICY_DIM, VALUE_DIM};
+  std::fwrite(&magic, 4, 1, f);
+  std::fwrite(hdr, 4, 4, f);
+  std::fwrite(F.data(), 4, F.size(), f);
+  std::fwrite(P.data(), 4, P.size(), f);
+  std::fwrite(V.data(), 4, V.size(), f);
+  uint32_t lmagic = 0x53574c4du;  // "SWLM"
+  int64_t nnz = int64_t(legal.size());
+  std::fwrite(&lmagic, 4, 1, f);
+  std::fwrite(&nnz, 8, 1, f);
+  std::fwrite(legalCount.data(), 2, legalCount.size(), f);
+  std::fwrite(legal.data(), 2, legal.size(), f);
+  bool ok = !std::ferror(f);
+  ok = std::fclose(f) == 0 && ok;
+  if (!ok) {
+    std::fprintf(stderr, "write failed: %s\n", out);
+    return 1;
+  }
+  std::printf("wrote %d samples -> %s\n", nSamples, out);
+  return 0;
+}
+
+// Where self-play samples go. A regular path gets one sample file when the run
+// ends (writeSamples). A named pipe gets a stream ("SWST") instead, so a trainer
+// can start on the first games while later ones are still being played: header
+// {magic, FEAT_DIM, POLICY_DIM, VALUE_DIM, record bytes}, then for each finished
+// game an int32 record count and that many fixed-size records (float32 F, P, V,
+// then the legal buckets as a POLICY_DIM-bit mask padded to 4 bytes). A count of
+// 0 ends the stream; train/replay.py's StreamShard reads it.
+struct SampleSink {
+  static constexpr int MASK_BYTES = (POLICY_DIM + 31) / 32 * 4;
+  static constexpr int RECORD_BYTES = 4 * (FEAT_DIM + POLICY_DIM + VALUE_DIM) + MASK_BYTES;
+
+  const char* out;
+  std::FILE* pipe = nullptr;
+  std::vector<float> F, P, V;   // file mode: struct-of-arrays for the sample file
+  std::vector<uint16_t> Lc, L;  // legal buckets: count per sample, then buckets
+  std::vector<char> game;       // stream mode: the current game's records
+  int nSamples = 0;
+
+  explicit SampleSink(const char* path) : out(path) {}
+
+  bool open() {
+    struct stat sb;
+    if (stat(out, &sb) != 0 || !S_ISFIFO(sb.st_mode)) return true;
+    pipe = std::fopen(out, "wb");  // blocks until the reader opens its end
+    if (!pipe) {
+      std::fprintf(stderr, "cannot open %s\n", out);
+      return false;
+    }
+    uint32_t magic = 0x53575354u;  // "SWST"
+    int32_t hdr[4] = {FEAT_DIM, POLICY_DIM, VALUE_DIM, RECORD_BYTES};
+    std::fwrite(&magic, 4, 1, pipe);
+    std::fwrite(hdr, 4, 4, pipe);
+    return std::fflush(pipe) == 0;
+  }
+
+  void add(const float* f, const float* p, const float* v, const std::vector<uint16_t>& legal) {
+    nSamples++;
+    if (!pipe) {
+      F.insert(F.end(), f, f + FEAT_DIM);
+      P.insert(P.end(), p, p + POLICY_DIM);
+      V.insert(V.end(), v, v + VALUE_DIM);
+      Lc.push_back(uint16_t(legal.size()));
+      L.insert(L.end(), legal.begin(), legal.end());
+      return;
+    }
+    size_t at = game.size();
+    game.resize(at + RECORD_BYTES, 0);
+    char* r = game.data() + at;
+    std::memcpy(r, f, 4 * FEAT_DIM);
+    std::memcpy(r + 4 * FEAT_DIM, p, 4 * POLICY_DIM);
+    std::memcpy(r + 4 * (FEAT_DIM + POLICY_DIM), v, 4 * VALUE_DIM);
+    unsigned char* mask = reinterpret_cast<unsigned char*>(r + RECORD_BYTES - MASK_BYTES);
+    for (uint16_t b : legal) mask[b >> 3] |= uint8_t(1u << (b & 7));
+  }
+
+  // Stream mode: send the finished game's records. False if the reader is gone.
+  bool endGame() {
+    if (!pipe || game.empty()) return true;
+    int32_t count = int32_t(game.size() / RECORD_BYTES);
+    std::fwrite(&count, 4, 1, pipe);
+    std::fwrite(game.data(), 1, game.size(), pipe);
+    game.clear();
+    return std::fflush(pipe) == 0;
+  }
+
+  int finish() {
+    if (!pipe) return writeSamples(out, nSamples, F, P, V, Lc, L);
+    int32_t end = 0;
+    std::fwrite(&end, 4, 1, pipe);
+    bool ok = !std::ferror(pipe);
+    ok = std::fclose(pipe) == 0 && ok;
+    if (!ok) {
+      std::fprintf(stderr, "write failed: %s\n", out);
+      return 1;
+    }
+    std::printf("streamed %d samples -> %s\n", nSamples, out);
+    return 0;
+  }
+};
+
 // Generate AlphaZero-style self-play samples (features, MCTS policy target,
-// per-seat outcome) to a binary file. Rollout mode if no weights, else PUCT.
+// per-seat outcome, legal buckets) to a binary file. Rollout mode if no
+// weights, else PUCT.
 static int cmdSelfPlay(int games, int iters, const char* out, const char* weights, uint32_t seed) {
   Net net;
   const Net* netP = (weights && net.load(weights)) ? &net : nullptr;
@@ -289,13 +555,13 @@ static int cmdSelfPlay(int games, int iters, const char* out, const char* weight
   MctsConfig cfg;
   cfg.iterations = iters;
   Rng rng(seed);
-  std::vector<float> F, P, V;  // struct-of-arrays for the sample file
-  int nSamples = 0;
+  SampleSink sink(out);
+  if (!sink.open()) return 1;
 
   for (int g = 0; g < games; g++) {
     bool edifice = (g % 2) == 0;
     GameState st = createInitialState(rng.s ^ (uint32_t(g) * 2654435761u + 1u), SideMode::Random, edifice);
-    struct Smp { std::vector<float> f, p; int seat; };
+    struct Smp { std::vector<float> f, p; std::vector<uint16_t> legal; int seat; };
     std::vector<Smp> gs;
 
     while (!isGameOver(st)) {
@@ -318,6 +584,7 @@ static int cmdSelfPlay(int games, int iters, const char* out, const char* weight
           for (size_t i = 0; i < mv.size(); i++) s.p[policyIndex(st, seat, mv[i])] += nv[i];
           if (total > 0)
             for (float& x : s.p) x /= total;
+          legalBuckets(st, seat, mv, s.legal);
           gs.push_back(std::move(s));
           // sample this seat's move ~ visits^(1/T)
           double T = cfg.temperature > 0 ? cfg.temperature : 1e-3;
@@ -353,30 +620,15 @@ static int cmdSelfPlay(int games, int iters, const char* out, const char* weight
     double rew[N];
     rankRewards(st, rew);
     for (auto& s : gs) {
-      for (float x : s.f) F.push_back(x);
-      for (float x : s.p) P.push_back(x);
-      for (int k = 0; k < N; k++) V.push_back(float(rew[(s.seat + k) % N]));
-      nSamples++;
+      float v[VALUE_DIM];
+      for (int k = 0; k < N; k++) v[k] = float(rew[(s.seat + k) % N]);
+      sink.add(s.f.data(), s.p.data(), v, s.legal);
     }
+    if (!sink.endGame()) return 1;
     if ((g + 1) % 10 == 0)
-      std::fprintf(stderr, "  game %d/%d, %d samples\n", g + 1, games, nSamples);
-  }
-
-  std::FILE* f = std::fopen(out, "wb");
-  if (!f) {
-    std::fprintf(stderr, "cannot open %s\n", out);
-    return 1;
+      std::fprintf(stderr, "  game %d/%d, %d samples\n", g + 1, games, sink.nSamples);
   }
-  uint32_t magic = 0x53575350u;  // "SWSP"
-  int32_t hdr[4] = {nSamples, FEAT_DIM, POLICY_DIM, VALUE_DIM};
-  std::fwrite(&magic, 4, 1, f);
-  std::fwrite(hdr, 4, 4, f);
-  std::fwrite(F.data(), 4, F.size(), f);
-  std::fwrite(P.data(), 4, P.size(), f);
-  std::fwrite(V.data(), 4, V.size(), f);
-  std::fclose(f);
-  std::printf("wrote %d samples -> %s\n", nSamples, out);
-  return 0;
+  return sink.finish();
 }
 
 // Population self-play: seat 0 = learner (search, samples collected); seats 1..4
@@ -391,15 +643,15 @@ static int cmdSelfPlayPop(int games, int iters, const char* out, const char* wei
   MctsConfig cfg;
   cfg.iterations = iters;
   Rng rng(seed);
-  std::vector<float> F, P, V;
-  int nSamples = 0;
+  SampleSink sink(out);
+  if (!sink.open()) return 1;
 
   for (int g = 0; g < games; g++) {
     bool edifice = (g % 2) == 0;
     GameState st = createInitialState(rng.s ^ (uint32_t(g) * 2654435761u + 1u), SideMode::Random, edifice);
     Style sty[N];
     for (int j = 1; j < N; j++) sty[j] = Style((g + j) % NUM_STYLES);
-    struct Smp { std::vector<float> f, p; };
+    struct Smp { std::vector<float> f, p; std::vector<uint16_t> legal; };
     std::vector<Smp> gs;
 
     while (!isGameOver(st)) {
@@ -418,6 +670,7 @@ static int cmdSelfPlayPop(int games, int iters, const char* out, const char* wei
         for (size_t i = 0; i < mv.size(); i++) s.p[policyIndex(st, 0, mv[i])] += nv[i];
         if (total > 0)
           for (float& x : s.p) x /= total;
+        legalBuckets(st, 0, mv, s.legal);
         gs.push_back(std::move(s));
         // seat 0 plays a sampled move; opponents play their archetype.
         double T = cfg.temperature, tot = 0;
@@ -454,28 +707,14 @@ static int cmdSelfPlayPop(int games, int iters, const char* out, const char* wei
 
     double rew[N];
     rankRewards(st, rew);
-    for (auto& s : gs) {
-      for (float x : s.f) F.push_back(x);
-      for (float x : s.p) P.push_back(x);
-      for (int k = 0; k < N; k++) V.push_back(float(rew[k % N]));  // seat 0 relative
-      nSamples++;
-    }
+    float v[VALUE_DIM];
+    for (int k = 0; k < N; k++) v[k] = float(rew[k % N]);  // seat 0 relative
+    for (auto& s : gs) sink.add(s.f.data(), s.p.data(), v, s.legal);
+    if (!sink.endGame()) return 1;
     if ((g + 1) % 20 == 0)
-      std::fprintf(stderr, "  game %d/%d, %d samples\n", g + 1, games, nSamples);
+      std::fprintf(stderr, "  game %d/%d, %d samples\n", g + 1, games, sink.nSamples);
   }
-
-  std::FILE* f = std::fopen(out, "wb");
-  if (!f) return 1;
-  uint32_t magic = 0x53575350u;
-  int32_t hdr[4] = {nSamples, FEAT_DIM, POLICY_DIM, VALUE_DIM};
-  std::fwrite(&magic, 4, 1, f);
-  std::fwrite(hdr, 4, 4, f);
-  std::fwrite(F.data(), 4, F.size(), f);
-  std::fwrite(P.data(), 4, P.size(), f);
-  std::fwrite(V.data(), 4, V.size(), f);
-  std::fclose(f);
-  std::printf("wrote %d samples -> %s\n", nSamples, out);
-  return 0;
+  return sink.finish();
 }
 
 // ── Deployment bridge: read a position (integers) from stdin, return the chosen
@@ -614,6 +853,86 @@ static bool readPosition(std::istream& in, GameState& st, int& seat) {
   return !in.fail();
 }
 
+// The inverse of readPosition: the integers cpp-bridge.ts serializePosition
+// sends for `seat`, on one line. Decks are sent only for ages still to come.
+static void writePosition(std::FILE* f, const GameState& st, int seat) {
+  std::fprintf(f, "%d %d %d %d %d", seat, st.age, st.turn, st.phase == Phase::Pending ? 1 : 0,
+               st.edificeCount > 0 ? 1 : 0);
+  auto list = [&](int n, auto at) {
+    std::fprintf(f, " %d", n);
+    for (int i = 0; i < n; i++) std::fprintf(f, " %d", int(at(i)));
+  };
+  for (int p = 0; p < N; p++) {
+    const PlayerState& pl = st.players[p];
+    std::fprintf(f, " %d %d %d %d %d", pl.wonderId, pl.side, pl.stagesBuilt, pl.coins,
+                 pl.freeBuildUsedThisAge ? 1 : 0);
+    list(pl.numTableau, [&](int i) { return pl.tableau[i]; });
+    list(pl.numTokens, [&](int i) { return pl.militaryTokens[i]; });
+    std::fprintf(f, " %d", pl.bonusShields);
+    list(pl.numVictory, [&](int i) { return pl.victoryTokens[i]; });
+    list(pl.numDebt, [&](int i) { return pl.debtTokens[i]; });
+    list(pl.numBonusProd, [&](int i) { return pl.bonusProd[i]; });
+    list(st.handCount[p], [&](int i) { return st.hands[p][i]; });
+  }
+  list(st.discardCount, [&](int i) { return st.discard[i]; });
+  std::fprintf(f, " %d", st.edificeCount);
+  for (int e = 0; e < st.edificeCount; e++) {
+    const EdSlot& s = st.edifices[e];
+    std::fprintf(f, " %d %d %d %d %d", s.age, s.edificeId, s.pawnsTotal, s.pawnsLeft,
+                 int(s.status));
+    list(s.numParticipants, [&](int i) { return s.participants[i]; });
+  }
+  std::fprintf(f, " %d", st.pendingCount);
+  for (int i = 0; i < st.pendingCount; i++)
+    std::fprintf(f, " %d %d", st.pendingQueue[i].kind == PendingKind::Halikarnassos ? 1 : 0,
+                 st.pendingQueue[i].player);
+  list(st.age < 2 ? st.deck2Count : 0, [&](int i) { return st.deck2[i]; });
+  list(st.age < 3 ? st.deck3Count : 0, [&](int i) { return st.deck3[i]; });
+  std::fprintf(f, "\n");
+}
+
+// A corpus of `sw7 move` inputs: every decision of `games` seeded games between
+// heuristic players (a different style per seat), one serialized position per
+// line, selection positions taken before any seat has chosen (as the server
+// sees them). Every other game uses the Edifice expansion if `edifice`.
+static int cmdPositions(int games, const char* out, uint32_t seed, bool edifice) {
+  std::FILE* f = std::fopen(out, "w");
+  if (!f) {
+    std::fprintf(stderr, "cannot open %s\n", out);
+    return 1;
+  }
+  long n = 0;
+  for (int g = 0; g < games; g++) {
+    uint32_t gs = seed + uint32_t(g);
+    Rng rng(gs * 2654435761u + 0x9051u);
+    GameState st = createInitialState(gs * 2654435761u + 1u, SideMode::Random, edifice && g % 2);
+    while (!isGameOver(st)) {
+      if (st.phase == Phase::Selecting) {
+        for (int i = 0; i < N; i++, n++) writePosition(f, st, i);
+        for (int i = 0; i < N; i++)
+          if (!st.hasSelection[i])
+            applySelection(st, i, heuristicMove(st, i, Style((gs + i) % NUM_STYLES), rng));
+        if (st.phase == Phase::Revealing) applyReveal(st);
+      } else if (st.phase == Phase::Revealing) {
+        applyReveal(st);
+      } else {
+        int ap = activePlayer(st);
+        writePosition(f, st, ap);
+        n++;
+        applyPendingAction(st, ap, heuristicMove(st, ap, Style((gs + ap) % NUM_STYLES), rng));
+      }
+    }
+  }
+  bool ok = !std::ferror(f);
+  ok = std::fclose(f) == 0 && ok;
+  if (!ok) {
+    std::fprintf(stderr, "write failed: %s\n", out);
+    return 1;
+  }
+  std::printf("wrote %ld positions from %d games -> %s\n", n, games, out);
+  return 0;
+}
+
 static int cmdMove(const char* weights, int iters, int dets) {
   GameState st;
   int seat = 0;
@@ -656,6 +975,18 @@ int main(int argc, char** argv) {
     }
     return cmdEvalAgent(int(u32(3, 100)), int(u32(4, 400)), &net, "PUCT-net", 1);
   }
+  if (std::strcmp(cmd, "netbench") == 0) {
+    if (argc < 3) {
+      std::printf("usage: sw7 netbench <weights.bin> [evals] [iters]\n");
+      return 1;
+    }
+    Net net;
+    if (!net.load(argv[2])) {
+      std::printf("failed to load weights: %s\n", argv[2]);
+      return 1;
+    }
+    return cmdNetBench(net, int(u32(3, 200000)), int(u32(4, 400)));
+  }
   if (std::strcmp(cmd, "evalii") == 0) {
     if (argc < 3) {
       std::printf("usage: sw7 evalii <weights.bin|-> [games] [iters] [dets]\n");
@@ -668,25 +999,39 @@ int main(int argc, char** argv) {
   }
   if (std::strcmp(cmd, "selfplay") == 0) {
     if (argc < 5) {
-      std::printf("usage: sw7 selfplay <games> <iters> <out.bin> [weights.bin] [seed]\n");
+      std::printf("usage: sw7 selfplay <games> <iters> <out.bin> [weights.bin|-] [seed]\n");
       return 1;
     }
-    const char* weights = argc > 5 ? argv[5] : nullptr;
+    const char* weights = (argc > 5 && std::strcmp(argv[5], "-") != 0) ? argv[5] : nullptr;
     return cmdSelfPlay(int(u32(2, 50)), int(u32(3, 200)), argv[4], weights, u32(6, 1));
   }
   if (std::strcmp(cmd, "selfplay-pop") == 0) {
     if (argc < 5) {
-      std::printf("usage: sw7 selfplay-pop <games> <iters> <out.bin> [weights.bin] [seed]\n");
+      std::printf("usage: sw7 selfplay-pop <games> <iters> <out.bin> [weights.bin|-] [seed]\n");
+      return 1;
+    }
+    const char* weights = (argc > 5 && std::strcmp(argv[5], "-") != 0) ? argv[5] : nullptr;
+    return cmdSelfPlayPop(int(u32(2, 50)), int(u32(3, 200)), argv[4], weights, u32(6, 1));
+  }
+  if (std::strcmp(cmd, "match") == 0) {
+    if (argc < 4) {
+      std::printf("usage: sw7 match <A> <B> [games] [iters] [seed]   (A/B: w.bin|-|heN|random)\n");
       return 1;
     }
-    return cmdSelfPlayPop(int(u32(2, 50)), int(u32(3, 200)), argv[4], argc > 5 ? argv[5] : nullptr,
-                          u32(6, 1));
+    return cmdMatch(argv[2], argv[3], int(u32(4, 10)), int(u32(5, 300)), u32(6, 1));
   }
   if (std::strcmp(cmd, "move") == 0) {
     // sw7 move [weights|-] [iters] [dets]   (position on stdin -> canonical move on stdout)
     const char* w = (argc > 2 && std::strcmp(argv[2], "-") != 0) ? argv[2] : nullptr;
     return cmdMove(w, int(u32(3, 400)), int(u32(4, 6)));
   }
+  if (std::strcmp(cmd, "positions") == 0) {
+    if (argc < 4) {
+      std::printf("usage: sw7 positions <games> <out.txt> [seed] [edifice]\n");
+      return 1;
+    }
+    return cmdPositions(int(u32(2, 100)), argv[3], u32(4, 1), argc > 5 && argv[5][0] == '1');
+  }
   if (std::strcmp(cmd, "evalpop") == 0) {
     if (argc < 3) {
       std::printf("usage: sw7 evalpop <weights.bin|-|heN> [games] [iters] [dets]\n");
@@ -712,9 +1057,12 @@ int main(int argc, char** argv) {
   std::printf("  sw7 bench [games]             throughput benchmark\n");
   std::printf("  sw7 eval [games] [iters]      MCTS(seat0) vs 4 random win-rate\n");
   std::printf("  sw7 evalnet <w.bin> [g] [it]  PUCT-net(seat0) vs 4 random win-rate\n");
-  std::printf("  sw7 selfplay <g> <it> <out.bin> [w.bin] [seed]   generate training data\n");
+  std::printf("  sw7 netbench <w.bin> [evals] [it]   net evals/sec + PUCT iterations/sec\n");
+  std::printf("  sw7 selfplay <g> <it> <out.bin> [w.bin|-] [seed]   generate training data\n");
   std::printf("  sw7 evalii <w.bin|-> [g] [it] [dets]   imperfect-info (determinized) eval\n");
   std::printf("  sw7 evalpop <w.bin|-|heN> [g] [it] [dets]   vs heuristic population\n");
+  std::printf("  sw7 match <A> <B> [g] [it] [seed]      head-to-head, A/B: w.bin|-|heN|random\n");
   std::printf("  sw7 move [w.bin|-] [iters] [dets]      position (stdin ints) -> move (deploy)\n");
+  std::printf("  sw7 positions <g> <out.txt> [seed] [ed] `sw7 move` inputs from seeded games\n");
   return 0;
 }
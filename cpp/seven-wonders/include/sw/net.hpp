@@ -7,6 +7,7 @@
 //   value[k]  = predicted rank-reward of seat (p+k) mod N   (value[0] = self)
 //   policy    = logits over (cardType, action-code) for the perspective seat
 #pragma once
+#include <cstddef>
 #include <cstdint>
 #include <vector>
 
@@ -22,9 +23,25 @@ inline constexpr int FEAT_DIM = PER_SEAT_FEATS * N /*95*/ + NUM_CARD_TYPES_CT /*
                                 3 /*age*/ + 6 /*turn*/ + 5 /*misc*/;  // = 187
 inline constexpr int POLICY_DIM = NUM_CARD_TYPES_CT * 4;              // (cardType, code) = 312
 inline constexpr int VALUE_DIM = N;                                   // per-seat rank reward
-inline constexpr int H1 = 128;
-inline constexpr int H2 = 128;
+// Hidden layers are read from the weights header; these bound what `load` accepts.
+inline constexpr int MAX_DEPTH = 8;
+inline constexpr int MAX_WIDTH = 1024;
 inline constexpr uint32_t WEIGHTS_MAGIC = 0x53574e31;  // "SWN1"
+inline constexpr uint32_t WEIGHTS2_MAGIC = 0x53574e32; // "SWN2"
+
+// SWN1 weights (two hidden layers, float32): header {magic, FEAT_DIM, H1, H2,
+// POLICY_DIM, VALUE_DIM}, then per layer (W1,b1, W2,b2, Wp,bp, Wv,bv) the
+// row-major weight matrix and the bias.
+//
+// SWN2 ("versioned") weights: header {magic, version, dtype, FEAT_DIM,
+// POLICY_DIM, VALUE_DIM, depth, width[depth]} (version 2; version 1 had
+// {FEAT_DIM, H1, H2, POLICY_DIM, VALUE_DIM} after dtype), then the layers in
+// the same order, each matrix in `dtype` and each bias as float32. I8 stores
+// each matrix as float32 per-row scales followed by int8 rows (row r =
+// scale[r] * q[r]). Written by train/train.py (float32 nets that are not two
+// layers deep) and train/quantize.py.
+inline constexpr int32_t WEIGHTS2_VERSION = 2;
+enum class WeightType : int32_t { F32 = 0, F16 = 1, I8 = 2 };
 
 // Policy bucket for a selecting move: cardType * 4 + code
 // (0 discard, 1 play, 2 build-wonder, 3 build-wonder+participate).
@@ -39,10 +56,48 @@ inline int policyIndex(const GameState& st, int seat, const Move& m) {
 // Seat-relative feature encoding (writes exactly FEAT_DIM floats).
 void encodeFeatures(const GameState& st, int perspective, float* out);
 
+// Remote evaluation: a weights path of the form "unix:<socket>" connects to a
+// train/serve.py server instead, which batches leaf requests from many
+// concurrent games. On connect the server sends {SERVER_MAGIC, FEAT_DIM,
+// POLICY_DIM, VALUE_DIM} (int32); each eval then sends FEAT_DIM float32 and
+// reads back POLICY_DIM logits and VALUE_DIM values (float32, values in [0,1]).
+inline constexpr uint32_t SERVER_MAGIC = 0x53574e53;  // "SWNS"
+
+// One dense layer: out = W x + b, W row-major rows x cols.
+struct Layer {
+  int rows = 0, cols = 0;
+  std::vector<float> W, b;
+  // int8 weights (SWN2 I8), used instead of W when the net is quantized: rows
+  // zero-padded to a multiple of 32 columns, with per-row scales.
+  std::vector<int8_t> Q;
+  std::vector<float> scale;
+
+  Layer() = default;
+  Layer(int rows_, int cols_)
+      : rows(rows_), cols(cols_), W(std::size_t(rows_) * cols_), b(rows_) {}
+};
+
 struct Net {
   bool loaded = false;
-  std::vector<float> W1, b1, W2, b2, Wp, bp, Wv, bv;
+  std::vector<Layer> hidden;  // ReLU layers: FEAT_DIM -> width[0] -> ... -> width[depth-1]
+  Layer policy, value;        // heads on the last hidden layer
+  // With int8 weights each layer's input is scaled to int16 per call and dotted
+  // with the int8 rows in int32, so the weights take a quarter of the bytes and
+  // the dot products vectorize.
+  bool quantized = false;
+
+  int remote = -1;  // socket to an evaluation server ("unix:<path>")
+
+  Net() = default;
+  Net(const Net&) = delete;
+  Net& operator=(const Net&) = delete;
+  ~Net();
+
+  // Float32 layers of the given hidden widths, all weights zero.
+  explicit Net(const std::vector<int>& widths);
 
+  // SWN1 (float32), SWN2 (float32 / float16, widened on load / int8), or
+  // "unix:<socket>" for a remote evaluation server.
   bool load(const char* path);
   // feat[FEAT_DIM] -> policy[POLICY_DIM] (logits), value[VALUE_DIM] (in [0,1]).
   void eval(const float* feat, float* policy, float* value) const;
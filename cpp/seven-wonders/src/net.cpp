@@ -1,7 +1,15 @@
 #include "sw/net.hpp"
 
+#include <sys/socket.h>
+#include <sys/un.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <cerrno>
 #include <cmath>
 #include <cstdio>
+#include <cstdlib>
+#include <cstring>
 
 namespace sw {
 
@@ -10,54 +18,236 @@ static bool readFloats(std::FILE* f, std::vector<float>& v, int n) {
   return int(std::fread(v.data(), sizeof(float), n, f)) == n;
 }
 
+static float halfToFloat(uint16_t h) {
+  int e = (h >> 10) & 0x1f, m = h & 0x3ff;
+  float v = e == 0    ? std::ldexp(float(m), -24)
+            : e == 31 ? (m ? NAN : INFINITY)
+                      : std::ldexp(float(m | 0x400), e - 25);
+  return (h & 0x8000) ? -v : v;
+}
+
+// int8 rows are kept zero-padded to a multiple of 32 columns: with a fixed,
+// padded trip count the dot product loops vectorize even at -O2.
+static constexpr int padded(int cols) { return (cols + 31) & ~31; }
+
+// One layer: the rows x cols matrix in `type` (float32 / float16 into W, or
+// int8 per-row scales then the rows into Q and scale), then the float32 bias.
+static bool readLayer(std::FILE* f, WeightType type, Layer& L) {
+  int n = L.rows * L.cols;
+  if (type == WeightType::F32) {
+    if (!readFloats(f, L.W, n)) return false;
+  } else if (type == WeightType::F16) {
+    std::vector<uint16_t> h(n);
+    if (int(std::fread(h.data(), sizeof(uint16_t), n, f)) != n) return false;
+    L.W.resize(n);
+    for (int i = 0; i < n; i++) L.W[i] = halfToFloat(h[i]);
+  } else {
+    std::vector<int8_t> q(n);
+    if (!readFloats(f, L.scale, L.rows) || int(std::fread(q.data(), 1, n, f)) != n) return false;
+    int stride = padded(L.cols);
+    L.W.clear();
+    L.Q.assign(size_t(L.rows) * stride, 0);
+    for (int r = 0; r < L.rows; r++)
+      std::copy_n(&q[size_t(r) * L.cols], L.cols, &L.Q[size_t(r) * stride]);
+  }
+  return readFloats(f, L.b, L.rows);
+}
+
+static bool sendAll(int fd, const void* buf, size_t n) {
+  const char* p = static_cast<const char*>(buf);
+  while (n > 0) {
+    ssize_t k = ::send(fd, p, n, MSG_NOSIGNAL);
+    if (k < 0 && errno == EINTR) continue;
+    if (k <= 0) return false;
+    p += k;
+    n -= size_t(k);
+  }
+  return true;
+}
+
+static bool recvAll(int fd, void* buf, size_t n) {
+  char* p = static_cast<char*>(buf);
+  while (n > 0) {
+    ssize_t k = ::recv(fd, p, n, 0);
+    if (k < 0 && errno == EINTR) continue;
+    if (k <= 0) return false;
+    p += k;
+    n -= size_t(k);
+  }
+  return true;
+}
+
+// Connect to a train/serve.py evaluation server and check its dimensions.
+static int connectServer(const char* path) {
+  sockaddr_un addr{};
+  addr.sun_family = AF_UNIX;
+  if (std::strlen(path) >= sizeof(addr.sun_path)) {
+    std::fprintf(stderr, "net: socket path too long: %s\n", path);
+    return -1;
+  }
+  std::strcpy(addr.sun_path, path);
+  int fd = ::socket(AF_UNIX, SOCK_STREAM, 0);
+  if (fd < 0) return -1;
+  int32_t hello[4];
+  if (::connect(fd, reinterpret_cast<sockaddr*>(&addr), sizeof(addr)) != 0 ||
+      !recvAll(fd, hello, sizeof(hello))) {
+    std::fprintf(stderr, "net: cannot reach evaluation server at %s\n", path);
+    ::close(fd);
+    return -1;
+  }
+  if (uint32_t(hello[0]) != SERVER_MAGIC || hello[1] != FEAT_DIM || hello[2] != POLICY_DIM ||
+      hello[3] != VALUE_DIM) {
+    std::fprintf(stderr, "net: evaluation server dims mismatch (arch changed?)\n");
+    ::close(fd);
+    return -1;
+  }
+  return fd;
+}
+
+Net::Net(const std::vector<int>& widths) : loaded(true) {
+  int in = FEAT_DIM;
+  for (int w : widths) {
+    hidden.emplace_back(w, in);
+    in = w;
+  }
+  policy = Layer(POLICY_DIM, in);
+  value = Layer(VALUE_DIM, in);
+}
+
+Net::~Net() {
+  if (remote >= 0) ::close(remote);
+}
+
 bool Net::load(const char* path) {
-  loaded = false;
+  loaded = quantized = false;
+  if (remote >= 0) ::close(remote);
+  remote = -1;
+  if (std::strncmp(path, "unix:", 5) == 0) {
+    remote = connectServer(path + 5);
+    loaded = remote >= 0;
+    return loaded;
+  }
   std::FILE* f = std::fopen(path, "rb");
   if (!f) return false;
-  int32_t hdr[5];
+  // dims = {FEAT_DIM, POLICY_DIM, VALUE_DIM}, widths = the hidden layers
+  int32_t dims[3] = {}, depth = 2, widths[MAX_DEPTH] = {};
   uint32_t magic = 0;
-  bool ok = std::fread(&magic, sizeof(magic), 1, f) == 1 &&
-            std::fread(hdr, sizeof(int32_t), 5, f) == 5;
-  if (ok && (magic != WEIGHTS_MAGIC || hdr[0] != FEAT_DIM || hdr[1] != H1 || hdr[2] != H2 ||
-             hdr[3] != POLICY_DIM || hdr[4] != VALUE_DIM)) {
+  WeightType type = WeightType::F32;
+  auto ints = [&](int32_t* out, int n) { return int(std::fread(out, sizeof(int32_t), n, f)) == n; };
+  bool ok = std::fread(&magic, sizeof(magic), 1, f) == 1;
+  if (ok && magic == WEIGHTS2_MAGIC) {
+    int32_t vt[2];
+    ok = ints(vt, 2);
+    if (ok && (vt[0] < 1 || vt[0] > WEIGHTS2_VERSION || vt[1] < 0 ||
+               vt[1] > int32_t(WeightType::I8))) {
+      ok = false;
+      std::fprintf(stderr, "net: unsupported SWN2 version %d / dtype %d\n", vt[0], vt[1]);
+    }
+    type = WeightType(vt[1]);
+    if (ok && vt[0] >= 2) {
+      ok = ints(dims, 3) && ints(&depth, 1);
+      if (ok && (depth < 1 || depth > MAX_DEPTH)) {
+        ok = false;
+        std::fprintf(stderr, "net: unsupported depth %d\n", depth);
+      }
+      ok = ok && ints(widths, depth);
+    } else {
+      magic = WEIGHTS_MAGIC;  // version 1: the SWN1 header follows
+    }
+  } else if (ok && magic != WEIGHTS_MAGIC) {
+    ok = false;
+    std::fprintf(stderr, "net: not a weights file\n");
+  }
+  if (ok && magic == WEIGHTS_MAGIC) {
+    int32_t hdr[5];
+    ok = ints(hdr, 5);
+    dims[0] = hdr[0], widths[0] = hdr[1], widths[1] = hdr[2], dims[1] = hdr[3], dims[2] = hdr[4];
+  }
+  if (ok && (dims[0] != FEAT_DIM || dims[1] != POLICY_DIM || dims[2] != VALUE_DIM)) {
     ok = false;
     std::fprintf(stderr, "net: weights header mismatch (arch changed?)\n");
   }
-  ok = ok && readFloats(f, W1, H1 * FEAT_DIM) && readFloats(f, b1, H1) &&
-       readFloats(f, W2, H2 * H1) && readFloats(f, b2, H2) &&
-       readFloats(f, Wp, POLICY_DIM * H2) && readFloats(f, bp, POLICY_DIM) &&
-       readFloats(f, Wv, VALUE_DIM * H2) && readFloats(f, bv, VALUE_DIM);
+  for (int i = 0; ok && i < depth; i++)
+    if (widths[i] < 1 || widths[i] > MAX_WIDTH) {
+      ok = false;
+      std::fprintf(stderr, "net: hidden width %d out of range\n", widths[i]);
+    }
+  hidden.clear();
+  int in = FEAT_DIM;
+  for (int i = 0; ok && i < depth; i++) {
+    hidden.emplace_back(widths[i], in);
+    in = widths[i];
+    ok = readLayer(f, type, hidden.back());
+  }
+  policy = Layer(POLICY_DIM, in);
+  value = Layer(VALUE_DIM, in);
+  ok = ok && readLayer(f, type, policy) && readLayer(f, type, value);
   std::fclose(f);
+  quantized = ok && type == WeightType::I8;
   loaded = ok;
   return ok;
 }
 
+// out[r] = b[r] + scale[r] * <q row r, x>, with x scaled into int16 so the dot
+// products are exact integer sums (|x| <= 32767 and |q| <= 127: each block of
+// 32 columns fits an int32, the row total an int64). Mirrors train/quantize.py's
+// int8 forward. The fixed 32-wide inner loop vectorizes even at -O2.
+static void affineQ(const Layer& L, const float* x, float* out) {
+  const int P = padded(L.cols);
+  int16_t xq[padded(MAX_WIDTH > FEAT_DIM ? MAX_WIDTH : FEAT_DIM)];
+  float amax = 0;
+  for (int k = 0; k < L.cols; k++) amax = std::max(amax, std::abs(x[k]));
+  float inv = amax > 0 ? 32767.0f / amax : 0.0f, xs = amax / 32767.0f;
+  for (int k = 0; k < L.cols; k++) xq[k] = int16_t(std::lrint(x[k] * inv));
+  for (int k = L.cols; k < P; k++) xq[k] = 0;
+  for (int r = 0; r < L.rows; r++) {
+    const int8_t* q = &L.Q[size_t(r) * P];
+    int64_t acc = 0;
+    for (int k0 = 0; k0 < P; k0 += 32) {
+      int32_t s = 0;
+      for (int k = 0; k < 32; k++) s += int32_t(q[k0 + k]) * xq[k0 + k];
+      acc += s;
+    }
+    out[r] = L.b[r] + L.scale[r] * xs * float(acc);
+  }
+}
+
+static void affine(const Layer& L, const float* x, float* out) {
+  for (int r = 0; r < L.rows; r++) {
+    float s = L.b[r];
+    const float* w = &L.W[size_t(r) * L.cols];
+    for (int k = 0; k < L.cols; k++) s += w[k] * x[k];
+    out[r] = s;
+  }
+}
+
 void Net::eval(const float* feat, float* policy, float* value) const {
-  float h1[H1], h2[H2];
-  for (int r = 0; r < H1; r++) {
-    float s = b1[r];
-    const float* w = &W1[r * FEAT_DIM];
-    for (int k = 0; k < FEAT_DIM; k++) s += w[k] * feat[k];
-    h1[r] = s > 0 ? s : 0;  // ReLU
-  }
-  for (int r = 0; r < H2; r++) {
-    float s = b2[r];
-    const float* w = &W2[r * H1];
-    for (int k = 0; k < H1; k++) s += w[k] * h1[k];
-    h2[r] = s > 0 ? s : 0;
-  }
-  for (int r = 0; r < POLICY_DIM; r++) {
-    float s = bp[r];
-    const float* w = &Wp[r * H2];
-    for (int k = 0; k < H2; k++) s += w[k] * h2[k];
-    policy[r] = s;  // logits
-  }
-  for (int r = 0; r < VALUE_DIM; r++) {
-    float s = bv[r];
-    const float* w = &Wv[r * H2];
-    for (int k = 0; k < H2; k++) s += w[k] * h2[k];
-    value[r] = 1.0f / (1.0f + std::exp(-s));  // sigmoid -> [0,1]
+  if (remote >= 0) {
+    // A self-play or search process cannot continue without its evaluator.
+    float reply[POLICY_DIM + VALUE_DIM];
+    if (!sendAll(remote, feat, sizeof(float) * FEAT_DIM) ||
+        !recvAll(remote, reply, sizeof(reply))) {
+      std::fprintf(stderr, "net: lost the evaluation server\n");
+      std::exit(1);
+    }
+    std::memcpy(policy, reply, sizeof(float) * POLICY_DIM);
+    std::memcpy(value, reply + POLICY_DIM, sizeof(float) * VALUE_DIM);
+    return;
+  }
+  auto layer = [this](const Layer& L, const float* in, float* out) {
+    quantized ? affineQ(L, in, out) : affine(L, in, out);
+  };
+  float buf[2][MAX_WIDTH];
+  const float* x = feat;
+  for (size_t i = 0; i < hidden.size(); i++) {
+    float* h = buf[i & 1];
+    layer(hidden[i], x, h);
+    for (int r = 0; r < hidden[i].rows; r++) h[r] = h[r] > 0 ? h[r] : 0;  // ReLU
+    x = h;
   }
+  layer(this->policy, x, policy);  // logits
+  layer(this->value, x, value);
+  for (int r = 0; r < VALUE_DIM; r++) value[r] = 1.0f / (1.0f + std::exp(-value[r]));  // -> [0,1]
 }
 
 }  // namespace sw
@@ -1,7 +1,12 @@
+#include <algorithm>
 #include <cmath>
+#include <cstdio>
+#include <filesystem>
+#include <string>
 #include <vector>
 
 #include "sw/net.hpp"
+#include "sw/rng.hpp"
 #include "sw/rules.hpp"
 #include "sw/setup.hpp"
 #include "tinytest.hpp"
@@ -31,17 +36,141 @@ TEST_CASE("policyIndex is within bounds for opening moves") {
 }
 
 TEST_CASE("net forward: zero weights -> value 0.5, zero policy logits") {
-  Net net;
-  net.W1.assign(H1 * FEAT_DIM, 0);
-  net.b1.assign(H1, 0);
-  net.W2.assign(H2 * H1, 0);
-  net.b2.assign(H2, 0);
-  net.Wp.assign(POLICY_DIM * H2, 0);
-  net.bp.assign(POLICY_DIM, 0);
-  net.Wv.assign(VALUE_DIM * H2, 0);
-  net.bv.assign(VALUE_DIM, 0);
+  Net net({128, 128});
   std::vector<float> f(FEAT_DIM, 0.3f), pol(POLICY_DIM), val(VALUE_DIM);
   net.eval(f.data(), pol.data(), val.data());
   for (float v : val) CHECK(std::abs(v - 0.5f) < 1e-6f);
   for (float p : pol) CHECK(std::abs(p) < 1e-6f);
 }
+
+static std::string tempPath(const char* name) {
+  return (std::filesystem::temp_directory_path() / name).string();
+}
+
+static void randomize(Net& net, uint64_t seed) {
+  Rng rng(seed);
+  auto fill = [&](Layer& L) {
+    for (float& w : L.W) w = float(rng.next() - 0.5) * 0.3f;
+    for (float& b : L.b) b = float(rng.next() - 0.5) * 0.1f;
+  };
+  for (Layer& L : net.hidden) fill(L);
+  fill(net.policy);
+  fill(net.value);
+}
+
+// Writes `net`'s float weights as SWN1 (version 0), or SWN2 version 1 (the
+// two-layer header) or 2 (depth and widths) in `dtype`, int8 rows quantized
+// as train/quantize.py does.
+static void writeNet(const std::string& p, const Net& net, int version, WeightType dtype) {
+  std::FILE* f = std::fopen(p.c_str(), "wb");
+  REQUIRE(f != nullptr);
+  uint32_t magic = version == 0 ? WEIGHTS_MAGIC : WEIGHTS2_MAGIC;
+  std::fwrite(&magic, 4, 1, f);
+  if (version > 0) {
+    int32_t vt[2] = {version, int32_t(dtype)};
+    std::fwrite(vt, 4, 2, f);
+  }
+  if (version < 2) {
+    int32_t dims[5] = {FEAT_DIM, net.hidden[0].rows, net.hidden[1].rows, POLICY_DIM, VALUE_DIM};
+    std::fwrite(dims, 4, 5, f);
+  } else {
+    int32_t dims[4] = {FEAT_DIM, POLICY_DIM, VALUE_DIM, int32_t(net.hidden.size())};
+    std::fwrite(dims, 4, 4, f);
+    for (const Layer& L : net.hidden) std::fwrite(&L.rows, 4, 1, f);
+  }
+  std::vector<const Layer*> layers;
+  for (const Layer& L : net.hidden) layers.push_back(&L);
+  layers.push_back(&net.policy);
+  layers.push_back(&net.value);
+  for (const Layer* L : layers) {
+    if (dtype == WeightType::I8) {
+      std::vector<float> scale(L->rows);
+      std::vector<int8_t> q(L->W.size());
+      for (int r = 0; r < L->rows; r++) {
+        float m = 0;
+        for (int k = 0; k < L->cols; k++) m = std::max(m, std::abs(L->W[r * L->cols + k]));
+        scale[r] = m > 0 ? m / 127.0f : 1.0f;
+        for (int k = 0; k < L->cols; k++)
+          q[r * L->cols + k] = int8_t(std::lrint(L->W[r * L->cols + k] / scale[r]));
+      }
+      std::fwrite(scale.data(), 4, scale.size(), f);
+      std::fwrite(q.data(), 1, q.size(), f);
+    } else {
+      std::fwrite(L->W.data(), 4, L->W.size(), f);
+    }
+    std::fwrite(L->b.data(), 4, L->b.size(), f);
+  }
+  std::fclose(f);
+}
+
+// Writes the same random weights as SWN1 and as SWN2 (float32 and int8) and
+// checks the loaded nets agree.
+TEST_CASE("net load: SWN2 float32 matches SWN1, int8 stays close") {
+  Net ref({128, 128});
+  randomize(ref, 7);
+  std::string p1 = tempPath("sw_net_test.swn1"), p2 = tempPath("sw_net_test.f32.swn2"),
+              p8 = tempPath("sw_net_test.int8.swn2");
+  writeNet(p1, ref, 0, WeightType::F32);
+  writeNet(p2, ref, 1, WeightType::F32);
+  writeNet(p8, ref, 1, WeightType::I8);
+  Net n1, n2, n8;
+  REQUIRE(n1.load(p1.c_str()));
+  REQUIRE(n2.load(p2.c_str()));
+  REQUIRE(n8.load(p8.c_str()));
+  CHECK(!n1.quantized && !n2.quantized && n8.quantized);
+  std::remove(p1.c_str());
+  std::remove(p2.c_str());
+  std::remove(p8.c_str());
+
+  GameState st = createInitialState(3, SideMode::Random, false);
+  std::vector<float> f(FEAT_DIM), pa(POLICY_DIM), va(VALUE_DIM), pb(POLICY_DIM), vb(VALUE_DIM);
+  encodeFeatures(st, 0, f.data());
+  n1.eval(f.data(), pa.data(), va.data());
+  n2.eval(f.data(), pb.data(), vb.data());
+  for (int i = 0; i < POLICY_DIM; i++) CHECK(pa[i] == pb[i]);
+  for (int i = 0; i < VALUE_DIM; i++) CHECK(va[i] == vb[i]);
+  n8.eval(f.data(), pb.data(), vb.data());
+  float dp = 0, dv = 0;
+  for (int i = 0; i < POLICY_DIM; i++) dp = std::max(dp, std::abs(pa[i] - pb[i]));
+  for (int i = 0; i < VALUE_DIM; i++) dv = std::max(dv, std::abs(va[i] - vb[i]));
+  CHECK(dp < 0.05f);
+  CHECK(dv < 0.01f);
+}
+
+TEST_CASE("net load: SWN2 version 2 carries any depth and width") {
+  for (const std::vector<int>& widths : {std::vector<int>{40}, std::vector<int>{64, 32, 16}}) {
+    Net ref(widths);
+    randomize(ref, 11);
+    std::string pf = tempPath("sw_net_test.deep.f32"), p8 = tempPath("sw_net_test.deep.int8");
+    writeNet(pf, ref, 2, WeightType::F32);
+    writeNet(p8, ref, 2, WeightType::I8);
+    Net nf, n8;
+    REQUIRE(nf.load(pf.c_str()));
+    REQUIRE(n8.load(p8.c_str()));
+    std::remove(pf.c_str());
+    std::remove(p8.c_str());
+    REQUIRE(nf.hidden.size() == widths.size());
+    for (size_t i = 0; i < widths.size(); i++) CHECK(nf.hidden[i].rows == widths[i]);
+
+    GameState st = createInitialState(5, SideMode::Random, false);
+    std::vector<float> f(FEAT_DIM), pa(POLICY_DIM), va(VALUE_DIM), pb(POLICY_DIM), vb(VALUE_DIM);
+    encodeFeatures(st, 0, f.data());
+    ref.eval(f.data(), pa.data(), va.data());
+    nf.eval(f.data(), pb.data(), vb.data());
+    for (int i = 0; i < POLICY_DIM; i++) CHECK(pa[i] == pb[i]);
+    for (int i = 0; i < VALUE_DIM; i++) CHECK(va[i] == vb[i]);
+    n8.eval(f.data(), pb.data(), vb.data());
+    float dp = 0;
+    for (int i = 0; i < POLICY_DIM; i++) dp = std::max(dp, std::abs(pa[i] - pb[i]));
+    CHECK(dp < 0.05f);
+  }
+}
+
+TEST_CASE("net load: rejects out-of-range hidden widths") {
+  Net ref({MAX_WIDTH + 1});
+  std::string p = tempPath("sw_net_test.wide");
+  writeNet(p, ref, 2, WeightType::F32);
+  Net n;
+  CHECK(!n.load(p.c_str()));
+  std::remove(p.c_str());
+}
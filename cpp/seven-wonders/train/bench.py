@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""Benchmarks for the Python side of the training loop, with a stored baseline.
+Run from cpp/seven-wonders/ (or `make bench-train`).
+
+  python train/bench.py [--samples 20000] [--files 4] [--batches 256,1024]
+                        [--stages concat,load,compact,loader,numpy,torch,loop]
+                        [--repeats 3] [--out results.json] [--baseline base.json]
+                        [--tolerance 0.25] [--save-baseline]
+
+Sample files are synthetic SWSP (random count-like features, ~9 legal buckets
+and a few visited ones per row, with the legal trailer), so nothing but numpy
+is needed. Stages:
+
+  concat   seconds to concatenate the files into one (loop.py's old merge step)
+  load     seconds to open the window and gather every row densely
+  compact  seconds to convert one file to SWS2, and to gather it densely
+  loader   BatchLoader samples/s over one epoch, global and chunked shuffle
+  numpy    train.py steps/s and samples/s per batch size (last of --epochs)
+  torch    the same for train_torch.py on CPU (skipped without torch)
+  loop     seconds per loop.py iteration by phase, the median of --repeats runs,
+           from the loop's metrics JSONL (skipped without build/sw7)
+
+Results go to --out as JSON, one {value, unit, better} entry per metric. With
+--baseline every metric present in both is compared; one that is worse than the
+baseline by more than --tolerance (relative) is a regression and the exit status
+is 1. --save-baseline writes the results to the --baseline path instead.
+
+Timings only compare on the machine and workload they were taken on, so the
+default baseline is per machine: build/bench/<machine>-<cpus>cpu-<hash>.json,
+the hash covering the `meta` block (host, CPU count, Python/numpy versions,
+--samples/--files/--epochs/--batches). A --baseline whose meta differs from
+this run's is reported and not compared.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+from convert import to_compact
+from loader import BatchLoader
+from loop import ROOT, SW7
+from replay import SP_HEADER, SP_MAGIC, ReplayBuffer, concat, open_shard, write_legal
+
+FEAT, POL, VAL = 187, 312, 5
+HERE = os.path.dirname(os.path.abspath(__file__))
+STAGES = ["concat", "load", "compact", "loader", "numpy", "torch", "loop"]
+
+
+def synth(path, n, rng, legal=9, visited=3):
+    """Write an n-sample SWSP file with a legal trailer, shaped like sw7 output."""
+    F = (rng.integers(0, 8, (n, FEAT)) / rng.choice([1, 2, 4, 8], FEAT)).astype(np.float32)
+    L = np.sort(np.argsort(rng.random((n, POL)), 1)[:, :legal], 1).astype(np.uint16)
+    P = np.zeros((n, POL), np.float32)
+    w = rng.random((n, visited)).astype(np.float32)
+    P[np.arange(n)[:, None], L[:, :visited]] = w / w.sum(1, keepdims=True)
+    V = np.zeros((n, VAL), np.float32)
+    V[np.arange(n), rng.integers(0, VAL, n)] = 1
+    with open(path, "wb") as f:
+        f.write(SP_HEADER.pack(SP_MAGIC, n, FEAT, POL, VAL))
+        for arr in (F, P, V):
+            f.write(arr.tobytes())
+        write_legal(f, [(np.full(n, legal, np.uint16), None, L.ravel())])
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - t0
+
+
+def metric(value, unit, better):
+    return {"value": round(float(value), 4), "unit": unit, "better": better}
+
+
+EPOCH_RE = re.compile(r"\((\d+) steps/s, ([\d,]+) samples/s\)")
+
+
+def trainer_rates(script, manifest, out, batch, epochs):
+    """(steps/s, samples/s) of a trainer's last epoch."""
+    r = subprocess.run([sys.executable, os.path.join(HERE, script), manifest, "--out", out,
+                        "--epochs", str(epochs), "--batch", str(batch)],
+                       capture_output=True, text=True, check=True)
+    steps, samples = EPOCH_RE.findall(r.stdout)[-1]
+    return float(steps), float(samples.replace(",", ""))
+
+
+def loop_phases(workdir):
+    """Wall seconds of one small loop.py iteration by phase, from its metrics."""
+    metrics = os.path.join(workdir, "metrics.jsonl")
+    subprocess.run([sys.executable, os.path.join(HERE, "loop.py"), "--iters", "1", "--games",
+                    "4", "--sp-iters", "30", "--eval-games", "4", "--eval-iters", "30",
+                    "--epochs", "1", "--workdir", workdir, "--metrics", metrics],
+                   capture_output=True, text=True, check=True)
+    out = {"selfplay": 0.0, "train": 0.0, "eval": 0.0}
+    with open(metrics) as f:
+        for rec in map(json.loads, f):
+            if rec.get("phase") in out:
+                out[rec["phase"]] += rec["wall_s"]
+    out["total"] = sum(out.values())
+    return out
+
+
+def baseline_path(meta):
+    """The default baseline file for this machine and workload."""
+    key = {k: v for k, v in meta.items() if k != "skipped"}
+    h = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:8]
+    return os.path.join(ROOT, "build", "bench", f"{meta['machine']}-{meta['cpus']}cpu-{h}.json")
+
+
+def run(a, tmp):
+    rng = np.random.default_rng(a.seed)
+    per = a.samples // a.files
+    files = []
+    for k in range(a.files):
+        files.append(os.path.join(tmp, f"data_{k}.bin"))
+        synth(files[-1], per, rng)
+    manifest = os.path.join(tmp, "replay.txt")
+    with open(manifest, "w") as f:
+        f.write("\n".join(files) + "\n")
+    res, skipped = {}, {}
+
+    if "concat" in a.stages:
+        res["concat_s"] = metric(timed(concat, files, os.path.join(tmp, "all.bin")), "s", "lower")
+    if "load" in a.stages:
+        t0 = time.perf_counter()
+        buf = ReplayBuffer.from_paths(files)
+        buf.gather(np.arange(len(buf)))
+        res["load_s"] = metric(time.perf_counter() - t0, "s", "lower")
+    if "compact" in a.stages:
+        sws2 = os.path.join(tmp, "all.sws2")
+        res["compact_convert_s"] = metric(timed(to_compact, open_shard(files[0]), sws2), "s",
+                                          "lower")
+        src = open_shard(sws2)
+        res["compact_load_s"] = metric(timed(src.rows, np.arange(src.n)), "s", "lower")
+    if "loader" in a.stages:
+        buf = ReplayBuffer.from_paths(files)
+        for chunk in (0, 8192):
+            loader = BatchLoader(buf, 256, np.random.default_rng(0), chunk=chunk)
+            dt = timed(lambda: sum(1 for _ in loader.epoch()))
+            res[f"loader_chunk{chunk}_samples_per_s"] = metric(len(buf) / dt, "samples/s",
+                                                               "higher")
+    for name, script in (("numpy", "train.py"), ("torch", "train_torch.py")):
+        if name not in a.stages:
+            continue
+        if name == "torch":
+            try:
+                import torch  # noqa: F401
+            except ImportError:
+                skipped[name] = "torch not installed"
+                continue
+        for batch in a.batches:
+            steps, samples = trainer_rates(script, manifest, os.path.join(tmp, "w.bin"), batch,
+                                           a.epochs)
+            res[f"{name}_b{batch}_steps_per_s"] = metric(steps, "steps/s", "higher")
+            res[f"{name}_b{batch}_samples_per_s"] = metric(samples, "samples/s", "higher")
+    if "loop" in a.stages:
+        if not os.path.exists(SW7):
+            skipped["loop"] = f"{SW7} not built (make cli)"
+        else:
+            runs = [loop_phases(os.path.join(tmp, f"loop{k}")) for k in range(a.repeats)]
+            for phase in ("selfplay", "train", "eval", "total"):
+                res[f"loop_{phase}_s"] = metric(np.median([r[phase] for r in runs]), "s",
+                                                "lower")
+    return res, skipped
+
+
+def compare(res, base, tol):
+    """Print current vs baseline; return the names of regressed metrics."""
+    bad = []
+    for name, cur in res.items():
+        ref = base.get(name)
+        if ref is None or ref["value"] == 0:
+            print(f"  {name:34s} {cur['value']:>12,.4g} {cur['unit']:10s}  (no baseline)")
+            continue
+        ratio = cur["value"] / ref["value"]
+        worse = ratio < 1 - tol if cur["better"] == "higher" else ratio > 1 + tol
+        if worse:
+            bad.append(name)
+        print(f"  {name:34s} {cur['value']:>12,.4g} {cur['unit']:10s}  baseline "
+              f"{ref['value']:,.4g}  x{ratio:.2f}{'  REGRESSION' if worse else ''}")
+    return bad
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--samples", type=int, default=20000, help="synthetic samples in total")
+    ap.add_argument("--files", type=int, default=4, help="files the samples are split over")
+    ap.add_argument("--batches", default="256,1024", help="trainer batch sizes")
+    ap.add_argument("--epochs", type=int, default=2, help="trainer epochs (the last is timed)")
+    ap.add_argument("--stages", default=",".join(STAGES))
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="write results JSON here")
+    ap.add_argument("--repeats", type=int, default=3, help="loop stage runs (median)")
+    ap.add_argument("--baseline", default=None,
+                    help="default: this machine's file under build/bench/")
+    ap.add_argument("--tolerance", type=float, default=0.25,
+                    help="relative slowdown allowed before a metric counts as a regression")
+    ap.add_argument("--save-baseline", action="store_true")
+    a = ap.parse_args()
+    a.stages = a.stages.split(",")
+    a.batches = [int(b) for b in a.batches.split(",")]
+
+    with tempfile.TemporaryDirectory(prefix="swbench") as tmp:
+        res, skipped = run(a, tmp)
+    meta = {"host": platform.node(), "python": platform.python_version(),
+            "numpy": np.__version__, "machine": platform.machine(), "cpus": os.cpu_count(),
+            "samples": a.samples, "files": a.files, "epochs": a.epochs, "batches": a.batches,
+            "skipped": skipped}
+    doc = {"meta": meta, "results": res}
+    a.baseline = a.baseline or baseline_path(meta)
+    for stage, why in skipped.items():
+        print(f"  {stage}: skipped ({why})")
+    if a.out:
+        with open(a.out, "w") as f:
+            json.dump(doc, f, indent=2)
+    base = {}
+    if os.path.exists(a.baseline) and not a.save_baseline:
+        with open(a.baseline) as f:
+            ref = json.load(f)
+        same = {k: v for k, v in ref["meta"].items() if k != "skipped"} == \
+            {k: v for k, v in meta.items() if k != "skipped"}
+        if same:
+            base = ref["results"]
+        else:
+            print(f"  {a.baseline} was recorded on another machine or workload; not compared")
+    bad = compare(res, base, a.tolerance)
+    if a.save_baseline:
+        os.makedirs(os.path.dirname(a.baseline) or ".", exist_ok=True)
+        with open(a.baseline, "w") as f:
+            json.dump(doc, f, indent=2)
+            f.write("\n")
+        print(f"wrote baseline -> {a.baseline}")
+    elif bad:
+        print(f"{len(bad)} regression(s) beyond {a.tolerance:.0%}: {', '.join(bad)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
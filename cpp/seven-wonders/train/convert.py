@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Convert self-play sample files between SWSP (what `sw7` writes) and the
+compact SWS2 format (layout in replay.py). Run from cpp/seven-wonders/.
+
+  python train/convert.py data_3.bin data_3.sws2 [--features u8|f16] [--measure]
+  python train/convert.py data_3.sws2 data_3.bin --to swsp
+
+SWS2 stores the policy target sparsely (only visited buckets, uint16 index +
+float16 prob), the legal buckets when the source has them, values as float16,
+and features as uint8 codes with a per-column scale and offset (or plain
+float16 with `--features f16`). Feature columns are mostly k/c counts, so a
+column whose values sit on a grid of at most 256 steps is coded on that grid
+(exact up to float32 rounding); other columns fall back to 255 even steps over
+their range.
+
+Conversion streams `--chunk` rows at a time, so memory stays flat. `--measure`
+prints bytes/sample and a full dense load time for both files.
+"""
+import argparse
+import os
+import time
+import numpy as np
+
+from replay import (S2_HEADER, S2_LEGAL, S2_MAGIC, S2_U8, SP_HEADER, SP_MAGIC, align,
+                    open_shard, write_legal)
+
+
+def column_codes(src, chunk):
+    """Per-column (scale, lo) for uint8 features, from a pass over the file."""
+    feat = src.dims[0]
+    vals = [np.empty(0, np.float32) for _ in range(feat)]
+    for s in range(0, src.n, chunk):
+        X = src.rows(np.arange(s, min(s + chunk, src.n)))[0]
+        for c in range(feat):
+            vals[c] = np.unique(np.concatenate([vals[c], X[:, c]]))
+    scale = np.ones(feat, np.float32)
+    lo = np.zeros(feat, np.float32)
+    for c, u in enumerate(vals):
+        if len(u) == 0:
+            continue
+        lo[c] = u[0]
+        span = float(u[-1] - u[0])
+        if len(u) == 1:
+            continue
+        step = float(np.diff(u).min())
+        k = (u - u[0]) / step
+        if span / step <= 255 and np.abs(k - np.round(k)).max() < 1e-3:
+            scale[c] = step
+        else:
+            scale[c] = span / 255
+    return scale, lo
+
+
+def to_compact(src, out, features="u8", chunk=65536):
+    n, (feat, pol, val) = src.n, src.dims
+    nnz = 0
+    for s in range(0, n, chunk):
+        nnz += int(np.count_nonzero(src.rows(np.arange(s, min(s + chunk, n)))[1]))
+    flags = (S2_U8 if features == "u8" else 0) | (S2_LEGAL if src.legal is not None else 0)
+    codes = column_codes(src, chunk) if flags & S2_U8 else None
+
+    # Block offsets (each block 8-byte aligned), then fill chunk by chunk.
+    off = align(S2_HEADER.size)
+    if codes is not None:
+        o_codes = off
+        off = align(off + 8 * feat)
+    o_F, fsize = off, (1 if codes is not None else 2)
+    off = align(off + fsize * n * feat)
+    o_V = off
+    off = align(off + 2 * n * val)
+    o_cnt = off
+    off = align(off + 2 * n)
+    o_idx = off
+    off = align(off + 2 * nnz)
+    o_prob = off
+    off = align(off + 2 * nnz)
+    o_legal = off
+    end = off + ((8 + 2 * n + 2 * len(src.legal[2])) if flags & S2_LEGAL else 0)
+
+    tmp = out + ".tmp"
+    with open(tmp, "wb") as f:
+        f.truncate(end)
+        f.write(S2_HEADER.pack(S2_MAGIC, n, feat, pol, val, nnz, flags))
+        if codes is not None:
+            f.seek(o_codes)
+            f.write(codes[0].tobytes() + codes[1].tobytes())
+        k = 0
+        for s in range(0, n, chunk):
+            e = min(s + chunk, n)
+            X, P, V = src.rows(np.arange(s, e))
+            if codes is not None:
+                Xq = np.clip(np.round((X - codes[1]) / codes[0]), 0, 255).astype(np.uint8)
+            else:
+                Xq = X.astype(np.float16)
+            r, c = np.nonzero(P)  # row-major, so buckets come out grouped by row
+            cnt = np.bincount(r, minlength=e - s).astype(np.uint16)
+            for o, arr, item in ((o_F, Xq, fsize * feat), (o_V, V.astype(np.float16), 2 * val),
+                                 (o_cnt, cnt, 2)):
+                f.seek(o + item * s)
+                f.write(np.ascontiguousarray(arr).tobytes())
+            f.seek(o_idx + 2 * k)
+            f.write(c.astype(np.uint16).tobytes())
+            f.seek(o_prob + 2 * k)
+            f.write(P[r, c].astype(np.float16).tobytes())
+            k += len(c)
+        if flags & S2_LEGAL:
+            f.seek(o_legal)
+            write_legal(f, [src.legal], magic=False)
+    os.replace(tmp, out)
+
+
+def to_dense(src, out, chunk=65536):
+    n, (feat, pol, val) = src.n, src.dims
+    offs = [SP_HEADER.size, SP_HEADER.size + 4 * n * feat, SP_HEADER.size + 4 * n * (feat + pol)]
+    tmp = out + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(SP_HEADER.pack(SP_MAGIC, n, feat, pol, val))
+        for s in range(0, n, chunk):
+            for o, d, arr in zip(offs, (feat, pol, val), src.rows(np.arange(s, min(s + chunk, n)))):
+                f.seek(o + 4 * d * s)
+                f.write(np.ascontiguousarray(arr, np.float32).tobytes())
+        if src.legal is not None:
+            f.seek(offs[2] + 4 * n * val)
+            write_legal(f, [src.legal])
+    os.replace(tmp, out)
+
+
+def measure(path):
+    """(bytes/sample, seconds to decode the whole file densely)."""
+    t0 = time.perf_counter()
+    src = open_shard(path)
+    src.rows(np.arange(src.n))
+    return os.path.getsize(path) / max(src.n, 1), time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("src")
+    ap.add_argument("dst")
+    ap.add_argument("--to", choices=["sws2", "swsp"], default="sws2")
+    ap.add_argument("--features", choices=["u8", "f16"], default="u8")
+    ap.add_argument("--chunk", type=int, default=65536, help="rows converted per pass")
+    ap.add_argument("--measure", action="store_true", help="report bytes/sample + load time")
+    a = ap.parse_args()
+
+    src = open_shard(a.src)
+    if a.to == "sws2":
+        to_compact(src, a.dst, a.features, a.chunk)
+    else:
+        to_dense(src, a.dst, a.chunk)
+    print(f"wrote {src.n} samples -> {a.dst}")
+    if a.measure:
+        for path in (a.src, a.dst):
+            bps, sec = measure(path)
+            print(f"  {path}: {bps:,.0f} bytes/sample, dense load {sec * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Distil a trained net into smaller students, and tabulate what each size
+costs and buys. Run from cpp/seven-wonders/.
+
+  python train/distill.py teacher.bin samples.bin [more.bin | replay.txt ...]
+                          [--sizes 32,32 64,64 128,128] [--alpha 1.0] [--temperature 1.0]
+                          [--epochs 8] [--trainer numpy|torch] [--games 20] [--iters 200]
+                          [--anchor -] [--evals 100000] [--rows 20000] [--dir build/distill]
+
+The trainers distil with `--teacher T.bin --distill ALPHA [--temperature T]`:
+each batch's targets become (1 - ALPHA) x its own (MCTS visit distribution,
+game outcome) + ALPHA x the teacher's (softmax of its logits / T over the
+position's legal buckets, its predicted values). ALPHA 1 trains on the teacher
+alone; 0 is plain training. `Teacher` below is that mix for train.py.
+
+This script trains one student per --sizes entry (hidden widths, e.g. `64,64`
+or `32` for a single layer) and per --alpha value, each as `sw7`'s float32 and
+int8 weights, then measures, per net:
+
+  speed     `sw7 netbench`: leaf evals/s and PUCT iterations/s, float32 and int8
+  fidelity  policy KL and top-1 agreement with the teacher, and the largest and
+            mean value difference, over --rows rows of the samples
+  strength  Elo relative to the teacher in a league.py round robin of
+            `--games` games per pair at `--iters` search iterations (its game
+            cache lives in --dir, so a rerun only plays new students)
+
+and writes the table to <dir>/distill.md and distill.json. Strength is at equal
+iterations; a student's speed ratio says how many more it gets in equal time.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import numpy as np
+
+import league
+from infer import forward
+from loop import ROOT, SW7
+from quantize import compare, export
+from replay import ReplayBuffer
+from train import hidden_of, load_params, n_params, softmax, weights_info
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class Teacher:
+    """Soft targets from a trained net, mixed into a batch's own with weight
+    `alpha`; the policy part is softmax(logits / temperature)."""
+
+    def __init__(self, path, dims, alpha=1.0, temperature=1.0):
+        self.p = load_params(path, *dims)
+        self.alpha, self.temperature = np.float32(alpha), np.float32(temperature)
+
+    def dense(self, X, Pt, Vt):
+        """(Pt, Vt) for a dense batch: the teacher's softmax over all buckets."""
+        logits, value = forward(self.p, X)
+        a = self.alpha
+        Pt = (1 - a) * Pt + a * softmax(logits / self.temperature)
+        return Pt.astype(np.float32), ((1 - a) * Vt + a * value).astype(np.float32)
+
+    def sparse(self, X, Vt, tgt, legal):
+        """(Vt, tgt) for a gather_sparse batch. The teacher's policy covers each
+        row's legal buckets, so the mixed target is given over all of them."""
+        logits, value = forward(self.p, X)
+        a = self.alpha
+        lr, lc = legal
+        seg = np.flatnonzero(np.diff(lr, prepend=-1))
+        L = logits[lr, lc] / self.temperature
+        e = np.exp(L - np.maximum.reduceat(L, seg)[lr])
+        P = np.zeros_like(logits)
+        tr, tc, tp = tgt
+        P[tr, tc] = (1 - a) * tp
+        P[lr, lc] += a * e / np.add.reduceat(e, seg)[lr]
+        return ((1 - a) * Vt + a * value).astype(np.float32), (lr, lc, P[lr, lc])
+
+
+def netbench(weights, evals, iters):
+    """(leaf evals/s, PUCT iterations/s) from `sw7 netbench`."""
+    out = subprocess.run([SW7, "netbench", weights, str(evals), str(iters)], check=True,
+                         capture_output=True, text=True).stdout
+    return (float(re.search(r"(\d+) leaf evals/sec", out).group(1)),
+            float(re.search(r"(\d+) PUCT iterations/sec", out).group(1)))
+
+
+def train_student(a, hidden, alpha, out):
+    trainer = os.path.join(HERE, "train.py" if a.trainer == "numpy" else "train_torch.py")
+    cmd = ["python3", trainer, *a.samples, "--out", out, "--epochs", str(a.epochs),
+           "--hidden", ",".join(map(str, hidden)), "--quantize", "int8"]
+    if alpha > 0:
+        cmd += ["--teacher", a.teacher, "--distill", str(alpha),
+                "--temperature", str(a.temperature)]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("teacher", help="float32 weights to distil")
+    ap.add_argument("samples", nargs="+", help="sample files and/or manifests")
+    ap.add_argument("--sizes", nargs="+", default=["32,32", "64,64", "128,128"],
+                    help="student hidden widths, one comma-separated list each")
+    ap.add_argument("--alpha", default="1.0", help="comma-separated teacher target weights")
+    ap.add_argument("--temperature", type=float, default=1.0)
+    ap.add_argument("--epochs", type=int, default=8)
+    ap.add_argument("--trainer", choices=["numpy", "torch"], default="numpy")
+    ap.add_argument("--games", type=int, default=20, help="league games per pair")
+    ap.add_argument("--iters", type=int, default=200, help="search iterations per move")
+    ap.add_argument("--anchor", action="append", default=[],
+                    help="extra league opponent: random, heN or - (repeatable)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--evals", type=int, default=100000, help="netbench leaf evals")
+    ap.add_argument("--rows", type=int, default=20000, help="rows compared with the teacher")
+    ap.add_argument("--dir", default=os.path.join(ROOT, "build", "distill"))
+    a = ap.parse_args()
+    os.makedirs(a.dir, exist_ok=True)
+
+    buf = ReplayBuffer.from_paths(a.samples)
+    dims = buf.dims
+    teacher = load_params(a.teacher, *dims)
+    q8 = a.teacher if weights_info(a.teacher)[0] == "int8" else export(a.teacher, "int8")[0]
+    nets = [("teacher", hidden_of(teacher), None, a.teacher, q8)]
+    for size in a.sizes:
+        hidden = tuple(int(w) for w in size.split(","))
+        for alpha in (float(x) for x in a.alpha.split(",")):
+            name = f"student_{'x'.join(map(str, hidden))}_a{alpha:g}"
+            out = os.path.join(a.dir, name + ".bin")
+            print(f"training {name} ...", flush=True)
+            train_student(a, hidden, alpha, out)  # also writes <name>.int8.bin
+            nets.append((name, hidden, alpha, out, os.path.join(a.dir, name + ".int8.bin")))
+
+    rows = []
+    for name, hidden, alpha, path, q8 in nets:
+        f32, f32_it = netbench(path, a.evals, a.iters)
+        i8, i8_it = netbench(q8, a.evals, a.iters)
+        c = compare(teacher, load_params(path, *dims), buf, a.rows)
+        rows.append({"net": name, "hidden": list(hidden), "alpha": alpha,
+                     "params": n_params(*dims, hidden), "weights": path,
+                     "evals_f32": f32, "evals_int8": i8, "iters_f32": f32_it,
+                     "iters_int8": i8_it, "policy_kl": c["policy_kl"],
+                     "top1_agree": c["top1_agree"], "max_dvalue": c["max_dvalue"],
+                     "mean_dvalue": c["mean_dvalue"]})
+        print(f"  {name}: {f32:,.0f} / {i8:,.0f} evals/s (f32 / int8), "
+              f"top-1 agreement {c['top1_agree']:.1%}", flush=True)
+
+    print(f"league: {len(nets)} nets, {a.games} games per pair at {a.iters} iters ...", flush=True)
+    table, _ = league.update([r["weights"] for r in rows], a.anchor, a.games, a.iters,
+                             a.workers, workdir=os.path.join(a.dir, "league"))
+    elo = {t["id"]: t["elo"] for t in table}
+    base = elo.get(league.player_id(a.teacher))
+    for r in rows:
+        e = elo.get(league.player_id(r["weights"]))
+        r["elo_vs_teacher"] = None if e is None or base is None else round(e - base, 1)
+
+    head = ("| net | hidden | params | f32 evals/s | int8 evals/s | int8 PUCT it/s | "
+            "speedup (int8) | top-1 agree | policy KL | mean dvalue | Elo vs teacher |")
+    lines = [head, "|" + "---|" * (head.count("|") - 1)]
+    t8 = rows[0]["evals_int8"]
+    for r in rows:
+        elo_s = "-" if r["elo_vs_teacher"] is None else f"{r['elo_vs_teacher']:+.0f}"
+        lines.append(f"| {r['net']} | {'x'.join(map(str, r['hidden']))} | {r['params']:,} | "
+                     f"{r['evals_f32']:,.0f} | {r['evals_int8']:,.0f} | {r['iters_int8']:,.0f} | "
+                     f"{r['evals_int8'] / t8:.2f}x | {r['top1_agree']:.1%} | "
+                     f"{max(r['policy_kl'], 0):.3f} | {r['mean_dvalue']:.3f} | {elo_s} |")
+    md = "\n".join(lines) + "\n"
+    with open(os.path.join(a.dir, "distill.md"), "w") as f:
+        f.write(f"Students of {a.teacher} ({a.games} games per pair at {a.iters} iters)\n\n" + md)
+    with open(os.path.join(a.dir, "distill.json"), "w") as f:
+        json.dump({"teacher": a.teacher, "samples": a.samples, "temperature": a.temperature,
+                   "epochs": a.epochs, "games": a.games, "iters": a.iters, "nets": rows},
+                  f, indent=2)
+    print(md, end="")
+    print(f"wrote {os.path.join(a.dir, 'distill.md')}, distill.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Batched inference with float32 weights over sample files: offline scoring of a
+blueprint against replay data without running search. Run from
+cpp/seven-wonders/.
+
+  python train/infer.py weights.bin samples.bin [more.bin | replay.txt ...]
+                        [--chunk 65536] [--topk 1,3,5] [--bins 10] [--json]
+                        [--dump ref.npz --dump-rows 64]
+
+`forward` is Net::eval (src/net.cpp) over a whole batch — the same layers in
+float32, or in sw7's int8 arithmetic for quantize()d params — so it doubles as
+the golden reference for the C++ matmuls; --dump saves features, logits and
+values of the first rows for such a comparison.
+
+Rows are scored `--chunk` at a time straight from the mapped files (SWSP or
+SWS2), so memory stays flat. Reported:
+
+  policy_ce     soft-target cross-entropy, over the legal buckets when the
+                files carry them (as train.py's loss), else all buckets
+  top{k}        fraction of rows whose most-visited bucket is in the net's k
+                highest (legal) logits
+  value mse/bce against the stored rank rewards, and a calibration table:
+                predicted values binned into --bins, mean prediction vs mean
+                target per bin, and the count-weighted gap (ECE)
+"""
+import argparse
+import json
+import time
+import numpy as np
+
+from replay import ReplayBuffer
+from train import hidden_of, layer_names, load_params
+
+
+def _affine(x, w, b):
+    if not isinstance(w, tuple):
+        return x @ w.T + b
+    scale, q = w
+    amax = np.abs(x).max(1, keepdims=True)
+    inv = np.divide(np.float32(32767), amax, out=np.zeros_like(amax), where=amax > 0)
+    xq = np.rint(x * inv)
+    acc = xq.astype(np.float64) @ q.T.astype(np.float64)  # exact, as sw7's int32 sums
+    return (b + scale * (amax / np.float32(32767)) * acc.astype(np.float32)).astype(np.float32)
+
+
+def forward(p, X):
+    """Batched Net::eval: (policy logits [B, pol], value [B, val] in [0, 1]), for
+    float params or quantize.quantize()d ones."""
+    h = X
+    for w, b in layer_names(hidden_of(p))[:-2]:
+        h = np.maximum(_affine(h, p[w], p[b]), 0)
+    return _affine(h, p["Wp"], p["bp"]), 1.0 / (1.0 + np.exp(-_affine(h, p["Wv"], p["bv"])))
+
+
+class Scorer:
+    """Accumulates policy agreement and value calibration over chunks."""
+
+    def __init__(self, topk=(1, 3, 5), bins=10):
+        self.topk, self.bins = sorted(topk), bins
+        self.n = 0
+        self.ce = 0.0
+        self.hits = np.zeros(len(self.topk), np.int64)
+        self.se = self.bce = 0.0
+        self.nv = 0
+        self.cnt = np.zeros(bins, np.int64)
+        self.sum_pred = np.zeros(bins)
+        self.sum_tgt = np.zeros(bins)
+
+    def add(self, logits, value, Pt, Vt, legal=None):
+        """legal: boolean [B, pol] mask of legal buckets, or None for all."""
+        if legal is not None:
+            logits = np.where(legal, logits, -np.inf)
+        z = logits - logits.max(1, keepdims=True)
+        logp = z - np.log(np.exp(z).sum(1, keepdims=True))
+        self.ce += float(-(Pt * np.where(Pt > 0, logp, 0)).sum())
+        best = Pt.argmax(1)
+        kmax = self.topk[-1]
+        top = np.argpartition(-logits, kmax - 1, 1)[:, :kmax] if kmax < logits.shape[1] else \
+            np.broadcast_to(np.arange(logits.shape[1]), logits.shape)
+        order = np.take_along_axis(logits, top, 1).argsort(1)[:, ::-1]
+        top = np.take_along_axis(top, order, 1)
+        for i, k in enumerate(self.topk):
+            self.hits[i] += int((top[:, :k] == best[:, None]).any(1).sum())
+        self.n += len(Pt)
+
+        v, t = value.ravel().astype(np.float64), Vt.ravel().astype(np.float64)
+        self.se += float(((v - t) ** 2).sum())
+        self.bce += float(-(t * np.log(v + 1e-9) + (1 - t) * np.log(1 - v + 1e-9)).sum())
+        self.nv += len(v)
+        b = np.minimum((v * self.bins).astype(np.int64), self.bins - 1)
+        self.cnt += np.bincount(b, minlength=self.bins)
+        self.sum_pred += np.bincount(b, v, self.bins)
+        self.sum_tgt += np.bincount(b, t, self.bins)
+
+    def result(self):
+        n, nv = max(self.n, 1), max(self.nv, 1)
+        cal = [{"lo": i / self.bins, "hi": (i + 1) / self.bins, "n": int(c),
+                "pred": float(sp / c), "target": float(st / c)}
+               for i, (c, sp, st) in enumerate(zip(self.cnt, self.sum_pred, self.sum_tgt)) if c]
+        ece = sum(c["n"] * abs(c["pred"] - c["target"]) for c in cal) / nv
+        return {"positions": self.n, "policy_ce": self.ce / n,
+                **{f"top{k}": float(h / n) for k, h in zip(self.topk, self.hits)},
+                "value_mse": self.se / nv, "value_bce": self.bce / nv, "value_ece": ece,
+                "calibration": cal}
+
+
+def score(p, buf, chunk=65536, topk=(1, 3, 5), bins=10):
+    """Score weights `p` over every row of `buf`; returns Scorer.result()."""
+    sc = Scorer(topk, bins)
+    pol = buf.dims[1]
+    for s in range(0, len(buf), chunk):
+        idx = np.arange(s, min(s + chunk, len(buf)))
+        legal = None
+        if buf.has_legal:
+            X, Vt, (tr, tc, tp), (lr, lc) = buf.gather_sparse(idx)
+            Pt = np.zeros((len(idx), pol), np.float32)
+            Pt[tr, tc] = tp
+            legal = np.zeros((len(idx), pol), bool)
+            legal[lr, lc] = True
+        else:
+            X, Pt, Vt = buf.gather(idx)
+        logits, value = forward(p, X)
+        sc.add(logits, value, Pt, Vt, legal)
+    return sc.result()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("weights")
+    ap.add_argument("samples", nargs="+", help="sample files and/or manifests")
+    ap.add_argument("--chunk", type=int, default=65536, help="rows per forward pass")
+    ap.add_argument("--topk", default="1,3,5")
+    ap.add_argument("--bins", type=int, default=10, help="value calibration bins")
+    ap.add_argument("--json", action="store_true", help="print the result as JSON")
+    ap.add_argument("--dump", default=None,
+                    help="save features/logits/values of the first rows (.npz) as a reference")
+    ap.add_argument("--dump-rows", type=int, default=64)
+    a = ap.parse_args()
+
+    buf = ReplayBuffer.from_paths(a.samples)
+    feat, pol, val = buf.dims
+    p = load_params(a.weights, feat, pol, val)
+    if a.dump:
+        X = buf.gather(np.arange(min(a.dump_rows, len(buf))))[0]
+        logits, value = forward(p, X)
+        np.savez(a.dump, features=X, logits=logits, value=value)
+
+    t0 = time.perf_counter()
+    r = score(p, buf, a.chunk, [int(k) for k in a.topk.split(",")], a.bins)
+    dt = time.perf_counter() - t0
+    r["seconds"] = round(dt, 3)
+    if a.json:
+        print(json.dumps(r, indent=2))
+        return
+    print(f"{r['positions']} positions ({len(buf.shards)} files) in {dt:.2f}s "
+          f"({r['positions'] / dt:,.0f}/s)  policy over {'legal' if buf.has_legal else 'all'} "
+          f"buckets")
+    print(f"  policy_ce={r['policy_ce']:.4f}  " + "  ".join(
+        f"{k}={v:.3f}" for k, v in r.items() if k.startswith("top")))
+    print(f"  value mse={r['value_mse']:.4f}  bce={r['value_bce']:.4f}  ece={r['value_ece']:.4f}")
+    print("  calibration     n      pred  target")
+    for c in r["calibration"]:
+        print(f"  [{c['lo']:.1f},{c['hi']:.1f}) {c['n']:8d}  {c['pred']:.3f}  {c['target']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
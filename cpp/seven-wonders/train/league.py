@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""League evaluation of weight snapshots: cached head-to-head games and an Elo
+table. Run from cpp/seven-wonders/.
+
+  python train/league.py build/w_*.bin [--anchor random --anchor he0 ...]
+                         [--games 20] [--iters 300] [--workers 8] [--dir build/league]
+
+A player is identified by content. A weights file is keyed by the SHA-256 of
+its bytes (first 16 hex digits). An anchor is keyed by its `sw7 match` spec:
+random, heN (heuristic archetype N) or - (search without a net). Every pair of
+players meets in `--games` games of `sw7 match`, seeds 1..games. Each game is
+appended to <dir>/games.jsonl, keyed by (A, B, iters, seed), with the pair in
+key order. A run schedules only the games missing from that cache, as sw7
+processes of up to `--batch` games on `--workers` threads. Adding a snapshot
+therefore costs only its own games, and renaming or moving files costs none.
+
+Ratings come from a Bradley-Terry fit over every cached game among the current
+players. Each (A seat, B seat) pair in a game scores 1 for the higher total and
+0.5 for a tie. The fit is warm-started from the previous table. Elo is
+400·log10 of the strengths, with the first anchor at 0 (the mean if there are
+no anchors). The table (Elo, score vs the field, games) is printed and written
+to <dir>/league.json.
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from loop import ROOT, SW7
+from replay import checksum
+
+
+def player_id(spec):
+    if os.path.isfile(spec):
+        return checksum(spec)[:16]
+    if spec in ("random", "-") or (spec.startswith("he") and spec[2:].isdigit()):
+        return spec
+    raise ValueError(f"not a weights file or agent spec: {spec}")
+
+
+def load_cache(path):
+    """Cached games by (a, b, iters, seed). A torn final line (the run was killed
+    mid-append) is cut off so later appends start on a clean line; those games
+    are simply replayed."""
+    cache = {}
+    if os.path.exists(path):
+        with open(path, "rb+") as f:
+            good = 0
+            for line in f:
+                if line.strip():
+                    try:
+                        r = json.loads(line)
+                    except ValueError:
+                        if f.read(1):
+                            raise
+                        break
+                    if not line.endswith(b"\n"):
+                        break
+                    cache[(r["a"], r["b"], r["iters"], r["seed"])] = r
+                good += len(line)
+            f.truncate(good)
+    return cache
+
+
+def missing_jobs(players, iters, games, cache, batch):
+    """[(spec_a, spec_b, id_a, id_b, first_seed, count)] for uncached games."""
+    jobs = []
+    ids = sorted(players)
+    for i, a in enumerate(ids):
+        for b in ids[i + 1:]:
+            todo = [s for s in range(1, games + 1) if (a, b, iters, s) not in cache]
+            run = []
+            for s in todo + [None]:  # contiguous seed runs, split into `batch`-game jobs
+                if run and (s is None or s != run[-1] + 1 or len(run) == batch):
+                    jobs.append((players[a], players[b], a, b, run[0], len(run)))
+                    run = []
+                if s is not None:
+                    run.append(s)
+    return jobs
+
+
+def play(job, iters):
+    spec_a, spec_b, a, b, seed, count = job
+    r = subprocess.run([SW7, "match", spec_a, spec_b, str(count), str(iters), str(seed)],
+                       capture_output=True, text=True, check=True)
+    out = []
+    for line in r.stdout.splitlines():
+        tag, s, pattern, *totals = line.split()
+        if tag == "game":
+            out.append({"a": a, "b": b, "iters": iters, "seed": int(s), "pattern": pattern,
+                        "totals": [int(t) for t in totals]})
+    return out
+
+
+def pair_scores(cache, ids, iters):
+    """(W, C): W[i, j] = points of i against j, C[i, j] = seat comparisons."""
+    k = {p: i for i, p in enumerate(ids)}
+    W = np.zeros((len(ids), len(ids)))
+    C = np.zeros_like(W)
+    for r in cache.values():
+        if r["iters"] != iters or r["a"] not in k or r["b"] not in k:
+            continue
+        ia, ib = k[r["a"]], k[r["b"]]
+        t = r["totals"]
+        for sa, pa in enumerate(r["pattern"]):
+            for sb, pb in enumerate(r["pattern"]):
+                if pa == "A" and pb == "B":
+                    w = 1.0 if t[sa] > t[sb] else 0.5 if t[sa] == t[sb] else 0.0
+                    W[ia, ib] += w
+                    W[ib, ia] += 1 - w
+                    C[ia, ib] += 1
+                    C[ib, ia] += 1
+    return W, C
+
+
+def fit_bt(W, C, init=None, iters=1000, tol=1e-9):
+    """Bradley-Terry strengths by minorize-maximize; nan for unplayed players."""
+    n = len(W)
+    played = C.sum(1) > 0
+    p = np.where(np.isnan(init), 1.0, init) if init is not None else np.ones(n)
+    # One virtual drawn comparison against a strength-1 player keeps all-win and
+    # all-loss players finite and pins the scale.
+    wins = W.sum(1) + 0.5
+    for _ in range(iters):
+        denom = (C / (p[:, None] + p[None, :])).sum(1) + 1.0 / (p + 1.0)
+        q = np.where(played, wins / denom, 1.0)
+        done = np.abs(q - p).max() < tol
+        p = q
+        if done:
+            break
+    return np.where(played, p, np.nan)
+
+
+def update(specs, anchors=(), games=20, iters=300, workers=None, batch=5,
+           workdir=os.path.join(ROOT, "build", "league")):
+    """Play the missing games among specs + anchors, refit, write league.json.
+    Returns (table rows best first, number of games played now)."""
+    os.makedirs(workdir, exist_ok=True)
+    players, names = {}, {}
+    for spec in list(anchors) + list(specs):
+        pid = player_id(spec)
+        players.setdefault(pid, os.path.abspath(spec) if os.path.isfile(spec) else spec)
+        names[pid] = os.path.basename(spec) if os.path.isfile(spec) else spec
+    games_path = os.path.join(workdir, "games.jsonl")
+    cache = load_cache(games_path)
+    jobs = missing_jobs(players, iters, games, cache, batch)
+    lock = threading.Lock()
+
+    def run(job):
+        recs = play(job, iters)
+        with lock, open(games_path, "a") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in recs))
+            f.flush()
+            for r in recs:
+                cache[(r["a"], r["b"], r["iters"], r["seed"])] = r
+
+    if jobs:
+        with ThreadPoolExecutor(workers or os.cpu_count()) as ex:
+            list(ex.map(run, jobs))
+
+    table_path = os.path.join(workdir, "league.json")
+    prev = {}
+    if os.path.exists(table_path):
+        with open(table_path) as f:
+            prev = {r["id"]: r["strength"] for r in json.load(f)["players"]}
+    ids = sorted(players)
+    W, C = pair_scores(cache, ids, iters)
+    init = np.array([prev.get(i, np.nan) for i in ids], float)
+    p = fit_bt(W, C, init)
+    logp = np.log10(p)
+    zero = 0.0
+    if anchors and not np.isnan(logp[ids.index(player_id(anchors[0]))]):
+        zero = logp[ids.index(player_id(anchors[0]))]
+    elif not np.isnan(logp).all():
+        zero = np.nanmean(logp)
+    rows = []
+    for i, pid in enumerate(ids):
+        comps = C[i].sum()
+        rows.append({"id": pid, "name": names[pid],
+                     "elo": None if np.isnan(p[i]) else round(400 * (logp[i] - zero), 1),
+                     "strength": None if np.isnan(p[i]) else float(p[i]),
+                     "score": float(W[i].sum() / comps) if comps else None,
+                     "comparisons": int(comps)})
+    rows.sort(key=lambda r: -(r["elo"] if r["elo"] is not None else -math.inf))
+    tmp = table_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"iters": iters, "games_per_pair": games, "new_games": sum(j[5] for j in jobs),
+                   "players": rows}, f, indent=2)
+    os.replace(tmp, table_path)
+    return rows, sum(j[5] for j in jobs)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("weights", nargs="*", help="snapshot files (w_*.bin)")
+    ap.add_argument("--anchor", action="append", default=[],
+                    help="fixed opponent: random, heN or - (repeatable; the first is Elo 0)")
+    ap.add_argument("--games", type=int, default=20, help="games per pair")
+    ap.add_argument("--iters", type=int, default=300, help="search iterations per move")
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--batch", type=int, default=5, help="games per sw7 process")
+    ap.add_argument("--dir", default=os.path.join(ROOT, "build", "league"))
+    a = ap.parse_args()
+    if len(a.weights) + len(a.anchor) < 2:
+        ap.error("need at least two players")
+    rows, new = update(a.weights, a.anchor, a.games, a.iters, a.workers, a.batch, a.dir)
+    print(f"league: {len(rows)} players, {new} new games (iters={a.iters}, "
+          f"{a.games} games/pair)")
+    print(f"  {'player':24s} {'elo':>7s} {'score':>6s} {'comparisons':>11s}")
+    for r in rows:
+        elo = f"{r['elo']:7.0f}" if r["elo"] is not None else f"{'-':>7s}"
+        score = f"{r['score']:6.3f}" if r["score"] is not None else f"{'-':>6s}"
+        print(f"  {r['name'][:24]:24s} {elo} {score} {r['comparisons']:11d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Streaming minibatch loader over a ReplayBuffer, with background prefetch.
+
+Minibatches are gathered from the mapped sample files on a small thread pool,
+`prefetch` batches ahead of the consumer, so row gathers (page faults + copies,
+which release the GIL) overlap with the trainer's matmuls. At most `prefetch`
+gathered batches are alive at once, so memory stays flat however big the
+window is.
+
+Two shuffle modes:
+  chunk=0  one global permutation per epoch (exactly `rng.permutation(n)`) —
+           uniform, but random access across the whole window.
+  chunk=K  the window is cut into contiguous runs of K rows (never crossing a
+           file); runs are visited in random order and `mix` runs at a time are
+           pooled and shuffled into batches. Reads stay near-sequential, which
+           is what makes windows larger than RAM train at full speed.
+
+  loader = BatchLoader(buf, batch=256, rng=rng, chunk=8192)
+  for X, Pt, Vt in loader.epoch():
+      ...
+
+With `sparse=True` batches come from `buf.gather_sparse` instead:
+(X, Vt, policy-target COO, legal buckets).
+
+`buf` may also be a replay.ReplayIndex (deduplicated / weighted samples): its
+sample() then supplies the epoch's order in place of the permutation (chunk=0
+only), and `indexed=True` yields (sample ids, batch) so the trainer can feed
+per-sample losses back with update().
+"""
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+class BatchLoader:
+    def __init__(self, buf, batch, rng, chunk=0, mix=4, prefetch=2, threads=2, sparse=False,
+                 indexed=False):
+        self.buf, self.batch, self.rng = buf, batch, rng
+        self.indexed = indexed
+        self.gather = buf.gather_sparse if sparse else buf.gather
+        self.chunk, self.mix = chunk, mix
+        self.prefetch, self.threads = prefetch, threads
+
+    def __len__(self):
+        return -(-len(self.buf) // self.batch)
+
+    def order(self):
+        """Yield one epoch of minibatch row indices (global rows)."""
+        n, B = len(self.buf), self.batch
+        if self.chunk <= 0:
+            idx = self.buf.sample(self.rng) if hasattr(self.buf, "sample") else \
+                self.rng.permutation(n)
+            for s in range(0, n, B):
+                yield idx[s:s + B]
+            return
+        runs = []
+        for lo, hi in zip(self.buf.offsets[:-1], self.buf.offsets[1:]):
+            runs += [(s, min(s + self.chunk, hi)) for s in range(lo, hi, self.chunk)]
+        perm = self.rng.permutation(len(runs))
+        carry = np.empty(0, np.int64)
+        for g in range(0, len(perm), self.mix):
+            pool = [carry] + [np.arange(*runs[r]) for r in perm[g:g + self.mix]]
+            idx = np.concatenate(pool)
+            self.rng.shuffle(idx)
+            full = len(idx) - len(idx) % B
+            for s in range(0, full, B):
+                yield np.sort(idx[s:s + B])  # ascending rows = sequential page reads
+            carry = idx[full:]
+        if len(carry):
+            yield np.sort(carry)
+
+    def epoch(self):
+        """Yield one epoch of minibatches, gathered ahead of use."""
+        with ThreadPoolExecutor(self.threads) as ex:
+            pending = collections.deque()
+            for bi in self.order():
+                pending.append((bi, ex.submit(self.gather, bi)))
+                if len(pending) > self.prefetch:
+                    yield self._ready(*pending.popleft())
+            while pending:
+                yield self._ready(*pending.popleft())
+
+    def _ready(self, bi, fut):
+        return (bi, fut.result()) if self.indexed else fut.result()
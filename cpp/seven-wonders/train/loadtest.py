@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Load test for the `sw7 move` deployment bridge. Run from cpp/seven-wonders/.
+
+  python train/loadtest.py [--iters 400,1200] [--dets 4] [--weights search,w.bin]
+                           [--concurrency 1,4] [--moves 60] [--timeout 8]
+                           [--positions build/positions.txt] [--games 40] [--seed 1]
+                           [--out report.json] [--baseline base.json] [--tolerance 0.25]
+                           [--save-baseline]
+
+The server spawns `sw7 move <weights> <iters> <dets>` per AI decision with the
+position on stdin (packages/server/src/sessions/cpp-agent.ts: SW7_WEIGHTS,
+SW7_ITERS=1200, SW7_DETS=4, an 8 s timeout). This replays positions from a
+corpus the same way, `--concurrency` requests at a time, for every combination
+of the --iters/--dets/--weights/--concurrency lists. `search` in --weights is
+the search-only agent (SW7_WEIGHTS=-).
+
+The corpus is `sw7 positions` output (every decision of seeded heuristic games,
+one position per line); it is generated into --positions if that file does not
+exist. Each configuration plays the same --moves positions, drawn at random
+from the corpus, so configurations are comparable and reruns are repeatable.
+
+Per configuration: latency percentiles (spawn to exit, so process start and the
+weights load count, as they do in production), moves/s at that concurrency, CPU
+per move (the child's user+sys time), and errors (non-zero exit, timeout, or
+output that is not a move; any makes the exit status 1). CPU per move sizes an
+instance: a core serves about 1000 / cpu_ms moves per second, and p95/p99 at a
+concurrency show how much queueing the players see at that load.
+
+The report is bench.py's JSON ({meta, results}, one {value, unit, better} entry
+per metric), so `--baseline` compares the same way: a metric worse than the
+baseline by more than --tolerance is a regression and the exit status is 1.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from bench import compare, metric
+from loop import SW7
+
+SEARCH = "search"  # --weights entry for the search-only agent (`sw7 move -`)
+
+
+def make_corpus(path, games, seed):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    subprocess.run([SW7, "positions", str(games), path, str(seed), "1"], check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+def load_corpus(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def one_move(weights, iters, dets, position, timeout):
+    """Run one `sw7 move`; (wall seconds, child CPU seconds, ok)."""
+    weights = "-" if weights == SEARCH else weights
+    t0 = time.perf_counter()
+    p = subprocess.Popen([SW7, "move", weights, str(iters), str(dets)], stdin=subprocess.PIPE,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    timer = threading.Timer(timeout, p.kill)
+    timer.start()
+    try:
+        p.stdin.write(position.encode() + b"\n")
+        p.stdin.close()
+        out = p.stdout.read()
+        _, status, ru = os.wait4(p.pid, 0)  # reaps the child, with its rusage
+    finally:
+        timer.cancel()
+        p.stdout.close()
+    p.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - t0
+    fields = out.split()
+    ok = p.returncode == 0 and len(fields) == 5 and all(f.lstrip(b"-").isdigit() for f in fields)
+    return wall, ru.ru_utime + ru.ru_stime, ok
+
+
+def run_config(positions, weights, iters, dets, concurrency, timeout):
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as ex:
+        rows = list(ex.map(lambda pos: one_move(weights, iters, dets, pos, timeout), positions))
+    elapsed = time.perf_counter() - t0
+    wall = np.array([r[0] for r in rows])
+    cpu = np.array([r[1] for r in rows])
+    errors = sum(not r[2] for r in rows)
+    ages = np.array([int(pos.split()[1]) for pos in positions])
+    p50, p95, p99 = np.percentile(wall, [50, 95, 99]) * 1000
+    return dict(moves=len(rows), errors=errors, p50=p50, p95=p95, p99=p99,
+                max=wall.max() * 1000, rate=len(rows) / elapsed, cpu=cpu.mean() * 1000,
+                by_age={int(a): float(np.median(wall[ages == a]) * 1000) for a in np.unique(ages)})
+
+
+def label(iters, dets, weights, concurrency):
+    w = weights if weights in (SEARCH, "-") else os.path.basename(weights)
+    return f"move it={iters} dets={dets} w={w} c={concurrency}"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--iters", default="1200", help="comma-separated SW7_ITERS values")
+    ap.add_argument("--dets", default="4", help="comma-separated SW7_DETS values")
+    ap.add_argument("--weights", default=SEARCH,
+                    help="comma-separated weights files, or 'search' for search only")
+    ap.add_argument("--concurrency", default=",".join(dict.fromkeys(["1", str(os.cpu_count())])),
+                    help="comma-separated numbers of moves in flight")
+    ap.add_argument("--moves", type=int, default=60, help="positions played per configuration")
+    ap.add_argument("--timeout", type=float, default=8.0, help="seconds (the server's timeout)")
+    ap.add_argument("--positions", default=os.path.join("build", "positions.txt"))
+    ap.add_argument("--games", type=int, default=40, help="games for a new corpus")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default=None, help="write the report JSON here")
+    ap.add_argument("--baseline", default=None, help="compare against this report")
+    ap.add_argument("--tolerance", type=float, default=0.25,
+                    help="relative slowdown allowed before a metric counts as a regression")
+    ap.add_argument("--save-baseline", action="store_true")
+    a = ap.parse_args()
+    if a.save_baseline and not a.baseline:
+        ap.error("--save-baseline needs --baseline")
+    if not os.path.exists(SW7):
+        sys.exit(f"{SW7} not found; run `make agent` (the deploy build) first")
+    if not os.path.exists(a.positions):
+        make_corpus(a.positions, a.games, a.seed)
+    corpus = load_corpus(a.positions)
+    rng = np.random.default_rng(a.seed)
+    positions = [corpus[i] for i in rng.choice(len(corpus), min(a.moves, len(corpus)),
+                                                replace=False)]
+    grid = list(itertools.product([int(v) for v in a.iters.split(",")],
+                                  [int(v) for v in a.dets.split(",")], a.weights.split(","),
+                                  [int(v) for v in a.concurrency.split(",")]))
+    print(f"{len(positions)} positions from {a.positions} ({len(corpus)} in the corpus), "
+          f"{len(grid)} configuration(s), {os.cpu_count()} CPUs")
+    print(f"  {'configuration':40s} {'p50':>7s} {'p95':>7s} {'p99':>7s} {'max':>7s} "
+          f"{'moves/s':>8s} {'cpu ms':>7s} {'err':>4s}")
+    res, detail = {}, {}
+    for iters, dets, weights, conc in grid:
+        name = label(iters, dets, weights, conc)
+        r = run_config(positions, weights, iters, dets, conc, a.timeout)
+        detail[name] = r
+        print(f"  {name:40s} {r['p50']:7.0f} {r['p95']:7.0f} {r['p99']:7.0f} {r['max']:7.0f} "
+              f"{r['rate']:8.2f} {r['cpu']:7.0f} {r['errors']:4d}", flush=True)
+        res[f"{name} p50"] = metric(r["p50"], "ms", "lower")
+        res[f"{name} p95"] = metric(r["p95"], "ms", "lower")
+        res[f"{name} p99"] = metric(r["p99"], "ms", "lower")
+        res[f"{name} rate"] = metric(r["rate"], "moves/s", "higher")
+        res[f"{name} cpu"] = metric(r["cpu"], "ms/move", "lower")
+    print("latency in ms; a core serves ~1000 / (cpu ms) moves/s. Median ms by age:")
+    for name, r in detail.items():
+        print(f"  {name:40s} " + "  ".join(f"age {k}: {v:.0f}" for k, v in r["by_age"].items()))
+    doc = {"meta": {"machine": platform.machine(), "cpus": os.cpu_count(), "sw7": SW7,
+                    "positions": a.positions, "moves": len(positions), "seed": a.seed,
+                    "timeout": a.timeout,
+                    "errors": {k: r["errors"] for k, r in detail.items()},
+                    "by_age_p50_ms": {k: r["by_age"] for k, r in detail.items()}},
+           "results": res}
+    if a.out:
+        with open(a.out, "w") as f:
+            json.dump(doc, f, indent=2)
+            f.write("\n")
+    errors = sum(r["errors"] for r in detail.values())
+    if errors:
+        print(f"{errors} move(s) failed (exit status, timeout or malformed output)")
+    if a.save_baseline:
+        with open(a.baseline, "w") as f:
+            json.dump(doc, f, indent=2)
+            f.write("\n")
+        print(f"wrote baseline -> {a.baseline}")
+    elif a.baseline:
+        with open(a.baseline) as f:
+            base = json.load(f)["results"]
+        bad = compare(res, base, a.tolerance)
+        if bad:
+            print(f"{len(bad)} regression(s) beyond {a.tolerance:.0%}: {', '.join(bad)}")
+            sys.exit(1)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
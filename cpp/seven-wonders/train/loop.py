@@ -3,41 +3,203 @@
 with a replay-buffer window. Run from cpp/seven-wonders/.
 
   python train/loop.py --iters 30 --games 400 --sp-iters 400 \
-                       --eval-iters 400 --window 4 --trainer torch
+                       --eval-iters 400 --window 4 --trainer torch [--sp-workers 32]
 
 Iteration 0 bootstraps from rollout (M0) self-play; each later iteration plays
 with the current net (PUCT), retrains on the last `--window` sample files, and
-evaluates vs random. Swap `--trainer numpy` for the CPU/no-torch path.
+evaluates vs random. Swap `--trainer numpy` for the CPU/no-torch path. The
+window is handed to the trainer as a manifest (replay.txt) and memory-mapped in
+place — sample files are never re-merged.
+
+Self-play is single-threaded per `sw7` process, so each iteration's games are
+sharded across `--sp-workers` concurrent processes (distinct seeds); a failed
+shard is retried, and the shards are joined into the iteration's data file.
+See pipeline.py for the asynchronous actor/learner variant of this loop.
+
+Every phase of every iteration appends a JSON line (wall/CPU time, peak RSS,
+counts, throughput) to `--metrics` (default <workdir>/metrics.jsonl), and the
+trainer adds one per epoch; `python train/metrics.py summarize FILE` tabulates
+them (see metrics.py).
+
+Progress is recorded in <workdir>/run.json, rewritten atomically after every
+phase: the iteration, the phases it has finished, and each sample and weights
+file with its size and SHA-256. `--resume` continues from the last finished
+phase after validating the files it still needs — the last `--window` sample
+files and the latest weights (magic/header, size, checksum) — so a crash costs
+at most the phase it interrupted. Older sample files stay listed as history and
+may be deleted to free disk. Outputs are written to a temp name and renamed
+into place, so a killed run never leaves a truncated file under a real name.
+
+`--league-games N` also rates every snapshot so far against each other and a
+random anchor after each iteration (league.py); its game cache makes that cost
+only the new snapshot's games.
+
+`--dedup`, `--recency H` and `--priority A` are passed to the trainer, which
+then samples the window through replay.ReplayIndex (duplicate positions merged,
+newer files and high-loss samples drawn more often). `--hidden 64,64` sets the
+net's hidden widths (the first trainer run picks them; later runs inherit them
+through --init).
+
+`--stream` runs each iteration's self-play and training together: the shards
+write into named pipes (<workdir>/streams) that the trainer reads alongside the
+previous `--window - 1` files, so training starts on the first finished games,
+and the trainer writes the iteration's data file once at the end
+(`--stream-out`). Shards are not retried in this mode (their games were already
+trained on); a failed shard fails the iteration. Not with --dedup/--recency/
+--priority.
 """
 import argparse
+import json
 import os
-import struct
+import re
 import subprocess
-import numpy as np
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from convert import to_compact
+from metrics import Recorder
+from replay import (ReplayBuffer, check_sample_file, checksum, concat, open_shard,
+                    write_manifest)
+from train import check_weights
 
 ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SW7 = os.path.join(ROOT, "build", "sw7")
-SP_MAGIC = 0x53575350
-
-
-def merge(files, out):
-    Fs, Ps, Vs = [], [], []
-    feat = pol = val = None
-    for path in files:
-        with open(path, "rb") as f:
-            magic, n, ft, pl, vl = struct.unpack("<Iiiii", f.read(20))
-            assert magic == SP_MAGIC
-            feat, pol, val = ft, pl, vl
-            Fs.append(np.frombuffer(f.read(4 * n * ft), np.float32).reshape(n, ft))
-            Ps.append(np.frombuffer(f.read(4 * n * pl), np.float32).reshape(n, pl))
-            Vs.append(np.frombuffer(f.read(4 * n * vl), np.float32).reshape(n, vl))
-    F, P, V = np.vstack(Fs), np.vstack(Ps), np.vstack(Vs)
-    with open(out, "wb") as f:
-        f.write(struct.pack("<Iiiii", SP_MAGIC, F.shape[0], feat, pol, val))
-        f.write(F.astype(np.float32).tobytes())
-        f.write(P.astype(np.float32).tobytes())
-        f.write(V.astype(np.float32).tobytes())
-    return F.shape[0]
+SEED_STRIDE = 1000003  # per-shard seed offset; keeps shard deals disjoint
+
+
+def selfplay(sp, games, iters, out, weights, seed, workers, retries):
+    """Play `games` as `workers` concurrent `sw7 <sp>` shards; join into `out`.
+
+    Shard k plays its share of the games with seed `seed + k*SEED_STRIDE`, so
+    one worker reproduces the unsharded run. A shard that exits non-zero is
+    rerun (same seed) up to `retries` times before the iteration fails.
+    Returns the number of samples written.
+    """
+    workers = max(1, min(workers, games))
+    parts = [f"{out}.part{k}" for k in range(workers)]
+
+    def run(k):
+        cmd = shard_cmd(sp, games, iters, parts[k], weights, seed, workers, k)
+        for attempt in range(retries + 1):
+            r = subprocess.run(cmd, capture_output=True, text=True)
+            if r.returncode == 0:
+                return
+            print(f"  shard {k}: exit {r.returncode} (attempt {attempt + 1}/{retries + 1})\n"
+                  f"{r.stderr[-2000:]}", flush=True)
+        raise RuntimeError(f"self-play shard {k} failed {retries + 1} times: {' '.join(cmd)}")
+
+    with ThreadPoolExecutor(workers) as ex:
+        list(ex.map(run, range(workers)))
+    n = concat(parts, out)
+    for p in parts:
+        os.remove(p)
+    return n
+
+
+def shard_cmd(sp, games, iters, out, weights, seed, workers, k):
+    """`sw7` command line for shard k of `workers`."""
+    share = games // workers + (k < games % workers)
+    return [SW7, sp, str(share), str(iters), out, weights or "-",
+            str((seed + k * SEED_STRIDE) % 2**32)]
+
+
+def stream_selfplay(sp, games, iters, weights, seed, workers, fifodir):
+    """Start selfplay()'s shards writing into named pipes under `fifodir` (see
+    replay.StreamShard) instead of files. Returns [(process, pipe, log)]; a
+    shard blocks until the trainer opens its pipe."""
+    workers = max(1, min(workers, games))
+    os.makedirs(fifodir, exist_ok=True)
+    shards = []
+    for k in range(workers):
+        fifo = os.path.join(fifodir, f"shard{k}.fifo")
+        if os.path.exists(fifo):
+            os.remove(fifo)
+        os.mkfifo(fifo)
+        log = os.path.join(fifodir, f"shard{k}.log")
+        with open(log, "w") as err:
+            proc = subprocess.Popen(shard_cmd(sp, games, iters, fifo, weights, seed, workers, k),
+                                    stdout=subprocess.DEVNULL, stderr=err)
+        shards.append((proc, fifo, log))
+    return shards
+
+
+def train_cmd(a, trainer, inputs, out, init, metrics):
+    tc = ["python3", trainer, *inputs, "--out", out, "--epochs", str(a.epochs),
+          "--metrics", metrics]
+    if init:
+        tc += ["--init", init]
+    elif a.hidden:
+        tc += ["--hidden", a.hidden]
+    if a.dedup:
+        tc.append("--dedup")
+    if a.recency > 0:
+        tc += ["--recency", str(a.recency)]
+    if a.priority > 0:
+        tc += ["--priority", str(a.priority)]
+    return tc
+
+
+class RunState:
+    """run.json: what a loop.py run has finished, for --resume."""
+
+    def __init__(self, path, run):
+        self.path = path
+        self.s = {"version": 1, "run": run, "iter": 0, "done": [], "samples": [],
+                  "weights": None, "prev_w": None, "trained": 0}
+
+    @classmethod
+    def load(cls, path, window):
+        """Read run.json and validate the files the run still reads: the last
+        `window` sample files and the weights. Older samples are history only."""
+        st = cls(path, None)
+        with open(path) as f:
+            st.s = json.load(f)
+        live = st.s["samples"][-window:]
+        for e in live + [e for e in (st.s["weights"], st.s["prev_w"]) if e]:
+            why = st.invalid(e)
+            if why:
+                raise SystemExit(f"--resume: {e['path']} {why}; remove it from {path} "
+                                 f"or start a fresh run")
+        return st
+
+    @staticmethod
+    def entry(path, kind):
+        return {"path": path, "kind": kind, "size": os.path.getsize(path),
+                "sha256": checksum(path)}
+
+    @staticmethod
+    def invalid(e):
+        """Why a recorded file can't be used, or None."""
+        path = e["path"]
+        if not os.path.exists(path):
+            return "is missing"
+        if not (check_weights(path) if e["kind"] == "weights" else check_sample_file(path)):
+            return "has a bad header or is truncated"
+        if os.path.getsize(path) != e["size"] or checksum(path) != e["sha256"]:
+            return "does not match its recorded size/checksum"
+        return None
+
+    def finish(self, it, phase, **updates):
+        """Record `phase` of iteration `it` as complete (atomically)."""
+        self.s["done"].append(phase)
+        self.s.update(updates)
+        self._save()
+
+    def advance(self, it, **updates):
+        """Iteration `it` is next, with nothing done yet."""
+        self.s.update(iter=it, done=[], **updates)
+        self._save()
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.s, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def done(self, it, phase):
+        return self.s["iter"] == it and phase in self.s["done"]
 
 
 def main():
@@ -52,40 +214,177 @@ def main():
     ap.add_argument("--trainer", choices=["numpy", "torch"], default="numpy")
     ap.add_argument("--population", action="store_true",
                     help="generate data vs heuristic archetypes (robustness, PSRO-lite)")
+    ap.add_argument("--sp-workers", type=int, default=os.cpu_count(),
+                    help="concurrent self-play processes per iteration")
+    ap.add_argument("--sp-retries", type=int, default=2, help="reruns of a failed shard")
+    ap.add_argument("--dedup", action="store_true",
+                    help="trainer merges duplicate positions in the window "
+                         "(see replay.ReplayIndex)")
+    ap.add_argument("--recency", type=float, default=0.0,
+                    help="trainer sampling half-life in window files (0 = uniform)")
+    ap.add_argument("--priority", type=float, default=0.0,
+                    help="trainer samples proportionally to last loss ** PRIORITY (0 = uniform)")
+    ap.add_argument("--hidden", default=None,
+                    help="hidden layer widths of the first net, e.g. 64,64 (later ones inherit)")
+    ap.add_argument("--stream", action="store_true",
+                    help="stream self-play into the trainer through named pipes")
+    ap.add_argument("--compact", action="store_true",
+                    help="store iteration samples as compact SWS2 (see convert.py)")
     ap.add_argument("--workdir", default=os.path.join(ROOT, "build"))
+    ap.add_argument("--league-games", type=int, default=0,
+                    help="games per pair in the snapshot league after each iteration (0 = off)")
+    ap.add_argument("--metrics", default=None,
+                    help="per-phase JSONL metrics file (default <workdir>/metrics.jsonl)")
+    ap.add_argument("--resume", action="store_true",
+                    help="continue the run recorded in <workdir>/run.json")
     a = ap.parse_args()
+    if a.stream and (a.dedup or a.recency > 0 or a.priority > 0):
+        ap.error("--stream does not combine with --dedup/--recency/--priority")
     os.makedirs(a.workdir, exist_ok=True)
+    state_path = os.path.join(a.workdir, "run.json")
+    if a.resume and os.path.exists(state_path):
+        st = RunState.load(state_path, a.window)
+        print(f"resuming run {st.s['run']} at iter {st.s['iter']} "
+              f"(done: {', '.join(st.s['done']) or 'nothing'})", flush=True)
+    else:
+        if a.resume:
+            print(f"--resume: no {state_path}; starting a fresh run", flush=True)
+        st = RunState(state_path, time.strftime("%Y%m%d-%H%M%S"))
+    rec = Recorder(a.metrics or os.path.join(a.workdir, "metrics.jsonl"), run=st.s["run"])
     trainer = os.path.join(ROOT, "train", "train.py" if a.trainer == "numpy" else "train_torch.py")
 
-    sample_files = []
-    prev_w = None
-    for it in range(a.iters):
-        data = os.path.join(a.workdir, f"data_{it}.bin")
+    sample_files = [e["path"] for e in st.s["samples"]]
+    prev_w = st.s["prev_w"] and st.s["prev_w"]["path"]
+    trained = trained0 = st.s["trained"]
+    t_start = time.perf_counter()
+    for it in range(st.s["iter"], a.iters):
+        t_sp = t_tr = t_ev = 0.0
+        w = os.path.join(a.workdir, f"w_{it}.bin")
         sp = "selfplay-pop" if a.population else "selfplay"
-        cmd = [SW7, sp, str(a.games), str(a.sp_iters), data]
-        if prev_w:
-            cmd += [prev_w, str(1000 + it)]
         mode = ("PUCT" if prev_w else "rollout") + ("/pop" if a.population else "/self")
-        print(f"\n=== iter {it}: self-play ({mode}) ===", flush=True)
-        subprocess.run(cmd, check=True)
-        sample_files.append(data)
+        if a.stream and not st.done(it, "selfplay"):
+            data = os.path.join(a.workdir, f"data_{it}.bin")
+            window = sample_files[-(a.window - 1):] if a.window > 1 else []
+            manifest = os.path.join(a.workdir, "replay.txt")
+            write_manifest(manifest, window)
+            total = len(ReplayBuffer.from_paths(window))
+            print(f"\n=== iter {it}: self-play ({mode}, {a.sp_workers} workers) streamed into "
+                  f"training on {total} samples ({len(window)} files) ===", flush=True)
+            t0 = time.perf_counter()
+            with rec.phase("selfplay+train", iter=it, mode=mode, workers=a.sp_workers,
+                           trainer=a.trainer, epochs=a.epochs) as m:
+                shards = stream_selfplay(sp, a.games, a.sp_iters, prev_w, 1000 + it,
+                                         a.sp_workers, os.path.join(a.workdir, "streams"))
+                tc = train_cmd(a, trainer, [manifest] + [f for _, f, _ in shards], w, prev_w,
+                               rec.path)
+                trained_ok = False
+                try:
+                    subprocess.run(tc + ["--stream-out", data], check=True, env=rec.env(iter=it))
+                    trained_ok = True
+                finally:
+                    for proc, fifo, _ in shards:
+                        if not trained_ok:
+                            proc.kill()  # don't leave writers blocked on a dead trainer's pipe
+                        proc.wait()
+                        os.remove(fifo)
+                for k, (proc, _, log) in enumerate(shards):
+                    if proc.returncode:
+                        with open(log) as f:
+                            print(f"  shard {k}: exit {proc.returncode}\n{f.read()[-2000:]}")
+                        raise RuntimeError(f"streamed self-play shard {k} failed")
+                ns = open_shard(data).n
+                m.update(games=a.games, samples=ns)
+            t_sp = time.perf_counter() - t0
+            print(f"  {a.games} games, {ns} samples streamed and trained in {t_sp:.1f}s",
+                  flush=True)
+            if a.compact:
+                compact = data[:-4] + ".sws2"
+                with rec.phase("compact", iter=it) as m:
+                    to_compact(open_shard(data), compact)
+                    m.update(samples=ns, bytes=os.path.getsize(compact))
+                os.remove(data)
+                data = compact
+            sample_files.append(data)
+            trained += (total + ns) * a.epochs
+            st.finish(it, "selfplay",
+                      samples=st.s["samples"] + [RunState.entry(data, "samples")])
+            st.finish(it, "train", weights=RunState.entry(w, "weights"), trained=trained)
+        elif not st.done(it, "selfplay"):
+            data = os.path.join(a.workdir, f"data_{it}.bin")
+            print(f"\n=== iter {it}: self-play ({mode}, {a.sp_workers} workers) ===", flush=True)
+            t0 = time.perf_counter()
+            with rec.phase("selfplay", iter=it, mode=mode, workers=a.sp_workers) as m:
+                ns = selfplay(sp, a.games, a.sp_iters, data, prev_w, 1000 + it, a.sp_workers,
+                              a.sp_retries)
+                m.update(games=a.games, samples=ns)
+            t_sp = time.perf_counter() - t0
+            print(f"  {a.games} games, {ns} samples in {t_sp:.1f}s "
+                  f"({a.games / t_sp:.2f} games/s)", flush=True)
+            if a.compact:
+                compact = data[:-4] + ".sws2"
+                with rec.phase("compact", iter=it) as m:
+                    to_compact(open_shard(data), compact)
+                    m.update(samples=ns, bytes=os.path.getsize(compact))
+                os.remove(data)
+                data = compact
+            sample_files.append(data)
+            st.finish(it, "selfplay",
+                      samples=st.s["samples"] + [RunState.entry(data, "samples")])
+        else:
+            print(f"\n=== iter {it}: self-play already done ({sample_files[-1]}) ===",
+                  flush=True)
 
-        window = sample_files[-a.window:]
-        merged = os.path.join(a.workdir, "replay.bin")
-        total = merge(window, merged)
-        w = os.path.join(a.workdir, f"w_{it}.bin")
-        print(f"=== iter {it}: train on {total} samples ({len(window)} files) ===", flush=True)
-        tc = ["python3", trainer, merged, "--out", w, "--epochs", str(a.epochs)]
-        if prev_w:
-            tc += ["--init", prev_w]
-        subprocess.run(tc, check=True)
-
-        print(f"=== iter {it}: eval ===", flush=True)
-        ev = ["evalpop", w] if a.population else ["evalnet", w]
-        subprocess.run([SW7, *ev, str(a.eval_games), str(a.eval_iters)], check=True)
+        if not st.done(it, "train"):
+            window = sample_files[-a.window:]
+            manifest = os.path.join(a.workdir, "replay.txt")
+            with rec.phase("window", iter=it, files=len(window)) as m:
+                write_manifest(manifest, window)
+                total = len(ReplayBuffer.from_paths(window))
+                m["samples"] = total
+            print(f"=== iter {it}: train on {total} samples ({len(window)} files) ===",
+                  flush=True)
+            tc = train_cmd(a, trainer, [manifest], w, prev_w, rec.path)
+            t0 = time.perf_counter()
+            with rec.phase("train", iter=it, trainer=a.trainer, epochs=a.epochs) as m:
+                subprocess.run(tc, check=True, env=rec.env(iter=it))
+                m["samples"] = total * a.epochs
+            t_tr = time.perf_counter() - t0
+            trained += total * a.epochs
+            st.finish(it, "train", weights=RunState.entry(w, "weights"), trained=trained)
+
+        if not st.done(it, "eval"):
+            print(f"=== iter {it}: eval ===", flush=True)
+            ev = ["evalpop", w] if a.population else ["evalnet", w]
+            t0 = time.perf_counter()
+            with rec.phase("eval", iter=it) as m:
+                r = subprocess.run([SW7, *ev, str(a.eval_games), str(a.eval_iters)],
+                                   check=True, capture_output=True, text=True)
+                m["games"] = a.eval_games
+                rank = re.search(r"avg rank:\s*([\d.]+)", r.stdout)
+                if rank:
+                    m["avg_rank"] = float(rank.group(1))
+            print(r.stdout, end="", flush=True)
+            t_ev = time.perf_counter() - t0
+            st.finish(it, "eval")
         prev_w = w
+        if a.league_games and not st.done(it, "league"):
+            from league import update as league_update  # league.py imports this module
+            with rec.phase("league", iter=it) as m:
+                snaps = [os.path.join(a.workdir, f"w_{k}.bin") for k in range(it + 1)]
+                rows, m["games"] = league_update(snaps, ["random"], a.league_games,
+                                                 a.eval_iters, a.sp_workers,
+                                                 workdir=os.path.join(a.workdir, "league"))
+            best = next(r for r in rows if r["name"] != "random")
+            print(f"  league: {m['games']} new games; best {best['name']} "
+                  f"(elo {best['elo']})", flush=True)
+            st.finish(it, "league")
+        st.advance(it + 1, prev_w=st.s["weights"])
+        print(f"=== iter {it}: self-play {t_sp:.1f}s  train {t_tr:.1f}s  eval {t_ev:.1f}s  "
+              f"total {t_sp + t_tr + t_ev:.1f}s ===", flush=True)
 
-    print(f"\ndone. latest blueprint: {prev_w}")
+    hours = (time.perf_counter() - t_start) / 3600
+    print(f"\ndone. latest blueprint: {prev_w}  "
+          f"({(trained - trained0) / hours:,.0f} samples trained/hour)")
 
 
 if __name__ == "__main__":
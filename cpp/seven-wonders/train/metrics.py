@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Structured per-phase metrics for the training loop, as JSONL.
+
+loop.py wraps each phase of an iteration (self-play, compaction, window open,
+train, eval) in Recorder.phase(), which appends one JSON line with wall time,
+CPU time of this process and of its waited-for children (`getrusage`), peak
+RSS, counts and throughput. The trainers' `--metrics FILE` appends one line
+per epoch (losses, steps/s, samples/s) to the same file; the loop passes its
+run id and iteration down through the SW_METRICS_CTX environment variable, so
+every line carries them.
+
+  rec = Recorder("build/metrics.jsonl", run="20260101-120000")
+  with rec.phase("selfplay", iter=3) as m:
+      m["samples"] = selfplay(...)
+      m["games"] = 400
+
+  python train/metrics.py summarize build/metrics.jsonl [--run ID]
+
+A phase line holds: run, iter, phase, t (unix time at the end), wall_s,
+cpu_s (user+sys, self + children), child_cpu_s, rss_mb (this process's peak),
+child_rss_mb (peak RSS of the largest child so far — getrusage only keeps a
+high-water mark), plus whatever the phase filled in; counts named `samples`
+or `games` also get a per-second rate. Epoch lines have phase "epoch".
+"""
+import argparse
+import collections
+import contextlib
+import json
+import os
+import resource
+import sys
+import time
+
+CTX_ENV = "SW_METRICS_CTX"
+
+
+def _usage():
+    s = resource.getrusage(resource.RUSAGE_SELF)
+    c = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return s.ru_utime + s.ru_stime, c.ru_utime + c.ru_stime, s.ru_maxrss, c.ru_maxrss
+
+
+class Recorder:
+    """Appends metric records to a JSONL file (no-op when path is None)."""
+
+    def __init__(self, path, **ctx):
+        self.path = path
+        self.ctx = {**json.loads(os.environ.get(CTX_ENV, "{}")), **ctx}
+
+    def env(self, **ctx):
+        """Environment for a child process whose records should carry ctx."""
+        return {**os.environ, CTX_ENV: json.dumps({**self.ctx, **ctx})}
+
+    def write(self, **fields):
+        if self.path is None:
+            return
+        rec = {**self.ctx, "t": round(time.time(), 3), **fields}
+        with open(self.path, "a") as f:  # one short append per line; safe across processes
+            f.write(json.dumps(rec) + "\n")
+
+    @contextlib.contextmanager
+    def phase(self, name, **fields):
+        """Time a block; the yielded dict collects extra fields for the record."""
+        extra = {}
+        cpu0, ccpu0, _, _ = _usage()
+        t0 = time.perf_counter()
+        yield extra
+        wall = time.perf_counter() - t0
+        cpu1, ccpu1, rss, crss = _usage()
+        rec = {"phase": name, **fields, "wall_s": round(wall, 4),
+               "cpu_s": round(cpu1 - cpu0 + ccpu1 - ccpu0, 4),
+               "child_cpu_s": round(ccpu1 - ccpu0, 4),
+               "rss_mb": round(rss / 1024, 1), "child_rss_mb": round(crss / 1024, 1)}
+        for key in ("samples", "games"):
+            if key in extra and wall > 0:
+                extra[f"{key}_per_s"] = round(extra[key] / wall, 2)
+        self.write(**rec, **extra)
+
+
+def load(paths, run=None):
+    recs = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    recs.append(json.loads(line))
+    return [r for r in recs if run is None or r.get("run") == run]
+
+
+def summarize(recs, cliff=0.3):
+    """Print per-phase totals, then a per-iteration table of wall time and
+    throughput; a rate that falls more than `cliff` below the previous
+    iteration's is marked with '!'."""
+    phases = [r for r in recs if r.get("phase") != "epoch"]
+    if not phases:
+        print("no phase records")
+        return
+    by = collections.defaultdict(list)
+    for r in phases:
+        by[r["phase"]].append(r)
+    print(f"{'phase':10s} {'n':>4s} {'wall_s':>9s} {'cpu_s':>9s} {'cpu/wall':>8s} "
+          f"{'rss_mb':>8s} {'child_rss':>9s}  rate")
+    for name, rs in by.items():
+        wall = sum(r["wall_s"] for r in rs)
+        cpu = sum(r["cpu_s"] for r in rs)
+        rate = ""
+        for key, unit in (("samples_per_s", "samples/s"), ("games_per_s", "games/s")):
+            vals = [r[key] for r in rs if key in r]
+            if vals:
+                rate = f"{sum(vals) / len(vals):,.1f} {unit} (mean)"
+                break
+        print(f"{name:10s} {len(rs):4d} {wall:9.1f} {cpu:9.1f} {cpu / max(wall, 1e-9):8.2f} "
+              f"{max(r['rss_mb'] for r in rs):8.0f} {max(r['child_rss_mb'] for r in rs):9.0f}"
+              f"  {rate}")
+
+    names = list(by)
+    print(f"\nwall seconds per iteration ('!' = throughput down >{cliff:.0%} on the previous)")
+    print(f"{'run':16s} {'iter':>4s} " + " ".join(f"{n:>12s}" for n in names)
+          + "   last epoch policy/value")
+    rows = collections.OrderedDict()
+    for r in recs:
+        rows.setdefault((r.get("run", ""), r.get("iter", -1)), []).append(r)
+    prev = {}
+    for (run, it), rs in rows.items():
+        cells = []
+        for n in names:
+            ph = [r for r in rs if r.get("phase") == n]
+            if not ph:
+                cells.append(f"{'-':>12s}")
+                continue
+            r = ph[-1]
+            key = "samples_per_s" if "samples_per_s" in r else "games_per_s"
+            mark = ""
+            if key in r:
+                if (run, n) in prev and r[key] < (1 - cliff) * prev[(run, n)]:
+                    mark = "!"
+                prev[(run, n)] = r[key]
+            cells.append(f"{r['wall_s']:11.1f}{mark or ' '}")
+        ep = [r for r in rs if r.get("phase") == "epoch"]
+        loss = f"   {ep[-1]['policy_ce']:.4f}/{ep[-1]['value_bce']:.4f}" if ep else ""
+        print(f"{str(run):16s} {it:4d} " + " ".join(cells) + loss)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("summarize", help="per-phase and per-iteration tables")
+    s.add_argument("files", nargs="+")
+    s.add_argument("--run", default=None, help="only this run id")
+    s.add_argument("--cliff", type=float, default=0.3,
+                   help="relative throughput drop between iterations flagged with '!'")
+    a = ap.parse_args()
+    recs = load(a.files, a.run)
+    if not recs:
+        sys.exit("no records")
+    summarize(recs, a.cliff)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""Pipelined (asynchronous) AlphaZero loop: actors, learner and evaluator run
+side by side instead of loop.py's lockstep self-play -> train -> eval. Run from
+cpp/seven-wonders/.
+
+  python train/pipeline.py --iters 30 --actors 30 --actor-games 20 \\
+                           --sp-iters 400 --window 40 --trainer torch
+
+  actors     `--actors` threads, each looping `sw7 selfplay` batches of
+             `--actor-games` games with the newest published weights.
+  learner    trains on the last `--window` sample files once `--min-new` new
+             ones have landed, and publishes w_<k>.bin snapshots.
+  evaluator  scores the newest unscored snapshot with evalnet/evalpop.
+
+With `--serve`, actors evaluate leaves through one batched server (serve.py,
+run in this process on <workdir>/sw7.sock) that follows `latest`, instead of
+each `sw7` running the net itself; a snapshot reaches running games on their
+next leaf rather than their next batch.
+
+Everything goes through files in --workdir, each written to a temp name and
+renamed into place, so a reader only ever sees complete files:
+
+  samples/data_<seq>.bin   sample files, numbered in publish order
+  w_<k>.bin, latest        snapshots; `latest` holds the newest snapshot's path
+  eval_<k>.txt             evaluator output for snapshot k
+
+Rerunning in an existing workdir continues that run: sample numbering carries
+on, the learner starts after the highest w_<k>.bin from `latest`, its window is
+refilled from the existing sample files, and `--iters` counts snapshots in
+total, as in loop.py.
+
+The figure of merit is samples trained per hour (window size x epochs summed
+over learner steps), printed by both this and loop.py for comparison.
+"""
+import argparse
+import glob
+import itertools
+import os
+import subprocess
+import threading
+import time
+
+from loop import ROOT, SEED_STRIDE, SW7
+from replay import ReplayBuffer, write_manifest
+
+
+class Queue:
+    """The file-based hand-off between actors, learner and evaluator."""
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.samples = os.path.join(workdir, "samples")
+        self.socket = os.path.join(workdir, "sw7.sock")  # --serve's evaluation server
+        os.makedirs(self.samples, exist_ok=True)
+        self._seq = itertools.count(len(self.sample_files()))  # continue a prior run
+        self._lock = threading.Lock()
+
+    def publish_samples(self, tmp):
+        with self._lock:
+            path = os.path.join(self.samples, f"data_{next(self._seq):06d}.bin")
+            os.replace(tmp, path)
+        return path
+
+    def sample_files(self):
+        return sorted(glob.glob(os.path.join(self.samples, "data_*.bin")))
+
+    def publish_weights(self, tmp, k):
+        path = os.path.join(self.workdir, f"w_{k}.bin")
+        os.replace(tmp, path)
+        latest = os.path.join(self.workdir, "latest")
+        with open(latest + ".tmp", "w") as f:
+            f.write(path)
+        os.replace(latest + ".tmp", latest)
+        return path
+
+    def last_snapshot(self):
+        """Highest k with a published w_<k>.bin, or -1."""
+        ks = [int(os.path.basename(p)[2:-4])
+              for p in glob.glob(os.path.join(self.workdir, "w_*.bin"))]
+        return max(ks, default=-1)
+
+    def latest_weights(self):
+        try:
+            with open(os.path.join(self.workdir, "latest")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+
+def actor(k, q, a, stop, procs):
+    sp = "selfplay-pop" if a.population else "selfplay"
+    failures = 0
+    for batch in itertools.count():
+        if stop.is_set():
+            return
+        tmp = os.path.join(q.samples, f".actor{k}.bin.tmp")
+        seed = (k * SEED_STRIDE + batch * 7919 + 1) % 2**32
+        w = q.latest_weights()
+        if w and a.serve:
+            w = "unix:" + q.socket
+        cmd = [SW7, sp, str(a.actor_games), str(a.sp_iters), tmp, w or "-", str(seed)]
+        p = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        procs[k] = p
+        if stop.is_set():  # stop raced with the launch
+            p.kill()
+        _, err = p.communicate()
+        if stop.is_set():
+            return
+        if p.returncode != 0:
+            failures += 1
+            print(f"[actor {k}] exit {p.returncode} ({failures} in a row)\n{err[-2000:]}",
+                  flush=True)
+            if failures > a.sp_retries:
+                print(f"[actor {k}] giving up", flush=True)
+                return
+            continue
+        failures = 0
+        q.publish_samples(tmp)
+
+
+def evaluator(q, a, done):
+    scored = set()
+    while True:
+        finished = done.is_set()
+        snaps = sorted(glob.glob(os.path.join(q.workdir, "w_*.bin")), key=os.path.getmtime)
+        todo = [w for w in snaps if w not in scored]
+        if not todo:
+            if finished:
+                return
+            time.sleep(a.poll)
+            continue
+        w = todo[-1]  # newest first; stale snapshots are skipped, not queued
+        scored.update(todo)
+        ev = ["evalpop", w] if a.population else ["evalnet", w]
+        r = subprocess.run([SW7, *ev, str(a.eval_games), str(a.eval_iters)],
+                           capture_output=True, text=True)
+        out = os.path.join(q.workdir, "eval_" + os.path.basename(w)[2:-4] + ".txt")
+        with open(out, "w") as f:
+            f.write(r.stdout)
+        print(f"[eval] {os.path.basename(w)}:\n{r.stdout.rstrip()}", flush=True)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--iters", type=int, default=20,
+                    help="learner snapshots to publish (in total, counting a prior run's)")
+    ap.add_argument("--actors", type=int, default=max(1, os.cpu_count() - 2))
+    ap.add_argument("--actor-games", type=int, default=10, help="games per actor sample file")
+    ap.add_argument("--sp-iters", type=int, default=300)
+    ap.add_argument("--sp-retries", type=int, default=2, help="consecutive actor failures allowed")
+    ap.add_argument("--eval-iters", type=int, default=300)
+    ap.add_argument("--eval-games", type=int, default=100)
+    ap.add_argument("--window", type=int, default=40, help="sample files in the replay window")
+    ap.add_argument("--min-new", type=int, default=0,
+                    help="new sample files per learner step (default: --actors)")
+    ap.add_argument("--epochs", type=int, default=4)
+    ap.add_argument("--trainer", choices=["numpy", "torch"], default="numpy")
+    ap.add_argument("--hidden", default=None, help="hidden layer widths of the first snapshot")
+    ap.add_argument("--population", action="store_true",
+                    help="generate data vs heuristic archetypes (robustness, PSRO-lite)")
+    ap.add_argument("--serve", action="store_true",
+                    help="actors evaluate through one batched server (serve.py)")
+    ap.add_argument("--poll", type=float, default=0.5, help="queue poll interval, seconds")
+    ap.add_argument("--workdir", default=os.path.join(ROOT, "build", "pipeline"))
+    a = ap.parse_args()
+    min_new = a.min_new or a.actors
+    q = Queue(a.workdir)
+    trainer = os.path.join(ROOT, "train", "train.py" if a.trainer == "numpy" else "train_torch.py")
+
+    stop, done = threading.Event(), threading.Event()
+    procs = {}
+    srv = None
+    if a.serve:
+        from serve import EvalServer
+        srv = EvalServer(q.socket, latest=os.path.join(a.workdir, "latest"), stats_every=60)
+        threading.Thread(target=srv.run, daemon=True).start()
+    actors = [threading.Thread(target=actor, args=(k, q, a, stop, procs), daemon=True)
+              for k in range(a.actors)]
+    ev = threading.Thread(target=evaluator, args=(q, a, done), daemon=True)
+    for t in actors:
+        t.start()
+    ev.start()
+
+    buf = ReplayBuffer(window=a.window)
+    seen, trained, prev_w = 0, 0, None
+    k0 = q.last_snapshot() + 1
+    if k0:  # continue a prior run from its newest snapshot and window
+        prev_w = q.latest_weights() or os.path.join(a.workdir, f"w_{k0 - 1}.bin")
+        files = q.sample_files()
+        for path in files[-a.window:]:
+            buf.add(path)
+        seen = len(files)
+        print(f"[learner] continuing at w_{k0} from {prev_w} ({len(buf.shards)} files in the "
+              f"window)", flush=True)
+    t_start = time.perf_counter()
+    try:
+        for k in range(k0, a.iters):
+            while True:
+                files = q.sample_files()
+                if len(files) - seen >= min_new:
+                    break
+                if not any(t.is_alive() for t in actors):
+                    raise RuntimeError("all actors exited")
+                time.sleep(a.poll)
+            for path in files[seen:]:
+                buf.add(path)
+            seen = len(files)
+            manifest = os.path.join(a.workdir, "replay.txt")
+            write_manifest(manifest, buf.paths)
+            tmp = os.path.join(a.workdir, f".w_{k}.bin.tmp")
+            tc = ["python3", trainer, manifest, "--out", tmp, "--epochs", str(a.epochs)]
+            if prev_w:
+                tc += ["--init", prev_w]
+            elif a.hidden:
+                tc += ["--hidden", a.hidden]
+            t0 = time.perf_counter()
+            subprocess.run(tc, check=True)
+            prev_w = q.publish_weights(tmp, k)
+            trained += len(buf) * a.epochs
+            hours = (time.perf_counter() - t_start) / 3600
+            print(f"[learner] w_{k}: {len(buf)} samples ({len(buf.shards)} files, {seen} seen) "
+                  f"in {time.perf_counter() - t0:.1f}s  |  {trained / hours:,.0f} samples "
+                  f"trained/hour", flush=True)
+    finally:
+        stop.set()
+        for p in list(procs.values()):
+            if p.poll() is None:
+                p.kill()
+        for t in actors:
+            t.join()
+        if srv is not None:
+            srv.stop.set()
+        done.set()
+    ev.join()
+    hours = (time.perf_counter() - t_start) / 3600
+    print(f"\ndone. latest blueprint: {prev_w}  ({trained / hours:,.0f} samples trained/hour)")
+
+
+if __name__ == "__main__":
+    main()
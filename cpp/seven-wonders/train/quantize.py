@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""Export SWN1 float32 weights as quantized SWN2, and check what it costs.
+
+  python train/quantize.py w.bin [--dtype int8|f16|f32] [--out w.int8.bin]
+                           [--check samples.bin|replay.txt ...] [--rows 20000]
+
+SWN2 is SWN1 with a versioned header: (magic "SWN2", version, dtype, feat, pol,
+val, depth, hidden widths), then per layer the weight matrix in `dtype` and its
+bias as float32. int8 matrices are stored as float32 per-row scales (max |w| / 127)
+followed by the int8 rows; f16 is a plain float16 matrix that `sw7` widens to
+float32 on load (half the file, same inference).
+
+With int8 weights `sw7` also scales each layer's input to int16 (one scale per
+vector, max |x| / 32767) and accumulates the dot products in int32;
+infer.forward with quantize()d params mirrors that arithmetic. `--check` runs the float and the
+quantized net over rows of a replay file and reports how far apart they are:
+policy KL divergence and top-1 agreement over each row's legal buckets (all
+buckets if the file has none), the largest logit change, and the value error.
+`sw7 netbench` measures the speed side.
+
+The trainers export with `--quantize int8` (written next to --out).
+"""
+import argparse
+import os
+import numpy as np
+
+from infer import forward
+from replay import ReplayBuffer, legal_coo
+from train import DTYPES, hidden_of, layer_names, load_params, weights_info, write_header
+
+
+def quantize_rows(W):
+    """Symmetric per-row int8: W ~= scale[:, None] * q."""
+    scale = np.abs(W).max(1) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.clip(np.rint(W / scale[:, None]), -127, 127).astype(np.int8)
+    return scale.astype(np.float32), q
+
+
+def quantize(p, dtype):
+    """Float params {name: array} -> the params `dtype` stores: int8 layers as
+    (scale, q) pairs, f16 matrices rounded to float16 values."""
+    out = dict(p)
+    for w, _ in layer_names(hidden_of(p)):
+        if dtype == "int8":
+            out[w] = quantize_rows(np.asarray(p[w], np.float32))
+        elif dtype == "f16":
+            out[w] = np.asarray(p[w], np.float16).astype(np.float32)
+    return out
+
+
+def save_quantized(path, p, dtype):
+    dims = p["W1"].shape[1], p["Wp"].shape[0], p["Wv"].shape[0]
+    q = quantize(p, dtype)
+    with open(path + ".tmp", "wb") as f:
+        write_header(f, dims, hidden_of(p), dtype)
+        for w, b in layer_names(hidden_of(p)):
+            if dtype == "int8":
+                scale, rows = q[w]
+                f.write(scale.tobytes() + rows.tobytes())
+            else:
+                f.write(np.ascontiguousarray(q[w], np.float16 if dtype == "f16"
+                                             else np.float32).tobytes())
+            f.write(np.ascontiguousarray(p[b], np.float32).tobytes())
+    os.replace(path + ".tmp", path)
+    return q
+
+
+def export(src, dtype, out=None):
+    """Write float32 `src` as SWN2 `dtype` (default name: w.bin -> w.int8.bin)."""
+    p = load_params(src, *weights_info(src)[1])
+    stem, ext = os.path.splitext(src)
+    out = out or f"{stem}.{dtype}{ext}"
+    return out, p, save_quantized(out, p, dtype)
+
+
+def compare(p, q, buf, rows=20000, batch=4096, seed=0):
+    """Net `p` vs net `q` (e.g. its quantized copy, or a distilled student)
+    over up to `rows` rows of `buf`."""
+    n = len(buf)
+    idx = np.sort(np.random.default_rng(seed).choice(n, min(rows, n), replace=False))
+    kl = agree = 0.0
+    dlogit = dval = sval = 0.0
+    for s in range(0, len(idx), batch):
+        bi = idx[s:s + batch]
+        X = buf.gather(bi)[0]
+        (lf, vf), (lq, vq) = forward(p, X), forward(q, X)
+        lf, lq = lf.astype(np.float64), lq.astype(np.float64)
+        mask = np.ones_like(lf, bool)
+        if buf.has_legal:
+            mask[:] = False
+            which = np.searchsorted(buf.offsets, bi, "right") - 1
+            for k in np.unique(which):
+                m = np.flatnonzero(which == k)
+                r, c = legal_coo(buf.shards[k], bi[m] - buf.offsets[k])
+                mask[m[r], c] = True
+        dlogit = max(dlogit, float(np.abs(lf - lq)[mask].max()))
+        lf, lq = np.where(mask, lf, -np.inf), np.where(mask, lq, -np.inf)
+        pf = np.exp(lf - lf.max(1, keepdims=True))
+        pf /= pf.sum(1, keepdims=True)
+        lpf = np.log(np.where(mask, pf, 1))
+        lpq = lq - lq.max(1, keepdims=True)
+        lpq -= np.log(np.exp(lpq).sum(1, keepdims=True))
+        kl += float((pf * (lpf - np.where(mask, lpq, 0))).sum())
+        agree += float((lf.argmax(1) == lq.argmax(1)).sum())
+        dval = max(dval, float(np.abs(vf - vq).max()))
+        sval += float(np.abs(vf - vq).sum())
+    m = len(idx)
+    return dict(rows=m, policy_kl=kl / m, top1_agree=agree / m, max_dlogit=dlogit,
+                max_dvalue=dval, mean_dvalue=sval / (m * buf.dims[2]))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("weights", help="float32 weights (SWN1, or SWN2 f32)")
+    ap.add_argument("--dtype", choices=list(DTYPES), default="int8")
+    ap.add_argument("--out", default=None, help="default: <weights stem>.<dtype>.bin")
+    ap.add_argument("--check", nargs="+", default=None,
+                    help="sample files and/or manifests to compare outputs on")
+    ap.add_argument("--rows", type=int, default=20000, help="rows compared (random subset)")
+    a = ap.parse_args()
+    out, p, q = export(a.weights, a.dtype, a.out)
+    print(f"wrote {a.dtype} weights -> {out}  ({os.path.getsize(a.weights):,} -> "
+          f"{os.path.getsize(out):,} bytes)")
+    if a.check:
+        r = compare(p, q, ReplayBuffer.from_paths(a.check), a.rows)
+        print(f"  {r['rows']} rows: policy KL {r['policy_kl']:.2e}  top-1 agreement "
+              f"{r['top1_agree']:.2%}  max |dlogit| {r['max_dlogit']:.4f}  "
+              f"value |d| max {r['max_dvalue']:.4f} mean {r['mean_dvalue']:.2e}")
+
+
+if __name__ == "__main__":
+    main()
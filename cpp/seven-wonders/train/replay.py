@@ -0,0 +1,607 @@
+"""Replay buffer over SWSP self-play sample files, as zero-copy np.memmap views.
+
+`sw7 selfplay` writes struct-of-arrays files (header, then F, P, V blocks). The
+trainers used to merge the replay window into one big file and read it back
+with a copy; instead each file is mapped in place and minibatches are gathered
+straight from the page cache. Sliding the window just drops the oldest maps.
+
+  buf = ReplayBuffer.from_paths(["data_3.bin", "data_4.bin"])  # or a manifest
+  X, Pt, Vt = buf.gather(idx)                                  # any row order
+
+A manifest is a text file listing one sample file per line (relative paths are
+resolved against the manifest's directory); `loop.py` writes one per iteration.
+
+Two on-disk formats are read, chosen per file by magic:
+  SWSP  what `sw7` writes: int32 header (magic, n, feat, pol, val), then
+        float32 F (n, feat), P (n, pol), V (n, val), then optionally a
+        legal-move trailer: "SWLM", int64 nnz, uint16 count per row, uint16
+        buckets.
+  SWS2  compact (see convert.py): header (magic, n, feat, pol, val, nnz, flags),
+        then 8-byte-aligned blocks — features as float16, or uint8 with a
+        per-column (scale, offset) when flags & 1; V as float16; the policy
+        as sparse rows: uint16 nnz per row, uint16 buckets, float16 probs;
+        when flags & 2, the legal buckets (int64 nnz, counts, buckets).
+A named pipe given in place of a file is read as a live SWST stream from
+`sw7 selfplay` (see StreamShard): header (magic, feat, pol, val, record
+bytes), then per game an int32 count and that many fixed-size records —
+float32 F, P, V and a bitmask of the legal buckets — ending with a 0 count.
+All of these decode to the same dense float32 minibatches (`gather`), or to sparse
+policy targets plus legal-bucket lists (`gather_sparse`) for the masked
+policy loss.
+"""
+import hashlib
+import os
+import stat
+import struct
+import threading
+import numpy as np
+
+SP_MAGIC = 0x53575350   # "SWSP"
+S2_MAGIC = 0x53575332   # "SWS2"
+SP_HEADER = struct.Struct("<Iiiii")
+S2_HEADER = struct.Struct("<IiiiiqI")
+ST_MAGIC = 0x53575354   # "SWST" sample stream (sw7 selfplay into a named pipe)
+ST_HEADER = struct.Struct("<Iiiii")
+LM_MAGIC = 0x53574C4D   # "SWLM" legal-move trailer
+S2_U8 = 1               # flags: uint8-quantized features
+S2_LEGAL = 2            # flags: legal buckets present
+
+
+class Shard:
+    """One SWSP file mapped read-only: F (n, feat), P (n, pol), V (n, val)."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, n, feat, pol, val = SP_HEADER.unpack(f.read(SP_HEADER.size))
+        assert magic == SP_MAGIC, f"{path}: not a self-play sample file"
+        self.n, self.dims = n, (feat, pol, val)
+        off = SP_HEADER.size
+        self.F = _map(path, off, (n, feat))
+        off += 4 * n * feat
+        self.P = _map(path, off, (n, pol))
+        off += 4 * n * pol
+        self.V = _map(path, off, (n, val))
+        off += 4 * n * val
+        self.legal = None
+        if os.path.getsize(path) >= off + 12:
+            with open(path, "rb") as f:
+                f.seek(off)
+                lmagic, lnnz = struct.unpack("<Iq", f.read(12))
+            if lmagic == LM_MAGIC:
+                self.legal = _map_csr(path, off + 12, n, lnnz)
+
+    def features(self, idx):
+        return self.F[idx]
+
+    def values(self, idx):
+        return self.V[idx]
+
+    def rows(self, idx):
+        return self.F[idx], self.P[idx], self.V[idx]
+
+    def policy_coo(self, idx):
+        P = self.P[idx]
+        # Probabilities are >= 0, so "nonzero bits" == "nonzero"; the integer
+        # scan is ~2x faster than np.nonzero on floats.
+        flat = np.flatnonzero(P.view(np.int32))
+        r, c = np.divmod(flat, P.shape[1])
+        return r, c, P.ravel()[flat]
+
+
+class CompactShard:
+    """One SWS2 file mapped read-only; rows decode to dense float32."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, n, feat, pol, val, nnz, flags = S2_HEADER.unpack(f.read(S2_HEADER.size))
+        assert magic == S2_MAGIC, f"{path}: not a compact sample file"
+        self.n, self.dims, self.nnz, self.flags = n, (feat, pol, val), nnz, flags
+        off = align(S2_HEADER.size)
+        if flags & S2_U8:
+            self.scale = _map(path, off, (feat,))
+            self.lo = _map(path, off + 4 * feat, (feat,))
+            off = align(off + 8 * feat)
+            self.F = _map(path, off, (n, feat), np.uint8)
+            off = align(off + n * feat)
+        else:
+            self.F = _map(path, off, (n, feat), np.float16)
+            off = align(off + 2 * n * feat)
+        self.V = _map(path, off, (n, val), np.float16)
+        off = align(off + 2 * n * val)
+        self.counts = _map(path, off, (n,), np.uint16)
+        off = align(off + 2 * n)
+        self.idx = _map(path, off, (nnz,), np.uint16)
+        off = align(off + 2 * nnz)
+        self.prob = _map(path, off, (nnz,), np.float16)
+        self.start = _starts(self.counts)
+        self.legal = None
+        if flags & S2_LEGAL:
+            off = align(off + 2 * nnz)
+            with open(path, "rb") as f:
+                f.seek(off)
+                lnnz = struct.unpack("<q", f.read(8))[0]
+            self.legal = _map_csr(path, off + 8, n, lnnz)
+
+    def features(self, idx):
+        if self.flags & S2_U8:
+            return self.F[idx] * self.scale + self.lo
+        return self.F[idx].astype(np.float32)
+
+    def values(self, idx):
+        return self.V[idx].astype(np.float32)
+
+    def policy_coo(self, idx):
+        """Sparse policy rows for `idx` -> (row-in-batch, bucket, prob) arrays."""
+        r, pos = _csr_rows(self.counts, self.start, idx)
+        return r, self.idx[pos].astype(np.int64), self.prob[pos].astype(np.float32)
+
+    def rows(self, idx):
+        idx = np.asarray(idx)
+        P = np.zeros((len(idx), self.dims[1]), np.float32)
+        r, c, pr = self.policy_coo(idx)
+        P[r, c] = pr
+        return self.features(idx), P, self.values(idx)
+
+
+class StreamShard:
+    """Samples streamed through a named pipe by `sw7 selfplay`, held in memory.
+
+    A reader thread appends each finished game's records as they arrive, so
+    training can start before self-play ends. Rows only become visible on
+    refresh(), which lets an epoch work on a fixed row count while more keep
+    arriving; `done` is set once the writer closes the stream (`error` if it
+    died mid-game, in which case its complete games are kept).
+    """
+
+    def __init__(self, path, capacity=4096):
+        self.path = path
+        self.f = open(path, "rb")  # blocks until the writer opens its end
+        magic, feat, pol, val, rec = ST_HEADER.unpack(self._read(ST_HEADER.size))
+        assert magic == ST_MAGIC, f"{path}: not a self-play sample stream"
+        self.dims = (feat, pol, val)
+        self.rec = np.dtype([("F", "<f4", feat), ("P", "<f4", pol), ("V", "<f4", val),
+                             ("L", "u1", rec - 4 * (feat + pol + val))])
+        assert self.rec.itemsize == rec and self.rec["L"].shape[0] * 8 >= pol
+        self.R = np.zeros(capacity, self.rec)
+        self.n = self.have = 0
+        self.done, self.error = False, None
+        self._counts, self._buckets = [], []
+        self.legal = _csr([], [])
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _read(self, size):
+        data = self.f.read(size)
+        if len(data) != size:
+            raise EOFError(f"{self.path}: stream ended mid-record")
+        return data
+
+    def _run(self):
+        try:
+            while True:
+                count = struct.unpack("<i", self._read(4))[0]
+                if count == 0:
+                    break
+                recs = np.frombuffer(self._read(count * self.rec.itemsize), self.rec)
+                if self.have + count > len(self.R):  # grow; rows < have never move
+                    R = np.zeros(max(2 * len(self.R), self.have + count), self.rec)
+                    R[:self.have] = self.R[:self.have]
+                    self.R = R
+                self.R[self.have:self.have + count] = recs
+                self.have += count
+        except (EOFError, OSError, struct.error) as e:
+            self.error = str(e)
+        finally:
+            self.f.close()
+            self.done = True
+
+    def refresh(self):
+        """Publish the rows received so far; True if the stream has ended (the
+        row count is then final)."""
+        done, have = self.done, self.have
+        if have > self.n:
+            bits = np.unpackbits(self.R["L"][self.n:have], axis=1, bitorder="little")
+            bits = bits[:, :self.dims[1]]
+            self._counts.append(bits.sum(1).astype(np.uint16))
+            self._buckets.append(np.nonzero(bits)[1].astype(np.uint16))
+            self.legal = _csr(self._counts, self._buckets)
+            self.n = have
+        return done
+
+    @property
+    def F(self):
+        return self.R["F"][:self.n]
+
+    @property
+    def P(self):
+        return self.R["P"][:self.n]
+
+    @property
+    def V(self):
+        return self.R["V"][:self.n]
+
+    def features(self, idx):
+        return self.F[idx]
+
+    def values(self, idx):
+        return self.V[idx]
+
+    def rows(self, idx):
+        return self.F[idx], self.P[idx], self.V[idx]
+
+    def policy_coo(self, idx):
+        P = self.P[idx]
+        flat = np.flatnonzero(P.view(np.int32))
+        r, c = np.divmod(flat, P.shape[1])
+        return r, c, P.ravel()[flat]
+
+
+def legal_coo(shard, idx):
+    """Legal buckets of rows `idx` -> (row-in-batch, bucket), grouped by row."""
+    counts, start, buckets = shard.legal
+    r, pos = _csr_rows(counts, start, idx)
+    return r, buckets[pos].astype(np.int64)
+
+
+def align(off):
+    return (off + 7) & ~7
+
+
+def _starts(counts):
+    start = np.zeros(len(counts), np.int64)
+    np.cumsum(counts[:-1], out=start[1:])
+    return start
+
+
+def _csr_rows(counts, start, idx):
+    cnt = counts[idx].astype(np.int64)
+    r = np.repeat(np.arange(len(cnt)), cnt)
+    first = np.cumsum(cnt) - cnt
+    pos = np.repeat(start[idx] - first, cnt) + np.arange(int(cnt.sum()))
+    return r, pos
+
+
+def _csr(counts, buckets):
+    counts = np.concatenate(counts) if counts else np.empty(0, np.uint16)
+    return counts, _starts(counts), np.concatenate(buckets) if buckets else counts
+
+
+def _map_csr(path, offset, n, nnz):
+    counts = _map(path, offset, (n,), np.uint16)
+    return counts, _starts(counts), _map(path, offset + 2 * n, (nnz,), np.uint16)
+
+
+def _map(path, offset, shape, dtype=np.float32):
+    if shape[0] == 0:  # mmap refuses empty ranges
+        return np.empty(shape, dtype)
+    return np.memmap(path, dtype, "r", offset, shape)
+
+
+def open_shard(path):
+    if is_stream(path):
+        return StreamShard(path)
+    return CompactShard(path) if file_magic(path) == S2_MAGIC else Shard(path)
+
+
+def is_stream(path):
+    """True for a named pipe (read as a live SWST stream, never peeked at)."""
+    try:
+        return stat.S_ISFIFO(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def read_manifest(path):
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        lines = [ln.strip() for ln in f]
+    return [os.path.join(base, ln) for ln in lines if ln and not ln.startswith("#")]
+
+
+def write_manifest(path, files):
+    # Written to a temp name then renamed, so a reader never sees a partial list.
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        for p in files:
+            f.write(os.path.abspath(p) + "\n")
+    os.replace(tmp, path)
+
+
+def file_magic(path):
+    with open(path, "rb") as f:
+        head = f.read(4)
+    return struct.unpack("<I", head)[0] if len(head) == 4 else None
+
+
+def is_sample_file(path):
+    return file_magic(path) in (SP_MAGIC, S2_MAGIC)
+
+
+def check_sample_file(path):
+    """True if `path` is a complete SWSP/SWS2 file: known magic, every block the
+    header implies present, and the legal trailer (if any) intact."""
+    try:
+        if not is_sample_file(path):
+            return False
+        sh = open_shard(path)
+        sh.rows(np.arange(min(sh.n, 1)))
+        return True
+    except (OSError, ValueError, struct.error):
+        return False
+
+
+def checksum(path):
+    """SHA-256 hex digest of a file's bytes."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def expand_paths(paths):
+    """Sample files and/or manifests -> flat list of sample files, in order."""
+    out = []
+    for p in paths:
+        out += [p] if is_stream(p) or is_sample_file(p) else read_manifest(p)
+    return out
+
+
+class ReplayBuffer:
+    """A window of mapped sample files addressed by one global row index.
+
+    `window` (if set) caps the number of files kept: `add` drops the oldest
+    shard's maps once the window is full.
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        self.shards = []
+        self.dims = None
+        self._reindex()
+
+    @classmethod
+    def from_paths(cls, paths, window=None):
+        buf = cls(window)
+        for p in expand_paths(paths):
+            buf.add(p)
+        return buf
+
+    def add(self, path):
+        s = open_shard(path)
+        if self.dims is None:
+            self.dims = s.dims
+        assert s.dims == self.dims, f"{path}: dims {s.dims} != {self.dims}"
+        self.shards.append(s)
+        if self.window:
+            del self.shards[:-self.window]
+        self._reindex()
+
+    def refresh(self):
+        """Take in the rows streamed since the last call (see StreamShard); True
+        once every stream has ended, so the row count is final."""
+        done = all([s.refresh() for s in self.streams])
+        self._reindex()
+        return done
+
+    @property
+    def streams(self):
+        return [s for s in self.shards if isinstance(s, StreamShard)]
+
+    def _reindex(self):
+        self.offsets = np.cumsum([0] + [s.n for s in self.shards])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    @property
+    def paths(self):
+        return [s.path for s in self.shards]
+
+    @property
+    def has_legal(self):
+        return bool(self.shards) and all(s.legal is not None for s in self.shards)
+
+    def gather(self, idx):
+        """Rows `idx` (global, any order) -> fresh (X, Pt, Vt) float32 arrays."""
+        idx = np.asarray(idx)
+        if len(self.shards) == 1:
+            return self.shards[0].rows(idx)
+        feat, pol, val = self.dims
+        B = idx.shape[0]
+        X = np.empty((B, feat), np.float32)
+        Pt = np.empty((B, pol), np.float32)
+        Vt = np.empty((B, val), np.float32)
+        which = np.searchsorted(self.offsets, idx, "right") - 1
+        for k in np.unique(which):
+            m = which == k
+            local = idx[m] - self.offsets[k]
+            X[m], Pt[m], Vt[m] = self.shards[k].rows(local)
+        return X, Pt, Vt
+
+    def gather_sparse(self, idx):
+        """Rows `idx` -> (X, Vt, (tr, tc, tp), (lr, lc)).
+
+        The policy target comes back as COO triplets and the legal buckets as
+        (row, bucket) pairs, both grouped by batch row. Needs `has_legal`.
+        """
+        idx = np.asarray(idx)
+        which = np.searchsorted(self.offsets, idx, "right") - 1
+        X = np.empty((len(idx), self.dims[0]), np.float32)
+        Vt = np.empty((len(idx), self.dims[2]), np.float32)
+        tgt, legal = [], []
+        for k in np.unique(which):
+            m = np.flatnonzero(which == k)
+            local = idx[m] - self.offsets[k]
+            s = self.shards[k]
+            X[m], Vt[m] = s.features(local), s.values(local)
+            r, c, p = s.policy_coo(local)
+            tgt.append((m[r], c, p))
+            r, c = legal_coo(s, local)
+            legal.append((m[r], c))
+        if len(tgt) > 1:  # regroup by batch row across shards
+            tgt = [np.concatenate(t) for t in zip(*tgt)]
+            o = np.argsort(tgt[0], kind="stable")
+            tgt = [tgt[0][o], tgt[1][o], tgt[2][o]]
+            legal = [np.concatenate(t) for t in zip(*legal)]
+            o = np.argsort(legal[0], kind="stable")
+            legal = [legal[0][o], legal[1][o]]
+        else:
+            tgt, legal = tgt[0], legal[0]
+        return X, Vt, tuple(tgt), tuple(legal)
+
+
+class ReplayIndex:
+    """A deduplicated, weighted view of a ReplayBuffer that the loaders sample.
+
+    dedup     rows whose feature vectors agree on a grid of `quantum` (hashed
+              with a random linear hash; the grid absorbs SWS2's u8 rounding,
+              so a position matches itself across formats) collapse into one
+              sample: the first row's features, the members' mean policy and
+              value targets. Early-turn positions repeat across games, so this
+              drops the redundant gradient steps.
+    recency   half-life in files: a sample's weight halves for every `recency`
+              files between its newest occurrence and the newest file (0 = off).
+    priority  exponent on per-sample priorities (0 = off). Priorities start at
+              1 and the trainer feeds back each sample's last loss through
+              update(), so hard positions are drawn more often.
+
+    With neither weighting, sample() is a uniform permutation of the unique
+    samples; otherwise an epoch draws len(self) samples with replacement in
+    proportion to the weights. gather/gather_sparse take sample ids and return
+    the same shapes as ReplayBuffer's.
+    """
+
+    def __init__(self, buf, dedup=True, recency=0.0, priority=0.0, quantum=1 / 4096,
+                 chunk=65536, seed=0):
+        self.buf, self.dims = buf, buf.dims
+        self.recency, self.priority = recency, priority
+        n = len(buf)
+        shard_of = np.repeat(np.arange(len(buf.shards)), np.diff(buf.offsets))
+        if dedup and n:
+            coef = np.random.default_rng(seed).integers(1, 2**63, self.dims[0], np.uint64) | 1
+            h = np.empty(n, np.uint64)
+            for k, sh in enumerate(buf.shards):
+                for s in range(0, sh.n, chunk):
+                    X = sh.features(np.arange(s, min(s + chunk, sh.n)))
+                    o = buf.offsets[k] + s
+                    q = np.rint(X / quantum).astype(np.int64).view(np.uint64)
+                    h[o:o + len(X)] = q @ coef  # wraps mod 2^64
+            _, first, inv = np.unique(h, return_index=True, return_inverse=True)
+            rank = np.empty(len(first), np.int64)
+            rank[np.argsort(first, kind="stable")] = np.arange(len(first))
+            group = rank[inv]  # sample ids numbered by first occurrence
+        else:
+            group = np.arange(n)
+        self.members = np.argsort(group, kind="stable")  # rows grouped by sample id
+        self.counts = np.bincount(group, minlength=group.max() + 1 if n else 0)
+        self.start = np.concatenate([[0], np.cumsum(self.counts)[:-1]]).astype(np.int64)
+        self.rep = self.members[self.start] if n else np.empty(0, np.int64)
+        self.newest = (np.maximum.reduceat(shard_of[self.members], self.start)
+                       if n else np.empty(0, np.int64))
+        self.prio = np.ones(len(self.counts))
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def shards(self):
+        return self.buf.shards
+
+    @property
+    def has_legal(self):
+        return self.buf.has_legal
+
+    @property
+    def weighted(self):
+        return self.recency > 0 or self.priority > 0
+
+    def probs(self):
+        w = np.ones(len(self))
+        if self.recency > 0:
+            w *= 0.5 ** ((len(self.buf.shards) - 1 - self.newest) / self.recency)
+        if self.priority > 0:
+            w *= self.prio ** self.priority
+        return w / w.sum()
+
+    def sample(self, rng):
+        """One epoch of sample ids."""
+        if not self.weighted:
+            return rng.permutation(len(self))
+        return rng.choice(len(self), len(self), p=self.probs())
+
+    def update(self, idx, loss):
+        """Set the priorities of samples `idx` from their latest losses."""
+        self.prio[idx] = np.abs(loss) + 1e-3
+
+    def _rows(self, idx):
+        cnt = self.counts[idx]
+        seg = np.concatenate([[0], np.cumsum(cnt)[:-1]])
+        rows = self.members[np.repeat(self.start[idx] - seg, cnt) + np.arange(cnt.sum())]
+        return rows, cnt, seg
+
+    def gather(self, idx):
+        """Samples `idx` -> (X, Pt, Vt), targets averaged over duplicates."""
+        idx = np.asarray(idx)
+        if (self.counts[idx] == 1).all():
+            return self.buf.gather(self.rep[idx])
+        rows, cnt, seg = self._rows(idx)
+        X, P, V = self.buf.gather(rows)
+        c = cnt.astype(np.float32)[:, None]
+        return X[seg], np.add.reduceat(P, seg) / c, np.add.reduceat(V, seg) / c
+
+    def gather_sparse(self, idx):
+        """Samples `idx` -> ReplayBuffer.gather_sparse's tuple, targets averaged
+        over duplicates; the legal buckets are the first occurrence's."""
+        idx = np.asarray(idx)
+        if (self.counts[idx] == 1).all():
+            return self.buf.gather_sparse(self.rep[idx])
+        rows, cnt, seg = self._rows(idx)
+        X, V, (tr, tc, tp), (lr, lc) = self.buf.gather_sparse(rows)
+        pol = self.dims[1]
+        grp = np.repeat(np.arange(len(idx)), cnt)
+        key, inv = np.unique(grp[tr] * pol + tc, return_inverse=True)
+        g, c = np.divmod(key, pol)
+        p = (np.bincount(inv, tp, len(key)) / cnt[g]).astype(np.float32)
+        first = np.zeros(len(rows), bool)
+        first[seg] = True
+        keep = first[lr]
+        Vm = np.add.reduceat(V, seg) / cnt.astype(np.float32)[:, None]
+        return X[seg], Vm, (g, c, p), (grp[lr[keep]], lc[keep])
+
+
+def write_legal(f, parts, magic=True):
+    """Write a legal-bucket block (optionally the "SWLM" tag, then int64 nnz,
+    counts, buckets) from one or more (counts, start, buckets) triples."""
+    nnz = sum(len(p[2]) for p in parts)
+    f.write(struct.pack("<Iq", LM_MAGIC, nnz) if magic else struct.pack("<q", nnz))
+    for p in parts:
+        np.asarray(p[0]).tofile(f)
+    for p in parts:
+        np.asarray(p[2]).tofile(f)
+
+
+def concat(files, out):
+    """Concatenate SWSP files into `out`, streaming block by block from the maps.
+
+    Used to join self-play shards (SWSP) into one iteration file; nothing
+    beyond the page cache is held in memory. Shards (e.g. finished
+    StreamShards) may be passed in place of paths. Returns the total sample
+    count.
+    """
+    shards = [p if hasattr(p, "rows") else Shard(p) for p in files]
+    dims = shards[0].dims
+    assert all(s.dims == dims for s in shards), "sample dims differ between shards"
+    n = sum(s.n for s in shards)
+    tmp = out + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(SP_HEADER.pack(SP_MAGIC, n, *dims))
+        for block in ("F", "P", "V"):
+            for s in shards:
+                np.asarray(getattr(s, block)).tofile(f)
+        if all(s.legal is not None for s in shards):
+            write_legal(f, [s.legal for s in shards])
+    os.replace(tmp, out)
+    return n
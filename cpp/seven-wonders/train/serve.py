@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""Batched net evaluation for `sw7` over a Unix socket. Run from cpp/seven-wonders/.
+
+  python train/serve.py w.bin [--socket build/sw7.sock] [--max-batch 256]
+                        [--max-wait-ms 2] [--stats 10]
+  build/sw7 selfplay 20 400 out.bin unix:build/sw7.sock      # any number of these
+
+Every PUCT leaf in `sw7` is one Net::eval; with a "unix:<socket>" weights path
+that eval becomes a request to this server (see include/sw/net.hpp for the
+protocol). Each game process has at most one request in flight, so the server
+batches across processes: a batch goes out when `--max-batch` requests are
+waiting, when every connected game is waiting, or `--max-wait-ms` after its
+first request arrived, whichever comes first. The batch is one numpy forward
+pass.
+
+The weights file (or, with --latest, the snapshot a pointer file names, as
+pipeline.py publishes them) is checked every `--reload` seconds and on SIGHUP;
+a new file is loaded between batches, so games pick it up on their next leaf.
+Writers must replace the file atomically (loop.py and pipeline.py do).
+
+  python train/serve.py w.bin --bench [--procs 8] [--games 16] [--iters 200]
+
+runs the same self-play games twice, with the per-leaf scalar path in `sw7`
+(weights file) and against an in-process server, and reports games/hour and
+leaf evals/sec for both.
+"""
+import argparse
+import os
+import selectors
+import signal
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import numpy as np
+
+from infer import forward
+from train import check_weights, load_params, weights_info
+
+SERVER_MAGIC = 0x53574E53   # "SWNS"
+
+
+def read_weights(path):
+    dims = weights_info(path)[1]
+    return load_params(path, *dims), dims
+
+
+class EvalServer:
+    """Serves `weights` (or the path in the `latest` pointer file) on `sock_path`."""
+
+    def __init__(self, sock_path, weights=None, latest=None, max_batch=256, max_wait=0.002,
+                 reload_every=1.0, stats_every=0.0):
+        self.sock_path, self.weights, self.latest = sock_path, weights, latest
+        self.max_batch, self.max_wait = max_batch, max_wait
+        self.reload_every, self.stats_every = reload_every, stats_every
+        self.p = self.dims = self.loaded = None
+        self.reload()
+        if os.path.exists(sock_path):
+            os.remove(sock_path)
+        self.lsock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.lsock.bind(sock_path)
+        self.lsock.listen(1024)
+        self.lsock.setblocking(False)
+        self.sel = selectors.DefaultSelector()
+        self.sel.register(self.lsock, selectors.EVENT_READ)
+        self.conns = {}          # socket -> bytes received toward the next request
+        self.pending = []        # (socket, feature bytes) awaiting a batch
+        self.evals = self.batches = 0
+        self.stop = threading.Event()
+        self.force_reload = False
+
+    def source(self):
+        if self.latest is None:
+            return self.weights
+        try:
+            with open(self.latest) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        """Load the weights if they changed; False if there are none (yet)."""
+        path = self.source()
+        if not path or not os.path.exists(path):
+            return self.p is not None
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        if key == self.loaded:
+            return True
+        if not check_weights(path) or weights_info(path)[0] != "f32":
+            return self.p is not None  # mid-write or not float32; keep serving the old net
+        p, dims = read_weights(path)
+        if self.dims is not None and dims != self.dims:
+            raise RuntimeError(f"{path}: dims {dims} != served {self.dims}")
+        self.p, self.dims, self.loaded = p, dims, key
+        print(f"[serve] weights {path}", flush=True)
+        return True
+
+    def _accept(self):
+        conn, _ = self.lsock.accept()
+        conn.setblocking(True)
+        feat, pol, val = self.dims
+        conn.sendall(struct.pack("<I3i", SERVER_MAGIC, feat, pol, val))
+        self.conns[conn] = b""
+        self.sel.register(conn, selectors.EVENT_READ)
+
+    def _close(self, conn):
+        self.sel.unregister(conn)
+        del self.conns[conn]
+        self.pending = [r for r in self.pending if r[0] is not conn]
+        conn.close()
+
+    def _read(self, conn):
+        try:
+            data = conn.recv(1 << 16)
+        except ConnectionError:
+            data = b""
+        if not data:
+            self._close(conn)
+            return
+        size = 4 * self.dims[0]
+        buf = self.conns[conn] + data
+        while len(buf) >= size:
+            self.pending.append((conn, buf[:size]))
+            buf = buf[size:]
+        self.conns[conn] = buf
+
+    def flush(self):
+        batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+        X = np.frombuffer(b"".join(f for _, f in batch), np.float32).reshape(len(batch), -1)
+        logits, value = forward(self.p, X)
+        out = np.hstack([logits, value]).astype(np.float32)
+        for (conn, _), row in zip(batch, out):
+            try:
+                conn.sendall(row.tobytes())
+            except OSError:
+                self._close(conn)
+        self.evals += len(batch)
+        self.batches += 1
+
+    def run(self):
+        while self.p is None and not self.stop.is_set():  # nothing to serve yet
+            time.sleep(self.reload_every)
+            self.reload()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGHUP, lambda *_: setattr(self, "force_reload", True))
+            signal.signal(signal.SIGTERM, lambda *_: self.stop.set())
+        first = None             # arrival time of the oldest pending request
+        t_reload = t_stats = time.perf_counter()
+        evals0, batches0 = 0, 0
+        while not self.stop.is_set():
+            timeout = 0.1 if first is None else \
+                max(0.0, first + self.max_wait - time.perf_counter())
+            for key, _ in self.sel.select(timeout):
+                if key.fileobj is self.lsock:
+                    self._accept()
+                else:
+                    self._read(key.fileobj)
+            now = time.perf_counter()
+            if self.pending and first is None:
+                first = now
+            while self.pending and (len(self.pending) >= self.max_batch
+                                    or len(self.pending) >= len(self.conns)
+                                    or now - first >= self.max_wait):
+                self.flush()
+                first = now if self.pending else None
+            if self.force_reload or now - t_reload >= self.reload_every:
+                self.force_reload = False
+                t_reload = now
+                self.reload()
+            if self.stats_every and now - t_stats >= self.stats_every:
+                n, b = self.evals - evals0, self.batches - batches0
+                if n:
+                    print(f"[serve] {n / (now - t_stats):,.0f} evals/s  mean batch "
+                          f"{n / b:.1f}  {len(self.conns)} games connected", flush=True)
+                t_stats, evals0, batches0 = now, self.evals, self.batches
+        self.close()
+
+    def close(self):
+        for conn in list(self.conns):
+            self._close(conn)
+        self.sel.close()
+        self.lsock.close()
+        if os.path.exists(self.sock_path):
+            os.remove(self.sock_path)
+
+
+def _selfplay(procs, games, iters, weights, outdir):
+    """`procs` concurrent `sw7 selfplay` shards of `games`; wall seconds."""
+    from loop import shard_cmd  # loop.py -> train.py; kept off the server's import path
+    t0 = time.perf_counter()
+    ps = [subprocess.Popen(shard_cmd("selfplay", games, iters, os.path.join(outdir, f"b{k}.bin"),
+                                     weights, 1000, procs, k),
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+          for k in range(procs)]
+    if any(p.wait() for p in ps):
+        raise RuntimeError("self-play failed")
+    return time.perf_counter() - t0
+
+
+def bench(weights, procs, games, iters, max_batch, max_wait):
+    with tempfile.TemporaryDirectory() as d:
+        srv = EvalServer(os.path.join(d, "sw7.sock"), weights, max_batch=max_batch,
+                         max_wait=max_wait)
+        t = threading.Thread(target=srv.run, daemon=True)
+        t.start()
+        t_srv = _selfplay(procs, games, iters, "unix:" + srv.sock_path, d)
+        srv.stop.set()
+        t.join()
+        t_sc = _selfplay(procs, games, iters, weights, d)
+    per_game = srv.evals / games  # leaf evals are the same count either way, up to float noise
+    print(f"{games} games x {iters} iters on {procs} concurrent sw7 processes:")
+    print(f"  {'path':14s} {'games/hour':>11s} {'leaf evals/s':>13s} {'mean batch':>11s}")
+    print(f"  {'scalar (sw7)':14s} {games / t_sc * 3600:11,.0f} {per_game * games / t_sc:13,.0f} "
+          f"{1:11.1f}")
+    print(f"  {'served':14s} {games / t_srv * 3600:11,.0f} {srv.evals / t_srv:13,.0f} "
+          f"{srv.evals / max(srv.batches, 1):11.1f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("weights", nargs="?", default=None, help="float32 weights to serve")
+    ap.add_argument("--latest", default=None,
+                    help="serve the snapshot this pointer file names (pipeline.py's `latest`)")
+    ap.add_argument("--socket", default=os.path.join("build", "sw7.sock"))
+    ap.add_argument("--max-batch", type=int, default=256)
+    ap.add_argument("--max-wait-ms", type=float, default=2.0)
+    ap.add_argument("--reload", type=float, default=1.0, help="weights check interval, seconds")
+    ap.add_argument("--stats", type=float, default=10.0, help="stats interval, seconds (0 = off)")
+    ap.add_argument("--bench", action="store_true", help="compare against the scalar path")
+    ap.add_argument("--procs", type=int, default=os.cpu_count())
+    ap.add_argument("--games", type=int, default=16)
+    ap.add_argument("--iters", type=int, default=200)
+    a = ap.parse_args()
+    if (a.weights is None) == (a.latest is None):
+        ap.error("give a weights file or --latest (not both)")
+    if a.bench:
+        if not a.weights:
+            ap.error("--bench needs a weights file")
+        return bench(a.weights, a.procs, a.games, a.iters, a.max_batch, a.max_wait_ms / 1000)
+    srv = EvalServer(a.socket, a.weights, a.latest, a.max_batch, a.max_wait_ms / 1000, a.reload,
+                     a.stats)
+    print(f"[serve] listening on {a.socket}", flush=True)
+    try:
+        srv.run()
+    except KeyboardInterrupt:
+        srv.close()
+
+
+if __name__ == "__main__":
+    main()
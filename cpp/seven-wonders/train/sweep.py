@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""Hyperparameter sweep for train.py, with successive halving. Run from
+cpp/seven-wonders/.
+
+  python train/sweep.py samples.bin [more.bin | replay.txt ...]
+                        [--param lr=log:1e-4:3e-3] [--param batch=128,256,512]
+                        [--param vw=0.5:2] [--param hidden=64x64,128x128] [--spec sweep.json]
+                        [--random 16] [--epochs 8] [--eta 3] [--workers N]
+                        [--holdout 0.1] [--holdout-rows 20000] [--block 256]
+                        [--metric total|policy|value] [--seed 0] [--dir build/sweep]
+
+Each `--param NAME=SPEC` (or `--spec`, a JSON object {NAME: SPEC}) searches one
+of train.py's settings: lr, batch, vw, epochs, hidden. A SPEC is a list of
+values (`128,256,512`; hidden widths as `64x64`), `lo:hi` (uniform) or
+`log:lo:hi` (log-uniform). Without --random the trials are the grid of all the
+lists; `--random N` draws N trials, each value independently. Settings not
+given take train.py's defaults (--epochs for epochs).
+
+Trials run on a pool of `--workers` processes, each training one trial at a
+time in-process with train.Engine (one BLAS thread per worker). Every worker
+maps the sample files read-only, as train.py does, so all the trials read
+the same page-cache pages. Per worker, the only private data is the net, its
+Adam state, a few prefetched minibatches and the held-out rows.
+
+The held-out split is fixed by --seed: --holdout of the rows, taken in runs of
+--block consecutive rows (a game's positions are written together, so most
+held-out games are held out whole), and at least one run on each side; it is
+never trained on. Every trial is scored on the same up to --holdout-rows of
+them: policy CE (over legal buckets if the samples carry them, like the
+training loss) plus value BCE, unweighted so --vw does not tilt the comparison
+(`--metric` ranks by one term instead). Every trial starts from the same
+--seed initialization and sees the same row order.
+
+Successive halving (`--eta 3`, the default; `--eta 1` turns it off): all
+trials train to the first rung's epochs, the best 1/eta by held-out loss go
+on to the next rung, and so on up to --epochs. The rungs are --epochs / eta^k,
+rounded (8 epochs, eta 3: 3 then 8). A trial picks up at the next rung from a
+checkpoint of its weights and Adam state in --dir, so with constant lr,
+stopping and resuming changes nothing. Epochs are the halving budget, so they
+cannot also be a --param then.
+
+Writes <dir>/sweep.md (trials ranked by their last rung, then held-out loss),
+sweep.json (each trial's settings and per-rung losses) and best.bin, the
+winner's weights.
+"""
+import argparse
+import itertools
+import json
+import math
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+from infer import forward
+from loader import BatchLoader
+from loop import ROOT
+from metrics import Recorder
+from replay import ReplayBuffer
+from train import (HIDDEN, Engine, init_params, masked_policy, n_params, parse_hidden,
+                   save_params, softmax, views)
+
+DEFAULTS = {"lr": 1e-3, "batch": 256, "vw": 1.0, "epochs": 8, "hidden": HIDDEN}
+TYPES = {"lr": float, "batch": int, "vw": float, "epochs": int,
+         "hidden": lambda s: parse_hidden(str(s).replace("x", ","))}
+METRICS = {"total": lambda r: r["policy_ce"] + r["value_bce"],
+           "policy": lambda r: r["policy_ce"], "value": lambda r: r["value_bce"]}
+
+_S = {}
+
+
+def parse_param(name, spec):
+    """('lr', 'log:1e-4:1e-2') -> a list of values, or a sampler rng -> value."""
+    if name not in TYPES:
+        raise ValueError(f"unknown parameter {name!r} (one of {', '.join(TYPES)})")
+    cast = TYPES[name]
+    if isinstance(spec, list):
+        return [cast(v) for v in spec]
+    spec = str(spec)
+    if ":" not in spec:
+        return [cast(v) for v in spec.split(",")]
+    if name == "hidden":
+        raise ValueError("hidden takes a list of widths, e.g. 64x64,128x128")
+    log = spec.startswith("log:")
+    lo, hi = (float(v) for v in spec[4 if log else 0:].split(":"))
+    if log and min(lo, hi) <= 0:
+        raise ValueError(f"{name}: log range needs positive bounds")
+
+    def draw(rng):
+        u = rng.uniform(np.log(lo), np.log(hi)) if log else rng.uniform(lo, hi)
+        v = float(np.exp(u)) if log else float(u)
+        return int(round(v)) if cast is int else v
+    return draw
+
+
+def trials(space, random, seed):
+    """Trial settings: the grid over `space` (all lists), or `random` draws."""
+    if not random:
+        if any(callable(v) for v in space.values()):
+            raise ValueError("ranges need --random N (a grid takes value lists only)")
+        names = list(space)
+        grid = itertools.product(*(space[n] for n in names))
+        return [{**DEFAULTS, **dict(zip(names, vals))} for vals in grid]
+    rng = np.random.default_rng(seed)
+    return [{**DEFAULTS, **{n: (v(rng) if callable(v) else v[rng.integers(len(v))])
+                            for n, v in space.items()}} for _ in range(random)]
+
+
+def rungs(epochs, eta):
+    """Epochs each successive-halving rung trains to, the last being `epochs`."""
+    if eta <= 1:
+        return [epochs]
+    k = int(math.log(epochs, eta) + 1e-9)
+    return sorted({max(1, round(epochs / eta ** j)) for j in range(k + 1)})
+
+
+def split(n, holdout, block, seed):
+    """(train rows, held-out rows): a seeded --holdout share of `block`-row runs,
+    at least one run on each side when there are two or more."""
+    nb = -(-n // block)
+    k = min(max(round(holdout * nb), 1), nb - 1)
+    held = np.zeros(nb, bool)
+    held[np.random.default_rng(seed).choice(nb, k, replace=False)] = True
+    rows = np.arange(n)
+    return rows[~held[rows // block]], rows[held[rows // block]]
+
+
+class Rows:
+    """Rows `idx` of a ReplayBuffer as a BatchLoader source: each epoch is a
+    permutation of them."""
+
+    def __init__(self, buf, idx):
+        self.buf, self.idx = buf, idx
+        self.gather, self.gather_sparse = buf.gather, buf.gather_sparse
+
+    def __len__(self):
+        return len(self.idx)
+
+    def sample(self, rng):
+        return self.idx[rng.permutation(len(self.idx))]
+
+
+def _init(paths, holdout, block, holdout_rows, seed):
+    buf = ReplayBuffer.from_paths(paths)
+    train_rows, held = split(len(buf), holdout, block, seed)
+    rng = np.random.default_rng(seed)
+    held = np.sort(rng.choice(held, min(holdout_rows, len(held)), replace=False))
+    masked = buf.has_legal
+    gather = buf.gather_sparse if masked else buf.gather
+    _S.update(buf=buf, train=Rows(buf, train_rows), masked=masked, seed=seed,
+              held=[gather(held[s:s + 4096]) for s in range(0, len(held), 4096)])
+
+
+def holdout_loss(p):
+    """Mean policy CE and value BCE of params `p` over the held-out rows."""
+    pl = vl = 0.0
+    n = 0
+    for batch in _S["held"]:
+        if _S["masked"]:
+            X, Vt, tgt, legal = batch
+            logits, v = forward(p, X)
+            ce = masked_policy(logits, tgt, legal)[0]
+        else:
+            X, Pt, Vt = batch
+            logits, v = forward(p, X)
+            ce = float(-(Pt * np.log(softmax(logits) + 1e-9)).sum(1).mean())
+        bce = float(-(Vt * np.log(v + 1e-9) + (1 - Vt) * np.log(1 - v + 1e-9)).mean())
+        pl += ce * len(X)
+        vl += bce * len(X)
+        n += len(X)
+    return pl / n, vl / n
+
+
+def _run(tid, cfg, start, stop, ckpt):
+    """Train trial `tid` from epoch `start` (its checkpoint) to `stop`."""
+    S = _S
+    dims, hidden = S["buf"].dims, cfg["hidden"]
+    t0 = time.perf_counter()
+    if start:
+        with np.load(ckpt) as z:
+            flat, m, v, t = z["flat"], z["m"], z["v"], int(z["t"])
+        p = views(flat, *dims, hidden)
+    else:
+        p = init_params(*dims, np.random.default_rng(S["seed"]), hidden)
+        m = v = None
+        t = 0
+    eng = Engine(p, *dims, lr=cfg["lr"], vw=cfg["vw"], m=m, v=v)
+    eng.t = t
+    ploss = vloss = 0.0
+    nb = 0
+    for ep in range(start, stop):
+        loader = BatchLoader(S["train"], cfg["batch"], np.random.default_rng([S["seed"], ep]),
+                             sparse=S["masked"])
+        for batch in loader.epoch():
+            if S["masked"]:
+                X, Vt, tgt, legal = batch
+                pl, vl = eng.step(X, Vt, tgt=tgt, legal=legal)
+            else:
+                X, Pt, Vt = batch
+                pl, vl = eng.step(X, Vt, Pt=Pt)
+            if ep == stop - 1:
+                ploss += pl
+                vloss += vl
+                nb += 1
+    np.savez(ckpt + ".tmp.npz", flat=eng.flat, m=eng.m, v=eng.v, t=eng.t)
+    os.replace(ckpt + ".tmp.npz", ckpt)
+    pce, vbce = holdout_loss(p)
+    return dict(trial=tid, epochs=stop, train_policy_ce=ploss / max(nb, 1),
+                train_value_bce=vloss / max(nb, 1), policy_ce=pce, value_bce=vbce,
+                seconds=time.perf_counter() - t0)
+
+
+def label(cfg):
+    return (f"lr={cfg['lr']:.3g} batch={cfg['batch']} vw={cfg['vw']:.3g} "
+            f"hidden={'x'.join(map(str, cfg['hidden']))}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("samples", nargs="+", help="sample files and/or manifests")
+    ap.add_argument("--param", action="append", default=[],
+                    help="NAME=SPEC: a,b,c | lo:hi | log:lo:hi (repeatable)")
+    ap.add_argument("--spec", default=None, help="JSON object {NAME: SPEC or [values]}")
+    ap.add_argument("--random", type=int, default=0, help="random trials (0 = grid)")
+    ap.add_argument("--epochs", type=int, default=DEFAULTS["epochs"],
+                    help="epochs per trial (the last rung with halving)")
+    ap.add_argument("--eta", type=int, default=3, help="keep 1/eta per rung (1 = no halving)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--holdout", type=float, default=0.1, help="share of rows held out")
+    ap.add_argument("--holdout-rows", type=int, default=20000, help="held-out rows scored")
+    ap.add_argument("--block", type=int, default=256, help="rows per held-out run")
+    ap.add_argument("--metric", choices=list(METRICS), default="total")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--metrics", default=None, help="append per-trial JSON records here")
+    ap.add_argument("--dir", default=os.path.join(ROOT, "build", "sweep"))
+    a = ap.parse_args()
+
+    specs = {}
+    if a.spec:
+        with open(a.spec) as f:
+            specs.update(json.load(f))
+    for item in a.param:
+        name, _, spec = item.partition("=")
+        specs[name.strip()] = spec
+    try:
+        space = {name: parse_param(name, spec) for name, spec in specs.items()}
+        if "epochs" in space and a.eta > 1:
+            raise ValueError("epochs are the halving budget; sweep them with --eta 1")
+        configs = trials(space, a.random, a.seed)
+    except ValueError as e:
+        ap.error(str(e))
+    if not 0 < a.holdout < 1:
+        ap.error("--holdout must be between 0 and 1")
+    if "epochs" not in space:
+        for cfg in configs:
+            cfg["epochs"] = a.epochs
+    os.makedirs(os.path.join(a.dir, "trials"), exist_ok=True)
+    rec = Recorder(a.metrics)
+
+    buf = ReplayBuffer.from_paths(a.samples)
+    dims = buf.dims
+    if buf.streams:
+        ap.error("sweep.py needs sample files, not named pipes")
+    train_rows, held = split(len(buf), a.holdout, a.block, a.seed)
+    if not len(train_rows) or not len(held):
+        ap.error(f"{len(buf)} rows in runs of --block {a.block} leave nothing to "
+                 f"{'train on' if len(held) else 'hold out'}; lower --block")
+    print(f"held out {len(held)} of {len(buf)} rows ({-(-len(buf) // a.block)} runs of "
+          f"{a.block})", flush=True)
+    schedule = rungs(a.epochs, a.eta)
+    print(f"samples: {len(buf)} ({len(buf.shards)} files)  {len(configs)} trials  "
+          f"rungs (epochs): {schedule}  {a.workers} workers  "
+          f"policy={'masked' if buf.has_legal else 'dense'}", flush=True)
+    key = METRICS[a.metric]
+    hist = {tid: [] for tid in range(len(configs))}
+    ckpt = {tid: os.path.join(a.dir, "trials", f"t{tid}.npz") for tid in hist}
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(var, "1")  # one BLAS thread per worker; cores go to trials
+    alive, done = list(hist), 0
+    t_start = time.perf_counter()
+    with ProcessPoolExecutor(a.workers, mp_context=mp.get_context("spawn"), initializer=_init,
+                             initargs=(buf.paths, a.holdout, a.block, a.holdout_rows,
+                                       a.seed)) as ex:
+        for k, stop in enumerate(schedule if a.eta > 1 else [None]):
+            futs = {}
+            for tid in alive:
+                end = stop or configs[tid]["epochs"]
+                futs[ex.submit(_run, tid, configs[tid], done if stop else 0, end,
+                               ckpt[tid])] = tid
+            for fut in as_completed(futs):
+                tid = futs[fut]
+                try:
+                    r = fut.result()
+                except Exception as e:  # a diverged or crashed trial ranks last
+                    r = dict(trial=tid, epochs=None, error=repr(e))
+                else:
+                    r["loss"] = key(r) if np.isfinite(key(r)) else float("inf")
+                    rec.write(phase="trial", rung=k, **{**configs[tid], **r})
+                hist[tid].append(r)
+                if "error" in r:
+                    print(f"  t{tid:<3d} {label(configs[tid])}  failed: {r['error']}", flush=True)
+                else:
+                    print(f"  t{tid:<3d} {label(configs[tid])}  epochs {r['epochs']}  "
+                          f"held-out policy_ce={r['policy_ce']:.4f} value_bce="
+                          f"{r['value_bce']:.4f}  ({r['seconds']:.0f}s)", flush=True)
+            done = stop or 0
+            ok = sorted((hist[t][-1]["loss"], t) for t in alive if "error" not in hist[t][-1])
+            if stop is None or k == len(schedule) - 1:
+                break
+            keep = max(1, math.ceil(len(alive) / a.eta))
+            alive = [t for _, t in ok[:keep]]
+            print(f"rung {k + 1}/{len(schedule)} ({stop} epochs): keep {len(alive)} of "
+                  f"{len(futs)}", flush=True)
+            for t in set(hist) - set(alive):
+                if os.path.exists(ckpt[t]):
+                    os.remove(ckpt[t])
+    wall = time.perf_counter() - t_start
+
+    def rank(tid):
+        last = hist[tid][-1]
+        return (-len(hist[tid]), "error" in last, last.get("loss", float("inf")))
+    order = sorted(hist, key=rank)
+    best = order[0]
+    if "error" in hist[best][-1]:
+        raise SystemExit("every trial failed")
+    with np.load(ckpt[best]) as z:
+        save_params(os.path.join(a.dir, "best.bin"), views(z["flat"].copy(), *dims,
+                                                          configs[best]["hidden"]), *dims)
+    names = [n for n in ("lr", "batch", "vw", "epochs", "hidden")
+             if n in space or n == "epochs"]
+    head = ("| rank | trial | " + " | ".join(names) + " | params | held-out policy CE | "
+            "held-out value BCE | train policy CE | train s |")
+    lines = [head, "|" + "---|" * (head.count("|") - 1)]
+    for i, tid in enumerate(order, 1):
+        cfg, rs = configs[tid], hist[tid]
+        last = rs[-1]
+        cells = [f"{cfg[n]:.3g}" if isinstance(cfg[n], float) else
+                 "x".join(map(str, cfg[n])) if n == "hidden" else str(cfg[n]) for n in names]
+        if "epochs" in names:
+            cells[names.index("epochs")] = str(last.get("epochs") or "-")
+        if "error" in last:
+            lines.append(f"| {i} | t{tid} | " + " | ".join(cells) + " | "
+                         f"{n_params(*dims, cfg['hidden']):,} | failed | | | |")
+            continue
+        lines.append(f"| {i} | t{tid} | " + " | ".join(cells) + f" | "
+                     f"{n_params(*dims, cfg['hidden']):,} | {last['policy_ce']:.4f} | "
+                     f"{last['value_bce']:.4f} | {last['train_policy_ce']:.4f} | "
+                     f"{sum(r.get('seconds', 0) for r in rs):.0f} |")
+    md = "\n".join(lines) + "\n"
+    with open(os.path.join(a.dir, "sweep.md"), "w") as f:
+        f.write(f"{len(configs)} trials on {len(buf)} rows, rungs {schedule}, ranked by "
+                f"held-out {a.metric} loss\n\n" + md)
+    with open(os.path.join(a.dir, "sweep.json"), "w") as f:
+        json.dump({"samples": buf.paths, "rows": len(buf), "holdout": a.holdout,
+                   "holdout_rows": a.holdout_rows, "block": a.block, "seed": a.seed,
+                   "eta": a.eta, "rungs": schedule, "metric": a.metric, "wall_s": round(wall, 1),
+                   "best": best,
+                   "trials": [{"trial": t, **configs[t], "hidden": list(configs[t]["hidden"]),
+                               "rungs": hist[t]} for t in order]}, f, indent=2)
+    print(md, end="")
+    trained = sum(r.get("seconds", 0) for rs in hist.values() for r in rs)
+    print(f"best: t{best} {label(configs[best])}  -> {os.path.join(a.dir, 'best.bin')}")
+    print(f"{wall:.0f}s wall, {trained:.0f}s of trial time on {a.workers} workers; "
+          f"wrote sweep.md, sweep.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,181 @@
 #!/usr/bin/env python3
 """Train the 7 Wonders policy+value MLP from C++ self-play samples (numpy).
 
-Reads a .bin produced by `sw7 selfplay` and writes weights in the flat layout
-`sw7` loads (see include/sw/net.hpp). numpy keeps this dependency-free and
-validates the whole loop on CPU; swap in the torch version for GPU-scale runs.
+Reads .bin files produced by `sw7 selfplay` (or a manifest listing them; see
+replay.py) and writes weights in the flat layout `sw7` loads (see
+include/sw/net.hpp). numpy keeps this dependency-free and validates the whole
+loop on CPU; swap in the torch version for GPU-scale runs.
 
-  python train.py samples.bin --out weights.bin [--init prev.bin]
+  python train.py samples.bin [more.bin | replay.txt ...] --out weights.bin [--init prev.bin]
                   [--epochs 8] [--batch 256] [--lr 1e-3] [--vw 1.0]
+                  [--chunk 8192] [--prefetch 2] [--loader-threads 2] [--workers 4]
+                  [--dedup] [--recency 4] [--priority 0.6] [--stream-out data.bin]
+                  [--quantize int8|f16] [--hidden 128,128]
+                  [--teacher big.bin [--distill 1.0] [--temperature 1.0]]
+
+README.md (Training) covers the loss, data loading, data-parallel training,
+replay sampling, streamed input, quantized export and distillation.
 """
 import argparse
+import multiprocessing as mp
+import os
 import struct
+import threading
+import time
+from multiprocessing import shared_memory
 import numpy as np
 
-# Architecture — must match include/sw/net.hpp.
-H1, H2 = 128, 128
-WN_MAGIC = 0x53574E31   # "SWN1"
-SP_MAGIC = 0x53575350   # "SWSP"
+from loader import BatchLoader
+from metrics import Recorder
+from replay import ReplayBuffer, ReplayIndex, concat
 
+# Architecture — must match include/sw/net.hpp. HIDDEN is the default; every
+# weights file records its own hidden widths.
+HIDDEN = (128, 128)
+WN_MAGIC = 0x53574E31   # "SWN1": two hidden layers, float32
+WN2_MAGIC = 0x53574E32  # "SWN2": versioned, any depth, float32/float16/int8
+WN2_VERSION = 2
+DTYPES = {"f32": 0, "f16": 1, "int8": 2}
 
-def read_samples(path):
-    with open(path, "rb") as f:
-        magic, n, feat, pol, val = struct.unpack("<Iiiii", f.read(20))
-        assert magic == SP_MAGIC, "not a self-play sample file"
-        F = np.frombuffer(f.read(4 * n * feat), dtype=np.float32).reshape(n, feat).copy()
-        P = np.frombuffer(f.read(4 * n * pol), dtype=np.float32).reshape(n, pol).copy()
-        V = np.frombuffer(f.read(4 * n * val), dtype=np.float32).reshape(n, val).copy()
-    return F, P, V, feat, pol, val
+
+def layout(feat, pol, val, hidden=HIDDEN):
+    """[(name, shape, offset)] of each tensor in the flat parameter vector:
+    W1,b1 .. Wd,bd for the hidden layers, then Wp,bp and Wv,bv (file order)."""
+    shapes, fan_in = [], feat
+    for i, h in enumerate(hidden, 1):
+        shapes += [(f"W{i}", (h, fan_in)), (f"b{i}", (h,))]
+        fan_in = h
+    shapes += [("Wp", (pol, fan_in)), ("bp", (pol,)), ("Wv", (val, fan_in)), ("bv", (val,))]
+    out, off = [], 0
+    for name, shape in shapes:
+        out.append((name, shape, off))
+        off += int(np.prod(shape))
+    return out
+
+
+def views(flat, feat, pol, val, hidden=HIDDEN):
+    """Named tensors viewing into a flat parameter (or gradient) vector."""
+    return {name: flat[off:off + int(np.prod(shape))].reshape(shape)
+            for name, shape, off in layout(feat, pol, val, hidden)}
+
+
+def n_params(feat, pol, val, hidden=HIDDEN):
+    _, shape, off = layout(feat, pol, val, hidden)[-1]
+    return off + int(np.prod(shape))
+
+
+def hidden_of(p):
+    """Hidden widths of a params dict (float, or quantize.quantize()d)."""
+    depth = sum(k[0] == "b" and k[1:].isdigit() for k in p)
+    return tuple(len(p[f"b{i}"]) for i in range(1, depth + 1))
+
+
+def layer_names(hidden):
+    """[(weight, bias)] names in file order: the hidden layers, then the heads."""
+    return [(f"W{i}", f"b{i}") for i in range(1, len(hidden) + 1)] + [("Wp", "bp"), ("Wv", "bv")]
+
+
+def parse_hidden(spec):
+    """'128,128' -> (128, 128): one width per hidden layer."""
+    hidden = tuple(int(w) for w in spec.split(","))
+    if not hidden or min(hidden) < 1:
+        raise ValueError(f"bad hidden widths {spec!r}")
+    return hidden
 
 
 def he(shape, fan_in, rng):
     return (rng.standard_normal(shape) * np.sqrt(2.0 / fan_in)).astype(np.float32)
 
 
-def init_params(feat, pol, val, rng):
-    return {
-        "W1": he((H1, feat), feat, rng), "b1": np.zeros(H1, np.float32),
-        "W2": he((H2, H1), H1, rng),     "b2": np.zeros(H2, np.float32),
-        "Wp": he((pol, H2), H2, rng),    "bp": np.zeros(pol, np.float32),
-        "Wv": he((val, H2), H2, rng),    "bv": np.zeros(val, np.float32),
-    }
+def init_params(feat, pol, val, rng, hidden=HIDDEN):
+    p = views(np.zeros(n_params(feat, pol, val, hidden), np.float32), feat, pol, val, hidden)
+    for name, shape, _ in layout(feat, pol, val, hidden):
+        if name[0] == "W":
+            p[name][:] = he(shape, shape[1], rng)
+    return p
+
+
+def flat_of(p):
+    """The flat vector behind a params dict from init_params/load_params."""
+    return p["W1"].base
+
+
+def write_header(f, dims, hidden, dtype="f32"):
+    """SWN1 for float32 nets two layers deep (what older `sw7` builds read),
+    SWN2 for anything else."""
+    feat, pol, val = dims
+    if dtype == "f32" and len(hidden) == 2:
+        f.write(struct.pack("<I5i", WN_MAGIC, feat, *hidden, pol, val))
+    else:
+        f.write(struct.pack(f"<I6i{len(hidden)}i", WN2_MAGIC, WN2_VERSION, DTYPES[dtype],
+                            feat, pol, val, len(hidden), *hidden))
+
+
+def read_header(f):
+    """(dtype, (feat, pol, val), hidden) of an open weights file, which is left
+    at the first weight. Raises ValueError if it is not one."""
+    magic, = struct.unpack("<I", f.read(4))
+    dtype = "f32"
+    if magic == WN2_MAGIC:
+        version, code = struct.unpack("<2i", f.read(8))
+        dtype = {c: d for d, c in DTYPES.items()}.get(code)
+        if version not in (1, 2) or dtype is None:
+            raise ValueError(f"unsupported SWN2 version {version} / dtype {code}")
+        if version == 2:
+            feat, pol, val, depth = struct.unpack("<4i", f.read(16))
+            return dtype, (feat, pol, val), struct.unpack(f"<{depth}i", f.read(4 * depth))
+    elif magic != WN_MAGIC:
+        raise ValueError("not a weights file")
+    feat, h1, h2, pol, val = struct.unpack("<5i", f.read(20))
+    return dtype, (feat, pol, val), (h1, h2)
+
+
+def weights_info(path):
+    """read_header of a weights file: (dtype, (feat, pol, val), hidden)."""
+    with open(path, "rb") as f:
+        return read_header(f)
 
 
 def load_params(path, feat, pol, val):
-    order = [("W1", (H1, feat)), ("b1", (H1,)), ("W2", (H2, H1)), ("b2", (H2,)),
-             ("Wp", (pol, H2)), ("bp", (pol,)), ("Wv", (val, H2)), ("bv", (val,))]
+    """Float32 params of a weights file, in whatever hidden widths it records."""
     with open(path, "rb") as f:
-        magic = struct.unpack("<I", f.read(4))[0]
-        hdr = struct.unpack("<5i", f.read(20))
-        assert magic == WN_MAGIC and hdr == (feat, H1, H2, pol, val), "weights arch mismatch"
-        p = {}
-        for name, shape in order:
-            cnt = int(np.prod(shape))
-            p[name] = np.frombuffer(f.read(4 * cnt), np.float32).reshape(shape).copy()
-    return p
+        dtype, dims, hidden = read_header(f)
+        assert dtype == "f32" and dims == (feat, pol, val), "weights arch mismatch"
+        flat = np.fromfile(f, np.float32, n_params(feat, pol, val, hidden))
+    assert len(flat) == n_params(feat, pol, val, hidden), "truncated weights file"
+    return views(flat, feat, pol, val, hidden)
 
 
 def save_params(path, p, feat, pol, val):
-    with open(path, "wb") as f:
-        f.write(struct.pack("<I", WN_MAGIC))
-        f.write(struct.pack("<5i", feat, H1, H2, pol, val))
-        for name in ["W1", "b1", "W2", "b2", "Wp", "bp", "Wv", "bv"]:
-            f.write(np.ascontiguousarray(p[name], np.float32).tobytes())
+    hidden = hidden_of(p)
+    flat = flat_of(p)
+    if flat is None or flat.size != n_params(feat, pol, val, hidden):  # a dict built elsewhere
+        flat = np.concatenate([np.ravel(p[name])
+                               for name, _, _ in layout(feat, pol, val, hidden)])
+    with open(path + ".tmp", "wb") as f:
+        write_header(f, (feat, pol, val), hidden)
+        f.write(np.ascontiguousarray(flat, np.float32).tobytes())
+    os.replace(path + ".tmp", path)
+
+
+def check_weights(path):
+    """True if `path` is a complete weights file (magic, header, every weight)."""
+    try:
+        with open(path, "rb") as f:
+            dtype, (feat, pol, val), hidden = read_header(f)
+            start = f.tell()
+    except (OSError, struct.error, ValueError):
+        return False
+    size = 0
+    for name, shape, _ in layout(feat, pol, val, hidden):
+        n = int(np.prod(shape))
+        if name[0] == "b" or dtype == "f32":
+            size += 4 * n
+        elif dtype == "f16":
+            size += 2 * n
+        else:
+            size += 4 * shape[0] + n  # per-row scales, then the int8 rows
+    return os.path.getsize(path) == start + size
 
 
 def softmax(z):
@@ -69,71 +184,444 @@ def softmax(z):
     return e / e.sum(1, keepdims=True)
 
 
+def masked_policy(logits, tgt, legal, out=None, denom=None, rows=None):
+    """Soft-target CE over each row's legal buckets, from sparse targets.
+
+    tgt = (row, bucket, prob) and legal = (row, bucket), both grouped by row,
+    every row with at least one legal bucket. Returns (mean loss, dlogits);
+    dlogits (written into `out` if given) is zero outside the legal buckets and
+    is divided by `denom` (default: the row count). `rows`, if given, receives
+    each row's loss.
+    """
+    B = logits.shape[0]
+    D = denom or B
+    tr, tc, tp = tgt
+    lr, lc = legal
+    seg = np.flatnonzero(np.diff(lr, prepend=-1))
+    assert len(seg) == B, "every sample needs at least one legal bucket"
+    L = logits[lr, lc]
+    mx = np.maximum.reduceat(L, seg)
+    e = np.exp(L - mx[lr])
+    Z = np.add.reduceat(e, seg)
+    terms = tp * (logits[tr, tc] - mx[tr] - np.log(Z[tr]))
+    loss = float(-terms.sum() / B)
+    if rows is not None:
+        rows[:] = -np.bincount(tr, terms, B)
+    if out is None:
+        dlogits = np.zeros_like(logits)
+    else:
+        dlogits = out
+        dlogits.fill(0)
+    dlogits[lr, lc] = e / Z[lr] / D
+    dlogits[tr, tc] -= tp / D
+    return loss, dlogits
+
+
+class Engine:
+    """Forward/backward and Adam over one flat SWN1-layout parameter vector.
+
+    Activations, gradients and scratch space are allocated once per batch size
+    and every step runs on `out=` ufuncs and in-place updates; parameters,
+    gradients and both Adam moments are single flat vectors, so the update is a
+    handful of whole-vector ops instead of several temporaries per tensor. The
+    arithmetic is the same, in the same order, as the textbook version, so a
+    fixed seed gives bit-identical weights.
+
+    `grad`, `m` and `v` may be passed in (e.g. shared-memory views; see
+    DataParallel); otherwise they are allocated here.
+    """
+
+    def __init__(self, p, feat, pol, val, lr=1e-3, vw=1.0, grad=None, m=None, v=None):
+        self.dims = feat, pol, val
+        self.hidden = hidden_of(p)
+        self.lr, self.vw = lr, vw
+        self.flat = flat_of(p)
+        assert self.flat is not None and \
+            self.flat.size == n_params(feat, pol, val, self.hidden), \
+            "params must view one flat vector (init_params/load_params)"
+        self.p = p
+        self.grad = np.zeros_like(self.flat) if grad is None else grad
+        self.g = views(self.grad, feat, pol, val, self.hidden)
+        self.m = np.zeros_like(self.flat) if m is None else m
+        self.v = np.zeros_like(self.flat) if v is None else v
+        self.s1 = np.empty_like(self.flat)
+        self.s2 = np.empty_like(self.flat)
+        self.b1, self.b2, self.eps, self.t = 0.9, 0.999, 1e-8, 0
+        self._bufs = {}
+
+    def buffers(self, B):
+        if B not in self._bufs:
+            _, pol, val = self.dims
+            H = self.hidden
+            f = lambda *shape: np.empty(shape, np.float32)
+            self._bufs[B] = dict(
+                z=[f(B, h) for h in H], a=[f(B, h) for h in H], da=[f(B, h) for h in H],
+                mask=[np.empty((B, h), bool) for h in H], h=f(B, H[-1]),
+                logits=f(B, pol), sm=f(B, pol), dlogits=f(B, pol), mx=f(B, 1), sum=f(B, 1),
+                vp=f(B, val), dvraw=f(B, val), vs1=f(B, val), vs2=f(B, val))
+        return self._bufs[B]
+
+    def step(self, X, Vt, Pt=None, tgt=None, legal=None, rows=None):
+        """One minibatch: forward, loss, backward, Adam. Returns (policy CE, value BCE).
+
+        Pass the dense policy target `Pt`, or sparse `tgt`/`legal` for the
+        masked loss (see masked_policy). `rows`, if given, receives each row's
+        policy CE + vw * value BCE (e.g. for ReplayIndex.update).
+        """
+        losses = self.grads(X, Vt, Pt, tgt, legal, rows=rows)
+        self.adam()
+        return losses
+
+    def grads(self, X, Vt, Pt=None, tgt=None, legal=None, denom=None, rows=None):
+        """Forward + backward into self.grad; returns the batch's mean losses.
+
+        Gradients are summed over the rows and divided by `denom` (default: the
+        row count), so shards of a larger batch can be summed into its mean.
+        """
+        p, g, b = self.p, self.g, self.buffers(X.shape[0])
+        B = X.shape[0]
+        D = denom or B
+        z, a, da = b["z"], b["a"], b["da"]
+        logits, vp = b["logits"], b["vp"]
+        # forward
+        x = X
+        for i in range(len(z)):
+            np.matmul(x, p[f"W{i + 1}"].T, out=z[i]); np.add(z[i], p[f"b{i + 1}"], out=z[i])
+            np.maximum(z[i], 0, out=a[i])
+            x = a[i]
+        a2 = a[-1]
+        np.matmul(a2, p["Wp"].T, out=logits); np.add(logits, p["bp"], out=logits)
+        np.matmul(a2, p["Wv"].T, out=vp); np.add(vp, p["bv"], out=vp)
+        np.negative(vp, out=vp); np.exp(vp, out=vp); np.add(1.0, vp, out=vp)
+        np.divide(1.0, vp, out=vp)
+        # losses (soft-target CE + value BCE) and the policy head's gradient
+        if Pt is None:
+            pl, dlogits = masked_policy(logits, tgt, legal, out=b["dlogits"], denom=D,
+                                        rows=rows)
+        else:
+            sm, dlogits = b["sm"], b["dlogits"]
+            np.max(logits, 1, keepdims=True, out=b["mx"])
+            np.subtract(logits, b["mx"], out=sm); np.exp(sm, out=sm)
+            np.sum(sm, 1, keepdims=True, out=b["sum"]); np.divide(sm, b["sum"], out=sm)
+            np.add(sm, 1e-9, out=dlogits); np.log(dlogits, out=dlogits)
+            np.multiply(Pt, dlogits, out=dlogits)
+            rs = dlogits.sum(1)
+            pl = float(-rs.mean())
+            if rows is not None:
+                np.negative(rs, out=rows)
+            np.subtract(sm, Pt, out=dlogits); np.divide(dlogits, D, out=dlogits)
+        vs1, vs2 = b["vs1"], b["vs2"]
+        np.add(vp, 1e-9, out=vs1); np.log(vs1, out=vs1); np.multiply(Vt, vs1, out=vs1)
+        np.subtract(1, vp, out=vs2); np.add(vs2, 1e-9, out=vs2); np.log(vs2, out=vs2)
+        np.subtract(1, Vt, out=b["dvraw"]); np.multiply(b["dvraw"], vs2, out=vs2)
+        np.add(vs1, vs2, out=vs1)
+        vl = float(-vs1.mean())
+        if rows is not None:
+            rows -= self.vw * vs1.mean(1)
+        # backward
+        dvraw = b["dvraw"]
+        np.subtract(vp, Vt, out=dvraw); np.multiply(self.vw, dvraw, out=dvraw)
+        np.divide(dvraw, D, out=dvraw)
+        np.matmul(dlogits.T, a2, out=g["Wp"]); np.sum(dlogits, 0, out=g["bp"])
+        np.matmul(dvraw.T, a2, out=g["Wv"]); np.sum(dvraw, 0, out=g["bv"])
+        np.matmul(dlogits, p["Wp"], out=da[-1]); np.matmul(dvraw, p["Wv"], out=b["h"])
+        np.add(da[-1], b["h"], out=da[-1])
+        for i in reversed(range(len(z))):
+            np.greater(z[i], 0, out=b["mask"][i]); np.multiply(da[i], b["mask"][i], out=da[i])
+            x = a[i - 1] if i else X
+            np.matmul(da[i].T, x, out=g[f"W{i + 1}"]); np.sum(da[i], 0, out=g[f"b{i + 1}"])
+            if i:
+                np.matmul(da[i], p[f"W{i + 1}"], out=da[i - 1])
+        return pl, vl
+
+    def adam(self, lo=0, hi=None, grad=None):
+        """In-place Adam over the flat vectors, using the two flat scratch buffers.
+
+        `lo:hi` restricts the update to a slice of the parameters and `grad`
+        replaces self.grad (as a full-length vector).
+        """
+        self.t += 1
+        sl = slice(lo, hi)
+        gr = (self.grad if grad is None else grad)[sl]
+        m, v, s1, s2, flat = self.m[sl], self.v[sl], self.s1[sl], self.s2[sl], self.flat[sl]
+        b1, b2 = self.b1, self.b2
+        np.multiply(b1, m, out=m); np.multiply(1 - b1, gr, out=s1); np.add(m, s1, out=m)
+        np.multiply(gr, gr, out=s1); np.multiply(1 - b2, s1, out=s1)
+        np.multiply(b2, v, out=v); np.add(v, s1, out=v)
+        np.divide(m, 1 - b1 ** self.t, out=s1)
+        np.divide(v, 1 - b2 ** self.t, out=s2)
+        np.multiply(self.lr, s1, out=s1)
+        np.sqrt(s2, out=s2); np.add(s2, self.eps, out=s2)
+        np.divide(s1, s2, out=s1)
+        np.subtract(flat, s1, out=flat)
+
+
+def _dp_arrays(buf, P, workers, batch):
+    """Carve the DataParallel shared block into named arrays (64-byte aligned)."""
+    specs = [("flat", (P,), np.float32), ("m", (P,), np.float32), ("v", (P,), np.float32),
+             ("gsum", (P,), np.float32), ("G", (workers, P), np.float32),
+             ("idx", (batch,), np.int64), ("ctrl", (2,), np.int64),
+             ("loss", (workers, 3), np.float64)]
+    out, off = {}, 0
+    for name, shape, dt in specs:
+        size = int(np.prod(shape)) * np.dtype(dt).itemsize
+        if buf is not None:
+            out[name] = np.ndarray(shape, dt, buffer=buf, offset=off)
+        off += -(-size // 64) * 64
+    return out if buf is not None else off
+
+
+def _dp_worker(k, workers, name, paths, dims, hidden, batch, lr, vw, sparse, start, mid, done):
+    shm = shared_memory.SharedMemory(name=name)
+    sh = _dp_arrays(shm.buf, n_params(*dims, hidden), workers, batch)
+    P = sh["flat"].size
+    lo, hi = P * k // workers, P * (k + 1) // workers
+    try:
+        buf = ReplayBuffer.from_paths(paths)
+        eng = Engine(views(sh["flat"], *dims, hidden), *dims, lr=lr, vw=vw,
+                     grad=sh["G"][k], m=sh["m"], v=sh["v"])
+        while True:
+            start.wait()
+            if sh["ctrl"][1]:
+                return
+            n = int(sh["ctrl"][0])
+            mine = sh["idx"][n * k // workers:n * (k + 1) // workers]
+            if len(mine) == 0:
+                eng.grad.fill(0)
+                pl = vl = 0.0
+            elif sparse:
+                X, Vt, tgt, legal = buf.gather_sparse(mine)
+                pl, vl = eng.grads(X, Vt, tgt=tgt, legal=legal, denom=n)
+            else:
+                X, Pt, Vt = buf.gather(mine)
+                pl, vl = eng.grads(X, Vt, Pt, denom=n)
+            sh["loss"][k] = pl, vl, len(mine)
+            mid.wait()
+            # reduce all workers' gradients over this worker's parameter slice, then step it
+            np.sum(sh["G"][:, lo:hi], 0, out=sh["gsum"][lo:hi])
+            eng.adam(lo, hi, sh["gsum"])
+            done.wait()
+    except BaseException:
+        for b in (start, mid, done):
+            b.abort()
+        raise
+
+
+class DataParallel:
+    """Engine steps split across `workers` processes.
+
+    Parameters, Adam moments, every worker's gradient and the current batch's
+    row indices live in one shared-memory block, so nothing is pickled per
+    step. step(idx) publishes a global batch's indices; each worker gathers its
+    contiguous share from its own mapping of the sample files and writes that
+    share's gradient (divided by the global batch size). After a barrier each
+    worker sums all the gradients over its 1/workers slice of the parameters
+    and applies Adam to that slice, so the reduction and the update are
+    parallel too.
+
+    The params dict `p` is copied in at start and written back by close().
+    """
+
+    def __init__(self, p, paths, dims, workers, batch, lr, vw, sparse, timeout=600):
+        self.p, self.workers = p, workers
+        P = n_params(*dims, hidden_of(p))
+        self.shm = shared_memory.SharedMemory(create=True, size=_dp_arrays(None, P, workers, batch))
+        self.sh = _dp_arrays(self.shm.buf, P, workers, batch)
+        self.sh["flat"][:] = flat_of(p)
+        for k in ("m", "v", "ctrl"):
+            self.sh[k].fill(0)
+        for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+            os.environ.setdefault(var, "1")  # one BLAS thread per worker; cores go to workers
+        ctx = mp.get_context("spawn")
+        self.start = ctx.Barrier(workers + 1, timeout=timeout)
+        self.mid = ctx.Barrier(workers, timeout=timeout)
+        self.done = ctx.Barrier(workers + 1, timeout=timeout)
+        self.procs = [ctx.Process(target=_dp_worker, daemon=True,
+                                  args=(k, workers, self.shm.name, paths, dims, hidden_of(p),
+                                        batch, lr, vw, sparse, self.start, self.mid, self.done))
+                      for k in range(workers)]
+        for pr in self.procs:
+            pr.start()
+
+    def step(self, idx):
+        """One optimizer step on global rows `idx`; returns (policy CE, value BCE)."""
+        n = len(idx)
+        self.sh["idx"][:n] = idx
+        self.sh["ctrl"][0] = n
+        try:
+            self.start.wait()
+            self.done.wait()
+        except threading.BrokenBarrierError:
+            codes = [pr.exitcode for pr in self.procs]
+            raise RuntimeError(f"data-parallel worker failed (exit codes {codes})") from None
+        loss = self.sh["loss"]
+        return tuple(float(x) for x in loss[:, :2].T @ loss[:, 2] / n)
+
+    def close(self):
+        if self.shm is None:
+            return
+        flat_of(self.p)[:] = self.sh["flat"]
+        self.sh["ctrl"][1] = 1
+        try:
+            self.start.wait()
+        except threading.BrokenBarrierError:
+            pass
+        for pr in self.procs:
+            pr.join(timeout=10)
+            if pr.is_alive():
+                pr.kill()
+        self.sh = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("samples")
+    ap.add_argument("samples", nargs="+", help="sample files and/or manifests")
     ap.add_argument("--out", required=True)
     ap.add_argument("--init", default=None)
     ap.add_argument("--epochs", type=int, default=8)
     ap.add_argument("--batch", type=int, default=256)
     ap.add_argument("--lr", type=float, default=1e-3)
     ap.add_argument("--vw", type=float, default=1.0, help="value loss weight")
+    ap.add_argument("--chunk", type=int, default=0,
+                    help="rows per contiguous shuffle chunk (0 = global permutation)")
+    ap.add_argument("--prefetch", type=int, default=2, help="minibatches gathered ahead")
+    ap.add_argument("--loader-threads", type=int, default=2)
+    ap.add_argument("--policy", choices=["masked", "dense"], default="masked",
+                    help="softmax over legal buckets (needs legal data) or all buckets")
+    ap.add_argument("--metrics", default=None, help="append per-epoch JSON records here")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="data-parallel processes, each taking --batch/workers rows per step")
+    ap.add_argument("--dedup", action="store_true",
+                    help="merge identical positions into one sample with averaged targets")
+    ap.add_argument("--recency", type=float, default=0.0,
+                    help="sampling weight half-life in files, newest first (0 = uniform)")
+    ap.add_argument("--priority", type=float, default=0.0,
+                    help="sample proportionally to last loss ** PRIORITY (0 = uniform)")
+    ap.add_argument("--stream-out", default=None,
+                    help="write the rows streamed through named pipes to this sample file")
+    ap.add_argument("--quantize", choices=["int8", "f16"], default=None,
+                    help="also export SWN2 weights in this dtype (see quantize.py)")
+    ap.add_argument("--hidden", default=None,
+                    help="hidden layer widths of a new net, comma-separated (default 128,128)")
+    ap.add_argument("--teacher", default=None, help="float32 weights to distil from")
+    ap.add_argument("--distill", type=float, default=1.0,
+                    help="weight of the teacher's targets (0..1) with --teacher")
+    ap.add_argument("--temperature", type=float, default=1.0,
+                    help="softmax temperature of the teacher's policy")
     a = ap.parse_args()
+    try:
+        hidden = parse_hidden(a.hidden) if a.hidden else None
+    except ValueError as e:
+        ap.error(str(e))
+    if a.teacher and a.workers > 1:
+        ap.error("--teacher needs --workers 1")
+    weighted = a.dedup or a.recency > 0 or a.priority > 0
+    if weighted and (a.workers > 1 or a.chunk > 0):
+        ap.error("--dedup/--recency/--priority need --workers 1 and --chunk 0")
+    rec = Recorder(a.metrics)
     rng = np.random.default_rng(0)
 
-    F, P, V, feat, pol, val = read_samples(a.samples)
-    print(f"samples: {F.shape[0]}  feat={feat} pol={pol} val={val}")
-    p = load_params(a.init, feat, pol, val) if a.init else init_params(feat, pol, val, rng)
-
-    # Adam state
-    m = {k: np.zeros_like(v) for k, v in p.items()}
-    v2 = {k: np.zeros_like(v) for k, v in p.items()}
-    b1a, b2a, eps, t = 0.9, 0.999, 1e-8, 0
-
-    n = F.shape[0]
-    for ep in range(a.epochs):
-        idx = rng.permutation(n)
-        ploss = vloss = 0.0
-        nb = 0
-        for s in range(0, n, a.batch):
-            bi = idx[s:s + a.batch]
-            X, Pt, Vt = F[bi], P[bi], V[bi]
-            B = X.shape[0]
-            # forward
-            z1 = X @ p["W1"].T + p["b1"]; a1 = np.maximum(z1, 0)
-            z2 = a1 @ p["W2"].T + p["b2"]; a2 = np.maximum(z2, 0)
-            logits = a2 @ p["Wp"].T + p["bp"]
-            vraw = a2 @ p["Wv"].T + p["bv"]
-            sm = softmax(logits)
-            vp = 1.0 / (1.0 + np.exp(-vraw))
-            # losses (soft-target CE + value BCE)
-            ploss += float(-(Pt * np.log(sm + 1e-9)).sum(1).mean())
-            vloss += float(-(Vt * np.log(vp + 1e-9) + (1 - Vt) * np.log(1 - vp + 1e-9)).mean())
-            nb += 1
-            # backward
-            dlogits = (sm - Pt) / B
-            dvraw = a.vw * (vp - Vt) / B
-            g = {}
-            g["Wp"] = dlogits.T @ a2; g["bp"] = dlogits.sum(0)
-            g["Wv"] = dvraw.T @ a2;   g["bv"] = dvraw.sum(0)
-            da2 = dlogits @ p["Wp"] + dvraw @ p["Wv"]
-            dz2 = da2 * (z2 > 0)
-            g["W2"] = dz2.T @ a1; g["b2"] = dz2.sum(0)
-            da1 = dz2 @ p["W2"]
-            dz1 = da1 * (z1 > 0)
-            g["W1"] = dz1.T @ X; g["b1"] = dz1.sum(0)
-            # Adam step
-            t += 1
-            for k in p:
-                m[k] = b1a * m[k] + (1 - b1a) * g[k]
-                v2[k] = b2a * v2[k] + (1 - b2a) * (g[k] * g[k])
-                mh = m[k] / (1 - b1a ** t)
-                vh = v2[k] / (1 - b2a ** t)
-                p[k] -= a.lr * mh / (np.sqrt(vh) + eps)
-        print(f"  epoch {ep+1}/{a.epochs}  policy_ce={ploss/nb:.4f}  value_bce={vloss/nb:.4f}")
+    buf = ReplayBuffer.from_paths(a.samples)
+    if buf.streams and (weighted or a.workers > 1):
+        ap.error("streamed samples need --workers 1 and no --dedup/--recency/--priority")
+    last = buf.refresh()
+    feat, pol, val = buf.dims
+    masked = a.policy == "masked" and buf.has_legal
+    live = f", {len(buf.streams)} streaming" if buf.streams else ""
+    print(f"samples: {len(buf)} ({len(buf.shards)} files{live})  feat={feat} pol={pol} val={val}  "
+          f"policy={'masked' if masked else 'dense'}")
+    src = buf
+    if weighted:
+        t0 = time.perf_counter()
+        src = ReplayIndex(buf, dedup=a.dedup, recency=a.recency, priority=a.priority)
+        print(f"replay index: {len(src)} samples from {len(buf)} rows "
+              f"({1 - len(src) / max(len(buf), 1):.1%} duplicates) in "
+              f"{time.perf_counter() - t0:.2f}s")
+    if a.init:
+        p = load_params(a.init, feat, pol, val)
+        if hidden and hidden != hidden_of(p):
+            ap.error(f"--hidden {a.hidden} but {a.init} has {hidden_of(p)}")
+    else:
+        p = init_params(feat, pol, val, rng, hidden or HIDDEN)
+    teacher = None
+    if a.teacher:
+        from distill import Teacher  # distill.py imports train.py
+        teacher = Teacher(a.teacher, buf.dims, a.distill, a.temperature)
+        print(f"distilling {a.teacher} ({hidden_of(teacher.p)}) into {hidden_of(p)}: "
+              f"alpha={a.distill} T={a.temperature}")
+
+    loader = BatchLoader(src, a.batch, rng, chunk=a.chunk, prefetch=a.prefetch,
+                         threads=a.loader_threads, sparse=masked, indexed=weighted)
+    dp = None
+    if a.workers > 1:
+        dp = DataParallel(p, buf.paths, buf.dims, a.workers, a.batch, a.lr, a.vw, masked)
+
+        def steps():  # (rows, losses) per step; workers gather their own rows
+            for idx in loader.order():
+                yield idx, dp.step(idx)
+    else:
+        eng = Engine(p, feat, pol, val, lr=a.lr, vw=a.vw)
+
+        def steps():
+            for item in loader.epoch():
+                idx, batch = item if weighted else (None, item)
+                rows = np.empty(len(batch[0])) if a.priority > 0 else None
+                if masked:
+                    X, Vt, tgt, legal = batch
+                    if teacher:
+                        Vt, tgt = teacher.sparse(X, Vt, tgt, legal)
+                    losses = eng.step(X, Vt, tgt=tgt, legal=legal, rows=rows)
+                else:
+                    X, Pt, Vt = batch
+                    if teacher:
+                        Pt, Vt = teacher.dense(X, Pt, Vt)
+                    losses = eng.step(X, Vt, Pt=Pt, rows=rows)
+                if rows is not None:
+                    src.update(idx, rows)
+                yield X, losses
+    try:
+        ep = seen = 0
+        while ep < a.epochs or not last:
+            if ep:
+                last = buf.refresh()
+            while not last and len(buf) == seen:  # streaming: wait for new games
+                time.sleep(0.1)
+                last = buf.refresh()
+            seen = len(buf)
+            ploss = vloss = 0.0
+            nb = ns = 0
+            t0 = time.perf_counter()
+            for rows, (pl, vl) in steps():
+                ploss += pl
+                vloss += vl
+                nb += 1
+                ns += len(rows)
+            dt = time.perf_counter() - t0
+            ep += 1
+            live = "" if last else f"  [{len(buf)} rows, streaming]"
+            print(f"  epoch {ep}/{a.epochs}  policy_ce={ploss/nb:.4f}  value_bce={vloss/nb:.4f}"
+                  f"  ({nb / dt:.0f} steps/s, {ns / dt:,.0f} samples/s){live}")
+            rec.write(phase="epoch", trainer="numpy", epoch=ep, policy_ce=round(ploss / nb, 5),
+                      value_bce=round(vloss / nb, 5), steps_per_s=round(nb / dt, 1),
+                      samples_per_s=round(ns / dt, 1))
+    finally:
+        if dp is not None:
+            dp.close()
 
+    for s in buf.streams:
+        if s.error:
+            print(f"  warning: {s.error}; kept its {s.n} rows from complete games")
+    if a.stream_out and buf.streams:
+        n = concat(buf.streams, a.stream_out)
+        print(f"wrote {n} streamed samples -> {a.stream_out}")
     save_params(a.out, p, feat, pol, val)
     print(f"wrote weights -> {a.out}")
+    if a.quantize:
+        from quantize import export  # quantize.py imports train.py
+        print(f"wrote {a.quantize} weights -> {export(a.out, a.quantize)[0]}")
 
 
 if __name__ == "__main__":
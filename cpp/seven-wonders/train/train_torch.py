@@ -5,112 +5,255 @@ Same CLI as train.py; uses PyTorch + CUDA (the RTX 5090) for scale. Install a
 Blackwell-capable build first, e.g.:
     pip install --pre torch --index-url https://download.pytorch.org/whl/nightly/cu128
 
-  python train_torch.py samples.bin --out w.bin [--init prev.bin]
+  python train_torch.py samples.bin [more.bin | replay.txt ...] --out w.bin [--init prev.bin]
                         [--epochs 8] [--batch 1024] [--lr 1e-3] [--vw 1.0]
+                        [--stream [--chunk 8192] [--prefetch 2]]
+                        [--dedup] [--recency 4] [--priority 0.6] [--stream-out data.bin]
+                        [--quantize int8|f16] [--hidden 128,128]
+                        [--teacher big.bin [--distill 1.0] [--temperature 1.0]]
+
+By default the whole window is staged on the device. `--stream` instead feeds
+minibatches from loader.py (gathered on host threads ahead of use), for windows
+that do not fit in device memory. As in train.py, samples with legal-move data
+train with the policy softmax restricted to legal buckets (`--policy dense` to
+disable). `--dedup`/`--recency`/`--priority` sample from a replay.ReplayIndex as
+in train.py, and imply `--stream`. Named pipes from `sw7 selfplay` are trained
+on as they fill, with --stream-out, exactly as in train.py (implies --stream).
+`--hidden` and `--teacher/--distill/--temperature` are train.py's too.
 """
 import argparse
-import struct
+import os
+import time
+import warnings
 import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
-H1, H2 = 128, 128
-WN_MAGIC = 0x53574E31
-SP_MAGIC = 0x53575350
-
-
-def read_samples(path):
-    with open(path, "rb") as f:
-        magic, n, feat, pol, val = struct.unpack("<Iiiii", f.read(20))
-        assert magic == SP_MAGIC
-        Fa = np.frombuffer(f.read(4 * n * feat), np.float32).reshape(n, feat).copy()
-        Pa = np.frombuffer(f.read(4 * n * pol), np.float32).reshape(n, pol).copy()
-        Va = np.frombuffer(f.read(4 * n * val), np.float32).reshape(n, val).copy()
-    return Fa, Pa, Va, feat, pol, val
+from loader import BatchLoader
+from metrics import Recorder
+from replay import ReplayBuffer, ReplayIndex, concat, legal_coo
+from train import HIDDEN, hidden_of, layer_names, load_params, parse_hidden, write_header
 
 
 class Net(nn.Module):
-    def __init__(self, feat, pol, val):
+    def __init__(self, feat, pol, val, hidden=HIDDEN):
         super().__init__()
-        self.l1 = nn.Linear(feat, H1)
-        self.l2 = nn.Linear(H1, H2)
-        self.p = nn.Linear(H2, pol)
-        self.v = nn.Linear(H2, val)
+        self.widths = tuple(hidden)
+        self.hidden = nn.ModuleList(nn.Linear(i, o) for i, o in zip((feat,) + self.widths,
+                                                                     self.widths))
+        self.p = nn.Linear(self.widths[-1], pol); self.v = nn.Linear(self.widths[-1], val)
+
+    def linears(self):  # file order
+        return [*self.hidden, self.p, self.v]
 
     def forward(self, x):
-        h = torch.relu(self.l1(x))
-        h = torch.relu(self.l2(h))
+        h = x
+        for lin in self.hidden:
+            h = torch.relu(lin(h))
         return self.p(h), self.v(h)  # policy logits, value raw
 
 
+def to_device(buf, dev, masked, chunk=65536):
+    # Stage the mapped window onto the device a chunk at a time — no host-side
+    # concatenation, so peak host RSS stays near one chunk. With `masked`, a
+    # (n, pol) bool legal-bucket mask is staged alongside.
+    n, (feat, pol, val) = len(buf), buf.dims
+    out = [torch.empty((n, d), dtype=torch.float32, device=dev) for d in (feat, pol, val)]
+    mask = torch.zeros((n, pol), dtype=torch.bool, device=dev) if masked else None
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)  # read-only maps; we only read
+        for s, o in zip(buf.shards, buf.offsets):
+            for lo in range(0, s.n, chunk):
+                rows = np.arange(lo, min(lo + chunk, s.n))
+                for dst, src in zip(out, s.rows(rows)):
+                    dst[o + lo:o + lo + len(rows)].copy_(torch.from_numpy(np.asarray(src)))
+                if masked:
+                    r, c = legal_coo(s, rows)
+                    mask[torch.from_numpy(r + o + lo).to(dev), torch.from_numpy(c).to(dev)] = True
+    return out + [mask]
+
+
+def dense_batch(sparse, pol, dev):
+    # A gather_sparse batch -> device tensors (X, Pt, Vt, legal mask).
+    X, Vt, (tr, tc, tp), (lr, lc) = sparse
+    B = X.shape[0]
+    Pt = torch.zeros((B, pol), dtype=torch.float32)
+    Pt[torch.from_numpy(tr), torch.from_numpy(tc)] = torch.from_numpy(tp)
+    mask = torch.zeros((B, pol), dtype=torch.bool)
+    mask[torch.from_numpy(lr), torch.from_numpy(lc)] = True
+    return (torch.from_numpy(X).to(dev), Pt.to(dev), torch.from_numpy(Vt).to(dev), mask.to(dev))
+
+
 def save_params(path, net, feat, pol, val):
     # Layout must match include/sw/net.hpp: W row-major [out,in], then bias.
-    order = [net.l1, net.l2, net.p, net.v]
-    with open(path, "wb") as f:
-        f.write(struct.pack("<I", WN_MAGIC))
-        f.write(struct.pack("<5i", feat, H1, H2, pol, val))
-        for lin in order:
+    with open(path + ".tmp", "wb") as f:
+        write_header(f, (feat, pol, val), net.widths)
+        for lin in net.linears():
             f.write(np.ascontiguousarray(lin.weight.detach().cpu().numpy(), np.float32).tobytes())
             f.write(np.ascontiguousarray(lin.bias.detach().cpu().numpy(), np.float32).tobytes())
+    os.replace(path + ".tmp", path)
 
 
-def load_into(net, path, feat, pol, val):
-    order = [("l1", (H1, feat)), None, ("l2", (H2, H1)), None,
-             ("p", (pol, H2)), None, ("v", (val, H2)), None]
-    with open(path, "rb") as f:
-        assert struct.unpack("<I", f.read(4))[0] == WN_MAGIC
-        assert struct.unpack("<5i", f.read(20)) == (feat, H1, H2, pol, val)
-        for name, shape in [x for x in order if x]:
-            lin = getattr(net, name)
-            w = np.frombuffer(f.read(4 * int(np.prod(shape))), np.float32).reshape(shape).copy()
-            b = np.frombuffer(f.read(4 * shape[0]), np.float32).copy()
-            lin.weight.data = torch.from_numpy(w)
-            lin.bias.data = torch.from_numpy(b)
+def load_net(path, feat, pol, val):
+    """A Net holding a float32 weights file, in the hidden widths it records."""
+    p = load_params(path, feat, pol, val)
+    net = Net(feat, pol, val, hidden_of(p))
+    for lin, (w, b) in zip(net.linears(), layer_names(net.widths)):
+        lin.weight.data = torch.from_numpy(p[w].copy())
+        lin.bias.data = torch.from_numpy(p[b].copy())
+    return net
 
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("samples")
+    ap.add_argument("samples", nargs="+", help="sample files and/or manifests")
     ap.add_argument("--out", required=True)
     ap.add_argument("--init", default=None)
     ap.add_argument("--epochs", type=int, default=8)
     ap.add_argument("--batch", type=int, default=1024)
     ap.add_argument("--lr", type=float, default=1e-3)
     ap.add_argument("--vw", type=float, default=1.0)
+    ap.add_argument("--stream", action="store_true",
+                    help="stream minibatches from the mapped files instead of staging on device")
+    ap.add_argument("--chunk", type=int, default=0,
+                    help="rows per contiguous shuffle chunk (0 = global permutation)")
+    ap.add_argument("--prefetch", type=int, default=2)
+    ap.add_argument("--loader-threads", type=int, default=2)
+    ap.add_argument("--policy", choices=["masked", "dense"], default="masked",
+                    help="softmax over legal buckets (needs legal data) or all buckets")
+    ap.add_argument("--metrics", default=None, help="append per-epoch JSON records here")
+    ap.add_argument("--dedup", action="store_true",
+                    help="merge identical positions into one sample with averaged targets")
+    ap.add_argument("--recency", type=float, default=0.0,
+                    help="sampling weight half-life in files, newest first (0 = uniform)")
+    ap.add_argument("--priority", type=float, default=0.0,
+                    help="sample proportionally to last loss ** PRIORITY (0 = uniform)")
+    ap.add_argument("--stream-out", default=None,
+                    help="write the rows streamed through named pipes to this sample file")
+    ap.add_argument("--quantize", choices=["int8", "f16"], default=None,
+                    help="also export SWN2 weights in this dtype (see quantize.py)")
+    ap.add_argument("--hidden", default=None,
+                    help="hidden layer widths of a new net, comma-separated (default 128,128)")
+    ap.add_argument("--teacher", default=None, help="float32 weights to distil from")
+    ap.add_argument("--distill", type=float, default=1.0,
+                    help="weight of the teacher's targets (0..1) with --teacher")
+    ap.add_argument("--temperature", type=float, default=1.0,
+                    help="softmax temperature of the teacher's policy")
     a = ap.parse_args()
+    try:
+        hidden = parse_hidden(a.hidden) if a.hidden else None
+    except ValueError as e:
+        ap.error(str(e))
+    weighted = a.dedup or a.recency > 0 or a.priority > 0
+    if weighted and a.chunk > 0:
+        ap.error("--dedup/--recency/--priority need --chunk 0")
+    rec = Recorder(a.metrics)
     dev = "cuda" if torch.cuda.is_available() else "cpu"
 
-    Fa, Pa, Va, feat, pol, val = read_samples(a.samples)
-    print(f"samples: {Fa.shape[0]}  device={dev}")
-    net = Net(feat, pol, val).to(dev)
+    buf = ReplayBuffer.from_paths(a.samples)
+    if buf.streams and weighted:
+        ap.error("streamed samples need no --dedup/--recency/--priority")
+    last = buf.refresh()
+    feat, pol, val = buf.dims
+    masked = a.policy == "masked" and buf.has_legal
+    live = f", {len(buf.streams)} streaming" if buf.streams else ""
+    print(f"samples: {len(buf)} ({len(buf.shards)} files{live})  device={dev}  "
+          f"policy={'masked' if masked else 'dense'}")
     if a.init:
-        load_into(net, a.init, feat, pol, val)
-        net.to(dev)
+        net = load_net(a.init, feat, pol, val).to(dev)
+        if hidden and hidden != net.widths:
+            ap.error(f"--hidden {a.hidden} but {a.init} has {net.widths}")
+    else:
+        net = Net(feat, pol, val, hidden or HIDDEN).to(dev)
+    teacher = None
+    if a.teacher:
+        teacher = load_net(a.teacher, feat, pol, val).to(dev).eval()
+        print(f"distilling {a.teacher} ({teacher.widths}) into {net.widths}: "
+              f"alpha={a.distill} T={a.temperature}")
     opt = torch.optim.Adam(net.parameters(), lr=a.lr)
 
-    X = torch.from_numpy(Fa).to(dev)
-    Pt = torch.from_numpy(Pa).to(dev)
-    Vt = torch.from_numpy(Va).to(dev)
-    n = X.shape[0]
-    for ep in range(a.epochs):
-        perm = torch.randperm(n, device=dev)
+    src = buf
+    if weighted:
+        src = ReplayIndex(buf, dedup=a.dedup, recency=a.recency, priority=a.priority)
+        print(f"replay index: {len(src)} samples from {len(buf)} rows")
+    if a.stream or weighted or buf.streams:
+        loader = BatchLoader(src, a.batch, np.random.default_rng(0), chunk=a.chunk,
+                             prefetch=a.prefetch, threads=a.loader_threads, sparse=masked,
+                             indexed=weighted)
+
+        def batches():  # (X, Pt, Vt, legal mask or None, sample ids or None)
+            for item in loader.epoch():
+                idx, b = item if weighted else (None, item)
+                if masked:
+                    yield (*dense_batch(b, pol, dev), idx)
+                else:
+                    yield (*(torch.from_numpy(x).to(dev, non_blocking=True) for x in b), None,
+                           idx)
+    else:
+        X, Pt, Vt, M = to_device(buf, dev, masked)
+        n = X.shape[0]
+
+        def batches():
+            perm = torch.randperm(n, device=dev)
+            for s in range(0, n, a.batch):
+                bi = perm[s:s + a.batch]
+                yield X[bi], Pt[bi], Vt[bi], (M[bi] if masked else None), None
+
+    ep = seen = 0
+    while ep < a.epochs or not last:
+        if ep:
+            last = buf.refresh()
+        while not last and len(buf) == seen:  # streaming: wait for new games
+            time.sleep(0.1)
+            last = buf.refresh()
+        seen = len(buf)
         pl = vl = 0.0
-        nb = 0
-        for s in range(0, n, a.batch):
-            bi = perm[s:s + a.batch]
-            logits, vraw = net(X[bi])
-            ploss = -(Pt[bi] * F.log_softmax(logits, 1)).sum(1).mean()
-            vloss = F.binary_cross_entropy_with_logits(vraw, Vt[bi])
+        nb = ns = 0
+        t0 = time.perf_counter()
+        for Xb, Pb, Vb, Mb, idx in batches():
+            if teacher is not None:
+                with torch.no_grad():
+                    tl, tv = teacher(Xb)
+                    if Mb is not None:
+                        tl = tl.masked_fill(~Mb, -1e9)
+                    Pb = (1 - a.distill) * Pb + a.distill * F.softmax(tl / a.temperature, 1)
+                    Vb = (1 - a.distill) * Vb + a.distill * torch.sigmoid(tv)
+            logits, vraw = net(Xb)
+            if Mb is not None:  # illegal buckets drop out of the softmax
+                logits = logits.masked_fill(~Mb, -1e9)
+            prow = -(Pb * F.log_softmax(logits, 1)).sum(1)
+            ploss = prow.mean()
+            vloss = F.binary_cross_entropy_with_logits(vraw, Vb)
             loss = ploss + a.vw * vloss
+            if a.priority > 0:
+                with torch.no_grad():
+                    vrow = F.binary_cross_entropy_with_logits(vraw, Vb, reduction="none").mean(1)
+                    src.update(idx, (prow + a.vw * vrow).cpu().numpy())
             opt.zero_grad()
             loss.backward()
             opt.step()
-            pl += ploss.item(); vl += vloss.item(); nb += 1
-        print(f"  epoch {ep+1}/{a.epochs}  policy_ce={pl/nb:.4f}  value_bce={vl/nb:.4f}")
+            pl += ploss.item(); vl += vloss.item(); nb += 1; ns += Xb.shape[0]
+        dt = time.perf_counter() - t0
+        ep += 1
+        live = "" if last else f"  [{len(buf)} rows, streaming]"
+        print(f"  epoch {ep}/{a.epochs}  policy_ce={pl/nb:.4f}  value_bce={vl/nb:.4f}"
+              f"  ({nb / dt:.0f} steps/s, {ns / dt:,.0f} samples/s){live}")
+        rec.write(phase="epoch", trainer="torch", epoch=ep, policy_ce=round(pl / nb, 5),
+                  value_bce=round(vl / nb, 5), steps_per_s=round(nb / dt, 1),
+                  samples_per_s=round(ns / dt, 1))
 
+    for s in buf.streams:
+        if s.error:
+            print(f"  warning: {s.error}; kept its {s.n} rows from complete games")
+    if a.stream_out and buf.streams:
+        n = concat(buf.streams, a.stream_out)
+        print(f"wrote {n} streamed samples -> {a.stream_out}")
     save_params(a.out, net, feat, pol, val)
     print(f"wrote weights -> {a.out}")
+    if a.quantize:
+        from quantize import export  # quantize.py imports train.py
+        print(f"wrote {a.quantize} weights -> {export(a.out, a.quantize)[0]}")
 
 
 if __name__ == "__main__":
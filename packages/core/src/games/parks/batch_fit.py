@@ -0,0 +1,189 @@
+"""Batch L1 fits of the letter values: model sweep, leave-one-out and bootstrap.
+
+For every model variant (with/without intercept, free/non-negative letters)
+this fits the full card set, then every leave-one-card-out subset and
+--bootstrap resamples, and writes two tables:
+
+  <out>_letters.csv  per variant and letter: full-data value, bootstrap mean,
+                     std and percentile interval, and the leave-one-out range
+  <out>_cards.csv    per variant and card: residual on the full fit, the
+                     out-of-sample residual with the card left out, and its
+                     influence (largest / summed change of any letter value
+                     when it is dropped, and the L1 error it accounts for)
+
+Every refit is the full-data LP with different slack costs: a card enters the
+objective with its multiplicity in the resample (0 = left out), so each worker
+builds each variant's constraints once and a job only carries a card index or
+a replicate number. linprog's HiGHS methods take no starting basis, so fits
+are not warm-started; they are spread over a process pool instead.
+
+    python batch_fit.py [--csv cards.csv] [--bootstrap 500] [--workers N]
+                        [--variants l1,l1_nonneg,l1_intercept,l1_nonneg_intercept]
+                        [--ci 0.95] [--seed 0] [--out fits]
+"""
+
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.optimize import linprog
+
+from minimize import CSV_PATH, LETTERS, design, l1_lp, load_cards
+
+VARIANTS = {  # name -> (intercept, non-negative letters)
+    "l1": (False, False),
+    "l1_nonneg": (False, True),
+    "l1_intercept": (True, False),
+    "l1_nonneg_intercept": (True, True),
+}
+
+_LPS = {}
+
+
+def variant_lp(D, y, intercept, nonneg):
+    """The variant's design and LP (intercept column appended, always free)."""
+    if intercept:
+        D = np.hstack([D, np.ones((len(D), 1))])
+    letter = (0, None) if nonneg else (None, None)
+    bounds = [letter] * len(LETTERS) + [(None, None)] * (D.shape[1] - len(LETTERS))
+    return D, l1_lp(D, y, bounds)
+
+
+def _init(D, y, variants):
+    for name in variants:
+        _LPS[name] = variant_lp(D, y, *VARIANTS[name])
+
+
+def solve_weighted(lp, k, w):
+    """Fit with card i's |error| weighted by w[i]; returns (x, weighted L1)."""
+    c = lp["c"].copy()
+    c[k:] = w
+    res = linprog(**{**lp, "c": c}, method="highs")
+    if not res.success:
+        raise RuntimeError(f"LP failed: {res.message}")
+    return res.x[:k], res.fun
+
+
+def _job(args):
+    name, kind, i, seed = args
+    D, lp = _LPS[name]
+    N, k = D.shape
+    if kind == "loo":
+        w = np.ones(N)
+        w[i] = 0.0
+    elif kind == "boot":
+        w = np.bincount(np.random.default_rng([seed, i]).integers(0, N, N), minlength=N)
+    else:
+        w = np.ones(N)
+    x, fun = solve_weighted(lp, k, w.astype(float))
+    return name, kind, i, x, fun
+
+
+def run(D, y, variants, n_boot, workers, seed):
+    """{variant: {"full": (x, fun), "loo": [(x, fun)] * N, "boot": [x] * n_boot}}"""
+    N = len(y)
+    jobs = []
+    for name in variants:
+        jobs.append((name, "full", 0, seed))
+        jobs += [(name, "loo", i, seed) for i in range(N)]
+        jobs += [(name, "boot", b, seed) for b in range(n_boot)]
+    out = {name: {"full": None, "loo": [None] * N, "boot": [None] * n_boot}
+           for name in variants}
+    with ProcessPoolExecutor(workers, initializer=_init, initargs=(D, y, variants)) as ex:
+        chunk = max(1, len(jobs) // (4 * (workers or os.cpu_count())))
+        for name, kind, i, x, fun in ex.map(_job, jobs, chunksize=chunk):
+            if kind == "full":
+                out[name]["full"] = (x, fun)
+            elif kind == "loo":
+                out[name]["loo"][i] = (x, fun)
+            else:
+                out[name]["boot"][i] = x
+    return out
+
+
+def tables(cards, D, y, fits, ci):
+    letters, per_card = [], []
+    for name, f in fits.items():
+        intercept = VARIANTS[name][0]
+        Dv = np.hstack([D, np.ones((len(D), 1))]) if intercept else D
+        names = [l.upper() for l in LETTERS] + (["c0"] if intercept else [])
+        x, fun = f["full"]
+        loo_x = np.array([xi for xi, _ in f["loo"]])
+        loo_fun = np.array([fi for _, fi in f["loo"]])
+        boot = np.array(f["boot"]).reshape(-1, len(x))
+        q = [(1 - ci) / 2 * 100, (1 + ci) / 2 * 100]
+        lo, hi = np.percentile(boot, q, axis=0) if len(boot) else (np.full(len(x), np.nan),) * 2
+        for j, letter in enumerate(names):
+            letters.append({
+                "variant": name, "letter": letter, "value": x[j],
+                "boot_mean": boot[:, j].mean() if len(boot) else np.nan,
+                "boot_std": boot[:, j].std() if len(boot) else np.nan,
+                "ci_lo": lo[j], "ci_hi": hi[j],
+                "loo_min": loo_x[:, j].min(), "loo_max": loo_x[:, j].max(),
+            })
+        resid = y - Dv @ x
+        loo_resid = y - np.einsum("ij,ij->i", Dv, loo_x)
+        dx = np.abs(loo_x - x)
+        for i in range(len(cards)):
+            per_card.append({
+                "variant": name, "card": cards.names[i], "pt": y[i], "resid": resid[i],
+                "loo_resid": loo_resid[i], "influence_max": dx[i].max(),
+                "influence_sum": dx[i].sum(), "l1_drop": fun - loo_fun[i],
+                "cost": cards.cost[i], "neg": cards.neg[i],
+            })
+    return letters, per_card
+
+
+def write_csv(path, recs):
+    with open(path, "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=list(recs[0]))
+        w.writeheader()
+        for r in recs:
+            w.writerow({k: f"{v:.6g}" if isinstance(v, float) else v for k, v in r.items()})
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--csv", default=CSV_PATH)
+    ap.add_argument("--bootstrap", type=int, default=500, help="resamples per variant")
+    ap.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    ap.add_argument("--variants", default=",".join(VARIANTS))
+    ap.add_argument("--ci", type=float, default=0.95, help="bootstrap interval coverage")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="fits", help="prefix of the two result tables")
+    args = ap.parse_args()
+    variants = args.variants.split(",")
+    unknown = [v for v in variants if v not in VARIANTS]
+    if unknown:
+        ap.error(f"unknown variant(s) {', '.join(unknown)}; choose from {', '.join(VARIANTS)}")
+
+    cards = load_cards(args.csv)
+    D, y, _ = design(cards)
+    n_fits = len(variants) * (1 + len(cards) + args.bootstrap)
+    print(f"Loaded {len(cards)} cards; {n_fits} fits over {len(variants)} variant(s).")
+    t0 = time.perf_counter()
+    fits = run(D, y, variants, args.bootstrap, args.workers, args.seed)
+    dt = time.perf_counter() - t0
+    print(f"Solved in {dt:.1f}s ({n_fits / dt:.0f} fits/s).\n")
+
+    letters, per_card = tables(cards, D, y, fits, args.ci)
+    write_csv(f"{args.out}_letters.csv", letters)
+    write_csv(f"{args.out}_cards.csv", per_card)
+
+    for name in variants:
+        print(f"{name}: L1 = {fits[name]['full'][1]:.4f}")
+        print(f"  {'':4s} {'value':>9s} {f'{args.ci:.0%} bootstrap':>20s} {'LOO range':>20s}")
+        for r in (r for r in letters if r["variant"] == name):
+            print(f"  {r['letter']:4s} {r['value']:+9.4f} [{r['ci_lo']:+8.3f}, {r['ci_hi']:+8.3f}]"
+                  f" [{r['loo_min']:+8.3f}, {r['loo_max']:+8.3f}]")
+        top = sorted((c for c in per_card if c["variant"] == name),
+                     key=lambda c: -c["influence_max"])[:5]
+        print("  most influential cards: " + ", ".join(
+            f"{c['card']} ({c['influence_max']:.3f})" for c in top))
+    print(f"\nwrote {args.out}_letters.csv, {args.out}_cards.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Scaling benchmark for the L1 LP: sparse builder (l1_lp) vs the dense one.
+
+Synthetic card sets shaped like the CSV (2-5 cost letters, a quarter with a
+negative cost, integer PTs from hidden letter values plus a few outliers) of
+10^3..10^5 rows. For each size: time to build the constraints, their memory,
+HiGHS solve time, and the recovered letter values' error. The dense build is
+only attempted up to --dense-max rows (it needs 16 N^2 bytes).
+
+Once the build is sparse, the solve is what grows: the solvers' default
+"highs" (dual simplex here) goes roughly quadratic past 10^4 rows, while
+"highs-ipm" stays near linear, hence the --method default.
+
+    python bench_lp.py [--sizes 1000,10000,100000] [--dense-max 4000]
+                       [--method highs-ipm]
+"""
+
+import argparse
+import time
+import numpy as np
+from scipy.optimize import linprog
+
+from minimize import LETTERS, design, l1_lp, parse_letter_string, parse_negcost
+
+
+def synth_rows(n, rng, outliers=0.05):
+    true = np.array([1.0, 1.0, 1.0, 1.0, 1.5, 1.5, 2.0])[: len(LETTERS)]
+    rows = []
+    for i in range(n):
+        cost = "".join(rng.choice(LETTERS, rng.integers(2, 6)))
+        neg = "".join(rng.choice(LETTERS, rng.integers(1, 3))) if rng.random() < 0.25 else ""
+        a = parse_letter_string(cost) - parse_negcost(neg)
+        pt = float(np.round(a @ true))
+        if rng.random() < outliers:
+            pt += rng.choice([-2.0, -1.0, 1.0, 2.0])
+        rows.append((f"card{i}", pt, a, cost, neg))
+    return rows, true
+
+
+def dense_lp(D, y):
+    """The original construction: a dense (2N, k+N) A_ub filled row by row."""
+    N, k = D.shape
+    A_ub = np.zeros((2 * N, k + N))
+    b_ub = np.zeros(2 * N)
+    for i in range(N):
+        A_ub[2 * i, :k] = D[i]
+        A_ub[2 * i, k + i] = -1.0
+        b_ub[2 * i] = y[i]
+        A_ub[2 * i + 1, :k] = -D[i]
+        A_ub[2 * i + 1, k + i] = -1.0
+        b_ub[2 * i + 1] = -y[i]
+    c = np.concatenate([np.zeros(k), np.ones(N)])
+    return dict(c=c, A_ub=A_ub, b_ub=b_ub, bounds=[(None, None)] * k + [(0, None)] * N)
+
+
+def nbytes(A):
+    if isinstance(A, np.ndarray):
+        return A.nbytes
+    return A.data.nbytes + A.indices.nbytes + A.indptr.nbytes
+
+
+def run(name, build, D, y, true, method):
+    t0 = time.perf_counter()
+    lp = build(D, y)
+    t_build = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    res = linprog(**lp, method=method)
+    t_solve = time.perf_counter() - t0
+    err = np.abs(res.x[: len(true)] - true).max() if res.success else float("nan")
+    print(
+        f"  {len(y):7d} {name:6s} {t_build:9.3f} {nbytes(lp['A_ub']) / 2**20:10.1f} "
+        f"{t_solve:9.3f} {res.fun if res.success else float('nan'):12.2f} {err:9.2e}"
+    )
+    return res
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1000,10000,100000")
+    ap.add_argument("--dense-max", type=int, default=4000)
+    ap.add_argument("--method", default="highs-ipm", help="linprog method")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"  {'rows':>7s} {'build':6s} {'build_s':>9s} {'A_ub_MB':>10s} {'solve_s':>9s} "
+          f"{'L1':>12s} {'max|dx|':>9s}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        rows, true = synth_rows(n, rng)
+        D, y, _ = design(rows)
+        sparse = run("sparse", l1_lp, D, y, true, args.method)
+        if n <= args.dense_max:
+            dense = run("dense", dense_lp, D, y, true, args.method)
+            if sparse.success and dense.success:
+                assert abs(sparse.fun - dense.fun) <= 1e-6 * max(1.0, abs(dense.fun))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,50 @@
 """Diagnose whether the no-intercept model has a systematic bias."""
 
+import argparse
 import numpy as np
-from minimize import load_rows, solve_l1, LETTERS
+from minimize import CSV_PATH, load_cards, solve_l1, LETTERS
 
-rows = load_rows()
-res = solve_l1(rows, nonneg=False)
+ap = argparse.ArgumentParser()
+ap.add_argument("--csv", default=CSV_PATH, help="card sheet (default: $PARKS_CSV)")
+cards = load_cards(ap.parse_args().csv)
+res = solve_l1(cards, nonneg=False)
 vars_ = res.x[: len(LETTERS)]
 
 # Bucket residuals
-signed_resids = []
-for name, pt, a, cost_str, neg_str in rows:
-    pred = float(a @ vars_)
-    resid = pt - pred
-    has_neg = bool(neg_str.strip())
-    signed_resids.append((name, pt, pred, resid, has_neg, cost_str, neg_str))
+resid = cards.pt - cards.predict(vars_)
+with_neg = cards.has_neg
+no_neg = ~with_neg
 
-with_neg = [r for r in signed_resids if r[4]]
-no_neg = [r for r in signed_resids if not r[4]]
-
-def stats(group, label):
-    if not group:
+def stats(mask, label):
+    if not mask.any():
         return
-    rs = [r[3] for r in group]
+    rs = resid[mask]
     print(
-        f"{label:25s} n={len(group):3d}  "
-        f"mean_resid={np.mean(rs):+.3f}  "
+        f"{label:25s} n={len(rs):3d}  "
+        f"mean_resid={rs.mean():+.3f}  "
         f"median_resid={np.median(rs):+.3f}  "
-        f"sum_resid={sum(rs):+.3f}  "
-        f"mean|resid|={np.mean([abs(r) for r in rs]):.3f}"
+        f"sum_resid={rs.sum():+.3f}  "
+        f"mean|resid|={np.abs(rs).mean():.3f}"
     )
 
 print("Residual stats by card type:")
-stats(signed_resids, "ALL cards")
+stats(np.ones(len(cards), dtype=bool), "ALL cards")
 stats(with_neg, "Cards WITH neg-cost")
 stats(no_neg, "Cards without neg-cost")
 
 # Bucket by PT
 print("\nResidual stats by PT:")
-for pt_val in sorted(set(r[1] for r in signed_resids)):
-    group = [r for r in signed_resids if r[1] == pt_val]
-    stats(group, f"PT={pt_val:.0f}")
+for pt_val in np.unique(cards.pt):
+    stats(cards.pt == pt_val, f"PT={pt_val:.0f}")
 
 # Test a sign test: are positive residuals significantly more common in "with neg" group?
-n_pos_neg = sum(1 for r in with_neg if r[3] > 0)
-n_pos_no = sum(1 for r in no_neg if r[3] > 0)
+n_pos_neg = int((resid[with_neg] > 0).sum())
+n_pos_no = int((resid[no_neg] > 0).sum())
 print(
-    f"\nWith neg-cost: {n_pos_neg}/{len(with_neg)} positive residuals "
-    f"({100 * n_pos_neg / len(with_neg):.0f}%)"
+    f"\nWith neg-cost: {n_pos_neg}/{with_neg.sum()} positive residuals "
+    f"({100 * n_pos_neg / with_neg.sum():.0f}%)"
 )
 print(
-    f"Without neg-cost: {n_pos_no}/{len(no_neg)} positive residuals "
-    f"({100 * n_pos_no / len(no_neg):.0f}%)"
+    f"Without neg-cost: {n_pos_no}/{no_neg.sum()} positive residuals "
+    f"({100 * n_pos_no / no_neg.sum():.0f}%)"
 )
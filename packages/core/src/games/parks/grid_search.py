@@ -0,0 +1,232 @@
+"""Exhaustive grid search over the letter values, with LP bounds for pruning.
+
+Each letter takes values from a grid (e.g. 0..3 in steps of 1/2, or sixths)
+and every combination is a candidate pricing rule. Candidates are scored in
+blocks: the grid is split into a prefix (the first letters, enumerated one
+assignment at a time) and a suffix (the remaining letters, enumerated once
+into a matrix), so a whole block is one broadcast residual matrix
+pt - A_prefix @ prefix - A_suffix @ S^T of shape (cards, suffix size).
+
+Prefixes are walked depth first, children nearest the LP optimum first. At
+each node the LP relaxation with the chosen letters fixed and the others
+boxed to their grid range bounds every completion's L1 error from below;
+a subtree whose bound exceeds the current k-th best error is skipped.
+Subtrees are spread over a process pool that shares that threshold.
+
+    python grid_search.py --grid 0:3:1/2 [--letter c=0:2:1/6 ...] [--top 10]
+                          [--by l1|exact] [--workers N] [--no-prune] [--csv cards.csv]
+
+Results are ranked by L1 error (ties: more exact fits first), or with
+--by exact by exact-fit count (ties: lower L1; no pruning, since the LP
+bounds L1 only).
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+import numpy as np
+from scipy.optimize import OptimizeResult, linprog
+
+from minimize import CSV_PATH, LETTERS, CardSet, l1_lp, load_cards, solve_l1
+
+BOUND_SLACK = 1e-6  # LP solutions are accurate to ~1e-7; never prune on noise
+
+_S = {}
+
+
+def parse_range(spec):
+    """'lo:hi:step' (fractions allowed, e.g. 0:2:1/6) -> grid values, hi included."""
+    lo, hi, step = (Fraction(p) for p in spec.split(":"))
+    n = int((hi - lo) / step)
+    return np.array([float(lo + i * step) for i in range(n + 1)])
+
+
+def grid_values(grid, nonneg=False):
+    """One sorted array of values per letter, from one sequence for all letters,
+    a sequence per letter, or {letter: values} over a default of 0..3."""
+    if isinstance(grid, dict):
+        per = [grid.get(l, np.arange(4)) for l in LETTERS]
+    elif np.ndim(grid[0]) == 0:
+        per = [grid] * len(LETTERS)
+    else:
+        per = list(grid)
+    per = [np.unique(np.asarray(v, dtype=float)) for v in per]
+    if nonneg:
+        per = [v[v >= 0] for v in per]
+    if len(per) != len(LETTERS) or any(len(v) == 0 for v in per):
+        raise ValueError("need a non-empty grid for each of the 7 letters")
+    return per
+
+
+def split_depth(G, block):
+    """Number of prefix letters so the suffix block has at most `block` rows."""
+    p = len(G)
+    while p > 0 and int(np.prod([len(v) for v in G[p - 1:]])) <= block:
+        p -= 1
+    return p
+
+
+def _init(A, pt, G, p, x_lp, top_k, by, tol, prune, threshold):
+    suffix = np.array(np.meshgrid(*G[p:], indexing="ij")).reshape(len(G) - p, -1).T
+    _S.update(A=A, pt=pt, G=G, p=p, x_lp=x_lp, top_k=top_k, by=by, tol=tol,
+              prune=prune, threshold=threshold, suffix=suffix,
+              C=A[:, p:] @ suffix.T)
+
+
+def lp_bound(A, pt, G, prefix):
+    """Least L1 error of any assignment starting with `prefix`, the remaining
+    letters continuous within their grid range."""
+    d = len(prefix)
+    y = pt - A[:, :d] @ np.asarray(prefix, dtype=float)
+    if d == len(G):
+        return float(np.abs(y).sum())
+    res = linprog(**l1_lp(A[:, d:], y, [(v[0], v[-1]) for v in G[d:]]), method="highs")
+    return res.fun if res.success else np.inf
+
+
+def rank_keys(l1, exact, by_l1=True):
+    """Sort keys, most significant first. L1 is rounded so float noise does
+    not decide ties; those go to more exact fits (or, by exact, lower L1)."""
+    l1 = np.round(np.asarray(l1, dtype=float), 9)
+    exact = -np.asarray(exact)
+    return (l1, exact) if by_l1 else (exact, l1)
+
+
+def _ordered(d, G, x_lp):
+    return sorted(G[d], key=lambda v: abs(v - x_lp[d]))
+
+
+def _search(root):
+    """Depth-first search of the subtree under prefix `root`; returns
+    (top candidates [(l1, exact, x)], candidates scored, LPs solved, pruned)."""
+    S = _S
+    A, pt, G, p, top_k, tol = S["A"], S["pt"], S["G"], S["p"], S["top_k"], S["tol"]
+    by_l1 = S["by"] == "l1"
+    best = []  # (key, l1, exact, x)
+    stats = [0, 0, 0]
+
+    def threshold():
+        local = best[-1][1] if len(best) >= top_k else np.inf
+        if by_l1:
+            with S["threshold"].get_lock():
+                local = min(local, S["threshold"].value)
+                S["threshold"].value = local
+        return local
+
+    def leaf(prefix):
+        R = np.abs((pt - A[:, :p] @ np.asarray(prefix, dtype=float))[:, None] - S["C"])
+        l1 = R.sum(0)
+        stats[0] += len(l1)
+        if by_l1:
+            cand = np.flatnonzero(l1 <= threshold() + tol)
+            exact = (R[:, cand] < tol).sum(0)
+        else:
+            cand = np.arange(len(l1))
+            exact = (R < tol).sum(0)
+        keys = rank_keys(l1[cand], exact, by_l1)
+        for j in np.lexsort(keys[::-1])[:top_k]:
+            best.append((tuple(k[j] for k in keys), float(l1[cand[j]]), int(exact[j]),
+                         np.concatenate([prefix, S["suffix"][cand[j]]])))
+        best.sort(key=lambda r: r[0])
+        del best[top_k:]
+        threshold()
+
+    def visit(prefix):
+        if S["prune"] and by_l1 and len(prefix) < p:  # a leaf block is cheaper to score
+            stats[1] += 1
+            if lp_bound(A, pt, G, prefix) > threshold() + BOUND_SLACK:
+                stats[2] += 1
+                return
+        if len(prefix) == p:
+            leaf(prefix)
+            return
+        for v in _ordered(len(prefix), G, S["x_lp"]):
+            visit(prefix + [v])
+
+    visit(list(root))
+    return [(l1, e, x) for _, l1, e, x in best], *stats
+
+
+def grid_search(cards, grid, top_k=10, by="l1", nonneg=False, block=1 << 13, workers=None,
+                prune=True, tol=1e-9):
+    """Best `top_k` grid assignments: a dict with `top` [(l1, exact, x)], the
+    LP optimum `lp_l1` (a lower bound for every candidate) and search stats."""
+    cards = CardSet.from_rows(cards)
+    G = grid_values(grid, nonneg)
+    A, pt = cards.A, cards.pt
+    lp = solve_l1(cards, nonneg=nonneg)
+    x_lp = lp.x[: len(LETTERS)]
+    p = split_depth(G, block)
+    roots = [[]]
+    workers = workers or os.cpu_count()
+    while len(roots) < 4 * workers and roots and len(roots[0]) < p:  # enough subtrees to share
+        roots = [r + [v] for r in roots for v in _ordered(len(r), G, x_lp)]
+    threshold = mp.Value("d", np.inf)  # k-th best L1 so far, across all subtrees
+    args = (A, pt, G, p, x_lp, top_k, by, tol, prune, threshold)
+    if workers > 1:
+        with ProcessPoolExecutor(workers, initializer=_init, initargs=args) as ex:
+            parts = list(ex.map(_search, roots))
+    else:
+        _init(*args)
+        parts = [_search(r) for r in roots]
+    top = [c for part in parts for c in part[0]]
+    keys = rank_keys([c[0] for c in top], [c[1] for c in top], by == "l1")
+    top = [top[j] for j in np.lexsort(keys[::-1])]
+    size = int(np.prod([len(v) for v in G], dtype=np.float64))
+    return dict(
+        top=top[:top_k], lp_l1=lp.fun, grid_size=size, prefix_letters=p,
+        scored=sum(q[1] for q in parts), lps=sum(q[2] for q in parts),
+        pruned=sum(q[3] for q in parts),
+    )
+
+
+def grid_result(cards, grid, nonneg=False, top_k=10, **kw):
+    """grid_search as solve_l1's OptimizeResult: x = [letters, |residuals|]."""
+    cards = CardSet.from_rows(cards)
+    r = grid_search(cards, grid, top_k=top_k, nonneg=nonneg, **kw)
+    l1, _, x = r["top"][0]
+    resid = np.abs(cards.pt - cards.A @ x)
+    return OptimizeResult(x=np.concatenate([x, resid]), fun=l1, success=True, status=0,
+                          message=f"grid search over {r['grid_size']} assignments",
+                          nit=r["scored"], top=r["top"], lp_fun=r["lp_l1"])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--csv", default=CSV_PATH)
+    ap.add_argument("--grid", default="0:3:1/2", help="lo:hi:step for every letter")
+    ap.add_argument("--letter", action="append", default=[],
+                    help="per-letter override, e.g. c=0:2:1/6 (repeatable)")
+    ap.add_argument("--nonneg", action="store_true", help="drop negative grid values")
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--by", choices=["l1", "exact"], default="l1")
+    ap.add_argument("--block", type=int, default=1 << 13, help="candidates per scored block")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--no-prune", action="store_true", help="score every candidate")
+    args = ap.parse_args()
+
+    grid = {l: parse_range(args.grid) for l in LETTERS}
+    for spec in args.letter:
+        letter, rng = spec.split("=")
+        if letter.lower() not in LETTERS:
+            ap.error(f"unknown letter {letter!r}")
+        grid[letter.lower()] = parse_range(rng)
+    cards = load_cards(args.csv)
+    t0 = time.perf_counter()
+    r = grid_search(cards, grid, args.top, args.by, args.nonneg, args.block, args.workers,
+                    not args.no_prune)
+    dt = time.perf_counter() - t0
+    print(f"{len(cards)} cards, {r['grid_size']:,} grid assignments: scored {r['scored']:,} "
+          f"({r['scored'] / max(r['grid_size'], 1):.1%}) in {dt:.1f}s; "
+          f"{r['lps']} LP bounds, {r['pruned']} subtrees pruned")
+    print(f"LP relaxation L1 = {r['lp_l1']:.4f} (no grid assignment can beat it)\n")
+    print(f"  {'L1':>8s} {'exact':>5s}  " + " ".join(f"{l.upper():>6s}" for l in LETTERS))
+    for l1, exact, x in r["top"]:
+        print(f"  {l1:8.4f} {exact:5d}  " + " ".join(f"{v:6.3f}" for v in x))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,14 +8,26 @@ We minimize sum_i |PT_i - predicted_i| (L1 norm) via linear programming
 to surface true outliers without overfitting to them.
 """
 
+import argparse
 import csv
-import sys
+import hashlib
+import os
 import numpy as np
+import scipy.sparse as sp
 from scipy.optimize import linprog
 
 LETTERS = ["m", "f", "s", "w", "a", "c", "b"]
 LETTER_TO_IDX = {l: i for i, l in enumerate(LETTERS)}
-CSV_PATH = "/home/mantas/Documents/Personal/BoardGames/packages/core/src/games/parks/Untitled spreadsheet - Sheet1.csv"
+HERE = os.path.dirname(os.path.abspath(__file__))
+# The card CSV: $PARKS_CSV, else the sheet next to this file (scripts also take --csv).
+CSV_PATH = os.environ.get("PARKS_CSV", os.path.join(HERE, "Untitled spreadsheet - Sheet1.csv"))
+# Parsed-card caches: $PARKS_CACHE_DIR, else ~/.cache/parks.
+CACHE_DIR = os.environ.get("PARKS_CACHE_DIR",
+                           os.path.join(os.path.expanduser("~"), ".cache", "parks"))
+
+_LUT = np.full(256, -1, dtype=np.int64)
+for _i, _l in enumerate(LETTERS):
+    _LUT[ord(_l)] = _i
 
 
 def parse_letter_string(s):
@@ -36,57 +48,198 @@ def parse_negcost(s):
     return parse_letter_string(s)
 
 
-def load_rows():
-    rows = []
-    with open(CSV_PATH) as f:
-        for raw in f:
-            raw = raw.rstrip("\n")
-            if not raw.strip():
-                continue
-            rest = raw.split("\t", 1)[1] if "\t" in raw else raw
-            parts = next(csv.reader([rest]))
-            if len(parts) < 3:
-                continue
-            name = parts[0]
-            pt = float(parts[1])
-            cost_str = parts[2] if len(parts) > 2 else ""
-            neg_str = parts[3] if len(parts) > 3 else ""
-            a = parse_letter_string(cost_str) - parse_negcost(neg_str)
-            rows.append((name, pt, a, cost_str, neg_str))
-    return rows
-
-
-def solve_l1(rows, nonneg=False, integer_grid=None):
+def letter_counts(strings):
+    """(N, 7) letter counts of N strings at once (parse_letter_string per row)."""
+    n = len(strings)
+    lens = np.fromiter(map(len, strings), dtype=np.int64, count=n)
+    codes = np.frombuffer("".join(strings).encode("ascii", "replace"), dtype=np.uint8)
+    idx = _LUT[codes]
+    row = np.repeat(np.arange(n), lens)
+    keep = idx >= 0
+    flat = np.bincount(row[keep] * len(LETTERS) + idx[keep], minlength=n * len(LETTERS))
+    return flat.reshape(n, len(LETTERS)).astype(float)
+
+
+class CardSet:
+    """The cards as columns: A is the (N, 7) design matrix (cost letters minus
+    negative cost), pt the PTs, and names/cost/neg the raw strings."""
+
+    def __init__(self, names, pt, A, cost, neg):
+        self.names = np.asarray(names, dtype=object)
+        self.pt = np.asarray(pt, dtype=float)
+        self.A = np.asarray(A, dtype=float).reshape(len(self.pt), len(LETTERS))
+        self.cost = np.asarray(cost, dtype=object)
+        self.neg = np.asarray(neg, dtype=object)
+
+    def __len__(self):
+        return len(self.pt)
+
+    @property
+    def has_neg(self):
+        return np.array([bool(s.strip()) for s in self.neg], dtype=bool)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """From load_rows-style (name, pt, a, cost_str, neg_str) tuples."""
+        if isinstance(rows, cls):
+            return rows
+        names, pt, a, cost, neg = zip(*rows) if len(rows) else ((),) * 5
+        return cls(names, pt, np.array(a).reshape(len(rows), len(LETTERS)), cost, neg)
+
+    def rows(self):
+        return [(n, float(p), a, c, g)
+                for n, p, a, c, g in zip(self.names, self.pt, self.A, self.cost, self.neg)]
+
+    def predict(self, x):
+        return self.A @ np.asarray(x, dtype=float)
+
+
+def parse_csv(path):
+    names, pts, costs, negs = [], [], [], []
+    with open(path) as f:
+        rests = [raw.split("\t", 1)[1] if "\t" in raw else raw
+                 for raw in f.read().splitlines() if raw.strip()]
+    for parts in csv.reader(rests):
+        if len(parts) < 3:
+            continue
+        names.append(parts[0])
+        pts.append(float(parts[1]))
+        costs.append(parts[2])
+        negs.append(parts[3] if len(parts) > 3 else "")
+    A = letter_counts(costs)
+    stripped = [s.strip() for s in negs]
+    frac = np.array([s.startswith("(") for s in stripped], dtype=bool)
+    inner, div = [], np.ones(len(negs))
+    for i, s in enumerate(stripped):
+        if frac[i]:
+            letters, d = s[1:].split(")/")
+            inner.append(letters)
+            div[i] = float(d)
+        else:
+            inner.append(s)
+    A -= letter_counts(inner) / div[:, None]
+    return CardSet(names, pts, A, costs, negs)
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _read_cache(cache_path, path, st):
+    """(cards, fresh) from a cache file: cards is None unless the cache matches
+    the CSV by mtime+size (fresh) or, failing that, by SHA-256."""
+    try:
+        with np.load(cache_path) as z:
+            fresh = tuple(int(v) for v in z["meta"]) == (st.st_mtime_ns, st.st_size)
+            if not fresh and str(z["sha256"]) != _file_sha256(path):
+                return None, False
+            return CardSet(z["names"], z["pt"], z["A"], z["cost"], z["neg"]), fresh
+    except (OSError, KeyError, ValueError):
+        return None, False
+
+
+def load_cards(path=None, cache=True):
+    """The CardSet of a card CSV, through a parsed-card .npz cache.
+
+    The cache (one file per CSV path under CACHE_DIR) is used as is when the
+    CSV's mtime and size are unchanged. Otherwise the SHA-256 is compared, so a
+    touched but identical file is not re-parsed either.
+    """
+    path = os.path.abspath(path or CSV_PATH)
+    if not cache:
+        return parse_csv(path)
+    st = os.stat(path)
+    key = hashlib.sha256(path.encode()).hexdigest()[:16]
+    cache_path = os.path.join(CACHE_DIR, f"{os.path.basename(path)}.{key}.npz")
+    cards, fresh = _read_cache(cache_path, path, st)
+    if fresh:
+        return cards
+    if cards is None:
+        cards = parse_csv(path)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = cache_path + ".tmp.npz"
+    np.savez(tmp, meta=np.array([st.st_mtime_ns, st.st_size], dtype=np.int64),
+             sha256=np.array(_file_sha256(path)), names=cards.names.astype(str),
+             pt=cards.pt, A=cards.A, cost=cards.cost.astype(str), neg=cards.neg.astype(str))
+    os.replace(tmp, cache_path)
+    return cards
+
+
+def load_rows(path=None):
+    """The cards as (name, pt, a, cost_str, neg_str) tuples (see load_cards)."""
+    return load_cards(path).rows()
+
+
+def design(cards, intercept=False, extra=None):
+    """Design of the fit PT ~ D x: returns (D, y, names).
+
+    D holds each card's letter vector a_i, then a column of ones if
+    `intercept`, then one column per entry of `extra` ({name: length-N
+    array}) for additional regressors. y holds the PTs. `cards` is a CardSet
+    or a list of load_rows tuples.
+    """
+    cards = CardSet.from_rows(cards)
+    N = len(cards)
+    cols = [cards.A]
+    names = [l.upper() for l in LETTERS]
+    if intercept:
+        cols.append(np.ones((N, 1)))
+        names.append("c0")
+    for name, col in (extra or {}).items():
+        cols.append(np.asarray(col, dtype=float).reshape(N, 1))
+        names.append(name)
+    return np.hstack(cols), cards.pt.copy(), names
+
+
+def l1_lp(D, y, bounds=(None, None)):
+    """LP for min sum_i |y_i - D_i x|, as linprog keyword arguments.
+
+    Variables: [x_1, ..., x_k, u_1, ..., u_N], u_i >= 0.
+    Constraints: D_i x - u_i <= y_i and -D_i x - u_i <= -y_i (rows 2i, 2i+1).
+    A_ub is built as a scipy.sparse matrix: the slack block is two identity
+    matrices, so it has about 2 * (nnz(D) + N) entries instead of 2N(k + N).
+    `bounds` is one (lo, hi) for every x_j, or a list with one per column.
+    """
+    D = sp.csr_matrix(np.asarray(D, dtype=float))
+    N, k = D.shape
+    y = np.asarray(y, dtype=float)
+    neg_eye = -sp.identity(N, format="csr")
+    A_ub = sp.vstack([sp.hstack([D, neg_eye]), sp.hstack([-D, neg_eye])], format="csr")
+    A_ub = A_ub[np.arange(2 * N).reshape(2, N).T.ravel()]  # interleave +/- rows per card
+    x_bounds = [bounds] * k if isinstance(bounds, tuple) else list(bounds)
+    return dict(
+        c=np.concatenate([np.zeros(k), np.ones(N)]),
+        A_ub=A_ub,
+        b_ub=np.column_stack([y, -y]).ravel(),
+        bounds=x_bounds + [(0, None)] * N,
+    )
+
+
+def solve_l1(cards, nonneg=False, integer_grid=None):
     """Solve min sum |PT_i - a_i^T x| via LP.
 
     Variables: [M, F, S, W, A, C, B, u_1, ..., u_N], u_i >= 0.
     Constraints: a_i^T x - u_i <= PT_i and -a_i^T x - u_i <= -PT_i.
+
+    With `integer_grid` (values for every letter, or one sequence per letter;
+    see grid_search.py) the letters are restricted to the grid and searched
+    exhaustively; the result has the same layout, plus `top`, the best
+    assignments found.
     """
-    n_letters = len(LETTERS)
-    N = len(rows)
-    n_vars = n_letters + N
-
-    c = np.zeros(n_vars)
-    c[n_letters:] = 1.0
-
-    A_ub = np.zeros((2 * N, n_vars))
-    b_ub = np.zeros(2 * N)
-    for i, (_, pt, a, _, _) in enumerate(rows):
-        A_ub[2 * i, :n_letters] = a
-        A_ub[2 * i, n_letters + i] = -1.0
-        b_ub[2 * i] = pt
-        A_ub[2 * i + 1, :n_letters] = -a
-        A_ub[2 * i + 1, n_letters + i] = -1.0
-        b_ub[2 * i + 1] = -pt
+    if integer_grid is not None:
+        from grid_search import grid_result
 
+        return grid_result(cards, integer_grid, nonneg=nonneg)
+    D, y, _ = design(cards)
     letter_bound = (0, None) if nonneg else (None, None)
-    bounds = [letter_bound] * n_letters + [(0, None)] * N
+    return linprog(**l1_lp(D, y, letter_bound), method="highs")
 
-    result = linprog(c, A_ub=A_ub, b_ub=b_ub, bounds=bounds, method="highs")
-    return result
 
-
-def report(label, result, rows, top_k=20):
+def report(label, result, cards, top_k=20):
     print("=" * 80)
     print(label)
     print("=" * 80)
@@ -98,93 +251,73 @@ def report(label, result, rows, top_k=20):
     for letter, val in zip(LETTERS, vars_):
         print(f"  {letter.upper()} = {val:+.6f}")
     print(f"\nTotal |error| (L1) = {result.fun:.6f}")
-    print(f"Mean  |error|      = {result.fun / len(rows):.6f}")
-
-    preds = []
-    for name, pt, a, cost_str, neg_str in rows:
-        pred = float(a @ vars_)
-        preds.append((name, pt, pred, pt - pred, cost_str, neg_str))
+    cards = CardSet.from_rows(cards)
+    print(f"Mean  |error|      = {result.fun / len(cards):.6f}")
 
-    abs_err = [abs(r[3]) for r in preds]
+    pred = cards.predict(vars_)
+    resid = cards.pt - pred
+    abs_err = np.abs(resid)
     print(f"Median|error|     = {np.median(abs_err):.6f}")
-    print(f"Max   |error|     = {max(abs_err):.6f}")
-    n_zero = sum(1 for e in abs_err if e < 1e-6)
-    n_small = sum(1 for e in abs_err if e < 0.5)
-    print(f"Cards with |error| < 1e-6: {n_zero}/{len(rows)}")
-    print(f"Cards with |error| < 0.5 : {n_small}/{len(rows)}")
+    print(f"Max   |error|     = {abs_err.max():.6f}")
+    exact = abs_err < 1e-6
+    print(f"Cards with |error| < 1e-6: {exact.sum()}/{len(cards)}")
+    print(f"Cards with |error| < 0.5 : {(abs_err < 0.5).sum()}/{len(cards)}")
 
     print(f"\nTop {top_k} residuals (potential outliers):")
     print(f"  {'card':30s} {'PT':>4s} {'pred':>8s} {'resid':>8s}  cost / neg")
-    preds_sorted = sorted(preds, key=lambda r: abs(r[3]), reverse=True)
-    for name, pt, pred, resid, cost_str, neg_str in preds_sorted[:top_k]:
+    for i in np.argsort(-abs_err, kind="stable")[:top_k]:
         print(
-            f"  {name:30s} {pt:4.0f} {pred:8.3f} {resid:+8.3f}  {cost_str} / {neg_str}"
+            f"  {cards.names[i]:30s} {cards.pt[i]:4.0f} {pred[i]:8.3f} {resid[i]:+8.3f}  "
+            f"{cards.cost[i]} / {cards.neg[i]}"
         )
 
     print("\nCards that fit EXACTLY (residual ~ 0):")
     print(f"  {'card':30s} {'PT':>4s} {'pred':>8s}  cost / neg")
-    for name, pt, pred, resid, cost_str, neg_str in preds:
-        if abs(resid) < 1e-6:
-            print(f"  {name:30s} {pt:4.0f} {pred:8.3f}  {cost_str} / {neg_str}")
+    for i in np.flatnonzero(exact):
+        print(f"  {cards.names[i]:30s} {cards.pt[i]:4.0f} {pred[i]:8.3f}  "
+              f"{cards.cost[i]} / {cards.neg[i]}")
     return vars_
 
 
-def solve_l1_with_intercept(rows):
+def solve_l1_with_intercept(cards):
     """Same LP but adds an intercept term: PT = c0 + a^T x."""
-    n_letters = len(LETTERS) + 1  # +1 for intercept
-    N = len(rows)
-    n_vars = n_letters + N
-
-    c = np.zeros(n_vars)
-    c[n_letters:] = 1.0
-
-    A_ub = np.zeros((2 * N, n_vars))
-    b_ub = np.zeros(2 * N)
-    for i, (_, pt, a, _, _) in enumerate(rows):
-        A_ub[2 * i, : len(LETTERS)] = a
-        A_ub[2 * i, len(LETTERS)] = 1.0  # intercept
-        A_ub[2 * i, n_letters + i] = -1.0
-        b_ub[2 * i] = pt
-        A_ub[2 * i + 1, : len(LETTERS)] = -a
-        A_ub[2 * i + 1, len(LETTERS)] = -1.0  # intercept
-        A_ub[2 * i + 1, n_letters + i] = -1.0
-        b_ub[2 * i + 1] = -pt
-
-    bounds = [(None, None)] * n_letters + [(0, None)] * N
-    return linprog(c, A_ub=A_ub, b_ub=b_ub, bounds=bounds, method="highs")
-
-
-def evaluate_assignment(rows, assignment_dict):
+    D, y, _ = design(cards, intercept=True)
+    return linprog(**l1_lp(D, y), method="highs")
+
+
+def evaluate_assignment(cards, assignment_dict):
     """Try a hand-picked assignment and report errors."""
+    cards = CardSet.from_rows(cards)
     vars_ = np.array([assignment_dict[l] for l in LETTERS], dtype=float)
-    total = 0.0
-    worst = []
-    for name, pt, a, cost_str, neg_str in rows:
-        pred = float(a @ vars_)
-        err = abs(pt - pred)
-        total += err
-        worst.append((name, pt, pred, pt - pred, cost_str, neg_str))
-    worst.sort(key=lambda r: abs(r[3]), reverse=True)
-    return total, worst
+    pred = cards.predict(vars_)
+    resid = cards.pt - pred
+    worst = [(cards.names[i], float(cards.pt[i]), float(pred[i]), float(resid[i]),
+              cards.cost[i], cards.neg[i])
+             for i in np.argsort(-np.abs(resid), kind="stable")]
+    return float(np.abs(resid).sum()), worst
 
 
 def main():
-    rows = load_rows()
-    print(f"Loaded {len(rows)} cards from CSV.\n")
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--csv", default=CSV_PATH, help="card sheet (default: $PARKS_CSV)")
+    ap.add_argument("--no-cache", action="store_true", help="re-parse the CSV")
+    args = ap.parse_args()
+    cards = load_cards(args.csv, cache=not args.no_cache)
+    print(f"Loaded {len(cards)} cards from CSV.\n")
 
     # 1) Unconstrained L1 fit
-    res1 = solve_l1(rows, nonneg=False)
-    vars1 = report("UNCONSTRAINED L1 MINIMIZATION", res1, rows)
+    res1 = solve_l1(cards, nonneg=False)
+    vars1 = report("UNCONSTRAINED L1 MINIMIZATION", res1, cards)
 
     # 2) Non-negative L1 fit
-    res2 = solve_l1(rows, nonneg=True)
-    vars2 = report("\nNON-NEGATIVE L1 MINIMIZATION", res2, rows)
+    res2 = solve_l1(cards, nonneg=True)
+    vars2 = report("\nNON-NEGATIVE L1 MINIMIZATION", res2, cards)
 
     # 3) Add an intercept (in case there's a constant overhead per card)
     print("\n" + "=" * 80)
     print("L1 MINIMIZATION WITH INTERCEPT: PT = c0 + sum_letters")
     print("=" * 80)
-    res3 = solve_l1_with_intercept(rows)
+    res3 = solve_l1_with_intercept(cards)
     if res3.success:
         vars3 = res3.x[: len(LETTERS)]
         c0 = res3.x[len(LETTERS)]
@@ -193,7 +326,7 @@ def main():
             print(f"  {letter.upper()} = {val:+.6f}")
         print(f"  intercept c0 = {c0:+.6f}")
         print(f"Total |error| (L1) = {res3.fun:.6f}")
-        print(f"Mean  |error|      = {res3.fun / len(rows):.6f}")
+        print(f"Mean  |error|      = {res3.fun / len(cards):.6f}")
     else:
         print("FAILED:", res3.message)
 